@@ -0,0 +1,111 @@
+# scripts/benchmark_logging.py
+
+import argparse
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.utils.structured_logging import (
+    JsonFormatter, NonBlockingQueueHandler, RequestContextFilter, _request_context
+)
+
+
+class SlowSink(logging.Handler):
+    """Handler that formats, writes and then waits, like stdout behind a busy log driver."""
+    def __init__(self, path: Path, delay_ms: float):
+        super().__init__()
+        self.stream = open(path, "a")
+        self.delay_s = delay_ms / 1000
+
+    def emit(self, record: logging.LogRecord):
+        self.stream.write(self.format(record) + "\n")
+        self.stream.flush()
+        if self.delay_s:
+            time.sleep(self.delay_s)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Compare caller-side cost of synchronous and queued logging.")
+    parser.add_argument("--records", type=int, default=20000, help="Requests simulated per scenario")
+    parser.add_argument("--sink-delay-ms", type=float, default=0.05, help="Extra time the sink takes per record")
+    parser.add_argument("--sample-rate", type=float, default=0.1)
+    parser.add_argument("--output", type=Path, default=Path("/tmp/benchmark_logging.log"))
+    return parser.parse_args()
+
+
+def build_logger(mode: str, sink: logging.Handler, sample_rate: float):
+    logger = logging.getLogger(f"benchmark.{mode}")
+    logger.propagate = False
+    logger.handlers.clear()
+    logger.setLevel(logging.INFO)
+    listener = None
+    if mode == "sync":
+        logger.addHandler(sink)
+    else:
+        log_queue: queue.Queue = queue.Queue(maxsize=10000)
+        handler = NonBlockingQueueHandler(log_queue)
+        handler.addFilter(RequestContextFilter(sample_rate if mode == "queued+sampled" else 1.0))
+        logger.addHandler(handler)
+        listener = logging.handlers.QueueListener(log_queue, sink)
+        listener.start()
+    return logger, listener
+
+
+def run_scenario(logger: logging.Logger, records: int, error_storm: bool) -> np.ndarray:
+    """Log one access record per request (with a traceback during an error storm)."""
+    try:
+        raise RuntimeError("CUDA out of memory")
+    except RuntimeError:
+        exc_info = sys.exc_info()
+
+    timings = np.empty(records)
+    for i in range(records):
+        token = _request_context.set({"request_id": f"{i:032x}", "device": "cuda:0"})
+        start = time.perf_counter()
+        if error_storm:
+            logger.error("POST /run-model 500", exc_info=exc_info,
+                         extra={"status": 500, "duration_ms": 12.5})
+        else:
+            logger.info("POST /run-model 200", extra={"status": 200, "duration_ms": 3.2})
+        timings[i] = time.perf_counter() - start
+        _request_context.reset(token)
+    return timings
+
+
+def main():
+    """Main execution function."""
+    args = parse_args()
+    results = []
+    for mode in ("sync", "queued", "queued+sampled"):
+        for error_storm in (False, True):
+            sink = SlowSink(args.output, args.sink_delay_ms)
+            sink.setFormatter(JsonFormatter())
+            logger, listener = build_logger(mode, sink, args.sample_rate)
+
+            start = time.perf_counter()
+            timings = run_scenario(logger, args.records, error_storm)
+            elapsed = time.perf_counter() - start
+
+            dropped = next((h.dropped for h in logger.handlers if isinstance(h, NonBlockingQueueHandler)), 0)
+            if listener is not None:
+                listener.stop()
+            sink.stream.close()
+            results.append((mode, "errors" if error_storm else "ok", timings, elapsed, dropped))
+
+    # Print summary
+    print("\n=== Logging Cost In The Calling Thread ===")
+    print(f"{'mode':>15} {'load':>6} {'mean us':>9} {'p99 us':>9} {'max us':>9} {'req/s':>10} {'dropped':>8}")
+    for mode, load, timings, elapsed, dropped in results:
+        print(f"{mode:>15} {load:>6} {timings.mean() * 1e6:>9.1f} {np.percentile(timings, 99) * 1e6:>9.1f} "
+              f"{timings.max() * 1e6:>9.1f} {len(timings) / elapsed:>10.0f} {dropped:>8}")
+
+
+if __name__ == "__main__":
+    main()
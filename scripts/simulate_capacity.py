@@ -0,0 +1,109 @@
+# scripts/simulate_capacity.py
+
+import argparse
+import itertools
+import json
+import logging
+import sys
+import urllib.request
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from src.core.capacity import (
+    CapacitySimulator, ServingConfig, load_profiles, load_trace, profiles_from_prometheus,
+    save_profiles, synthetic_trace
+)
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+def int_list(value: str):
+    return [int(v) for v in value.split(",")]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Predict throughput and latency of a serving configuration.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--metrics-url", help="Capture profiles from a live metrics endpoint, e.g. http://localhost:8001/metrics")
+    source.add_argument("--profiles", type=Path, help="Profiles JSON saved with --save-profiles")
+    parser.add_argument("--save-profiles", type=Path, help="Write the captured profiles for offline runs")
+
+    parser.add_argument("--trace", type=Path, help="Recorded trace (JSON lines with timestamp, model)")
+    parser.add_argument("--rate", type=float, default=50.0, help="Synthetic arrival rate (requests/s)")
+    parser.add_argument("--duration", type=float, default=300.0, help="Synthetic trace length (s)")
+    parser.add_argument("--burstiness", type=float, default=1.0, help="Inter-arrival coefficient of variation")
+    parser.add_argument("--mix", type=json.loads, help='Model mix as JSON, e.g. \'{"llm": 0.2, "embedder": 0.8}\'')
+
+    # Comma-separated values are swept as a grid
+    parser.add_argument("--workers", type=int_list, default=[4])
+    parser.add_argument("--devices", type=int_list, default=[1])
+    parser.add_argument("--max-batch-size", type=int_list, default=[32])
+    parser.add_argument("--max-concurrent", type=int_list, default=[4])
+    parser.add_argument("--max-wait-ms", type=float, default=2.0)
+    parser.add_argument("--max-in-flight", type=int, default=1,
+                        help="Batches running at once per model and worker (BatcherPool.configure)")
+    parser.add_argument("--batch-scaling", type=float, default=0.3,
+                        help="Batch of b takes b**scaling times one sample (0: free batching, 1: none)")
+    parser.add_argument("--deadline-s", type=float, help="Drop requests waiting longer than this for a slot")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", type=Path, help="Write results as JSON")
+    return parser.parse_args()
+
+
+def main():
+    """Main execution function."""
+    args = parse_args()
+
+    if args.metrics_url:
+        with urllib.request.urlopen(args.metrics_url, timeout=10) as response:
+            profiles = profiles_from_prometheus(response.read().decode())
+        if args.save_profiles:
+            save_profiles(profiles, args.save_profiles)
+            logger.info(f"Saved profiles to {args.save_profiles}")
+    else:
+        profiles = load_profiles(args.profiles)
+    if not profiles:
+        raise SystemExit("No ai_inference_seconds observations found")
+
+    for model, profile in profiles.items():
+        logger.info(f"Profile '{model}': {int(profile.count)} samples, mean {profile.mean() * 1000:.2f}ms")
+
+    if args.trace:
+        trace = load_trace(args.trace)
+    else:
+        mix = args.mix or {model: profile.count for model, profile in profiles.items()}
+        trace = synthetic_trace(args.rate, args.duration, mix, args.burstiness, args.seed)
+
+    results = []
+    grid = itertools.product(args.workers, args.devices, args.max_batch_size, args.max_concurrent)
+    for workers, devices, max_batch_size, max_concurrent in grid:
+        config = ServingConfig(workers=workers, devices=devices, max_batch_size=max_batch_size,
+                               max_wait_ms=args.max_wait_ms, max_concurrent=max_concurrent,
+                               max_in_flight=args.max_in_flight, batch_scaling=args.batch_scaling,
+                               deadline_s=args.deadline_s)
+        results.append(CapacitySimulator(profiles, config, seed=args.seed).run(trace))
+
+    # Print summary
+    print("\n=== Capacity Simulation ===")
+    print(f"{'workers':>7} {'devices':>7} {'batch':>5} {'conc':>4} {'rps':>9} {'util':>6} "
+          f"{'mean q ms':>10} {'p99 ms':>9} {'dropped':>7}")
+    for r in results:
+        c = r["config"]
+        print(f"{c['workers']:>7} {c['devices']:>7} {c['max_batch_size']:>5} {c['max_concurrent']:>4} "
+              f"{r['throughput_rps']:>9.1f} {r['device_utilization']:>6.1%} "
+              f"{r['queue_delay_ms']['mean']:>10.2f} {r['latency_ms']['p99']:>9.2f} {r['dropped']:>7}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        logger.info(f"Results saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
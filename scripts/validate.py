@@ -1,7 +1,10 @@
 # Location: E:/justica/scripts/validate.py
 
+import argparse
 import os
 import sys
+import threading
+import time
 import torch
 import cv2
 import numpy as np
@@ -13,6 +16,7 @@ import json
 import redis
 from pathlib import Path
 from datetime import datetime
+from typing import Dict, List, Optional
 from dotenv import load_dotenv
 
 # Configure logging
@@ -22,34 +26,89 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# name: (method, timeout in seconds, cache lifetime in seconds or None, part of the readiness subset)
+CHECKS = {
+    "environment": ("validate_environment", 1.0, None, True),
+    "gpu": ("validate_gpu", 60.0, 24 * 3600, True),
+    "services": ("validate_services", 10.0, None, False),
+    "directories": ("validate_directories", 2.0, 3600, True),
+    "redis": ("validate_redis", 5.0, None, True),
+    "resources": ("validate_system_resources", 5.0, None, False)
+}
+# Checks a readiness run always performs live: a cached GPU pass vouches for the benchmark,
+# not that the device is still present and healthy now
+READINESS_UNCACHED = {"gpu"}
+CACHE_FILE = Path("docs/validation/cache.json")
+
 class UnifiedValidator:
     """
     Unified system validator that combines GPU, services, config, and directory validation.
+
+    Checks are independent, so they run concurrently, each in its own daemon thread
+    with its own timeout; a check that hangs (a Docker or Redis probe) is reported as
+    timed out and cannot hold up the rest or the process exit. Every result records
+    its duration. Passed results of checks that rarely change (GPU, directories) are
+    cached in ``docs/validation/cache.json`` and reused until their lifetime expires.
+    The readiness subset skips the Docker and resource checks and the GPU benchmark,
+    for container start-up and deploy gates; it always probes the GPU live.
     """
-    def __init__(self):
+    def __init__(self, readiness: bool = False, use_cache: bool = True,
+                 timeout_scale: float = 1.0):
         self.results = {
             "timestamp": datetime.now().isoformat(),
             "status": "initializing",
+            "mode": "readiness" if readiness else "full",
             "tests": {}
         }
-        self.docker_client = docker.from_env()
+        self.readiness = readiness
+        self.use_cache = use_cache
+        self.timeout_scale = timeout_scale
         
         # Load environment variables
         load_dotenv()
 
-    def validate_all(self):
-        """Run all validation checks."""
+    def validate_all(self, checks: Optional[List[str]] = None):
+        """
+        Run the selected checks concurrently.
+
+        Args:
+            checks: Check names; the readiness subset or all checks when omitted
+        """
+        start = time.perf_counter()
         try:
-            self.validate_environment()
-            self.validate_gpu()
-            self.validate_services()
-            self.validate_directories()
-            self.validate_redis()
-            self.validate_system_resources()
+            if checks is None:
+                checks = [name for name, (_, _, _, ready) in CHECKS.items() if ready or not self.readiness]
+            unknown = set(checks) - set(CHECKS)
+            if unknown:
+                raise ValueError(f"Unknown checks: {sorted(unknown)}")
+
+            cache = self._load_cache() if self.use_cache else {}
+            pending = {}
+            for name in checks:
+                cached = cache.get(name)
+                if cached is not None:
+                    self.results["tests"][name] = {**cached["result"], "cached": True,
+                                                   "cached_at": cached["cached_at"]}
+                else:
+                    pending[name] = self._start_check(name)
+
+            for name, (thread, slot, check_start, timeout) in pending.items():
+                thread.join(max(0.0, check_start + timeout - time.perf_counter()))
+                if thread.is_alive():
+                    logger.error(f"Check '{name}' timed out after {timeout:.1f}s")
+                    result = {"status": "failed", "error": f"Timed out after {timeout:.1f}s"}
+                else:
+                    result = slot["result"]
+                result["duration_ms"] = round((slot.get("end", time.perf_counter()) - check_start) * 1000, 1)
+                self.results["tests"][name] = result
+
+            if self.use_cache:
+                self._update_cache(cache, pending)
             
             # Set overall status
             all_passed = all(test["status"] == "passed" for test in self.results["tests"].values())
             self.results["status"] = "passed" if all_passed else "failed"
+            self.results["duration_ms"] = round((time.perf_counter() - start) * 1000, 1)
             
             # Save results
             self.save_results()
@@ -59,7 +118,58 @@ class UnifiedValidator:
             self.results["status"] = "error"
             self.results["error"] = str(e)
 
-    def validate_environment(self):
+    def _start_check(self, name: str):
+        method, timeout, _, _ = CHECKS[name]
+        timeout *= self.timeout_scale
+        slot: Dict = {}
+
+        def run():
+            try:
+                slot["result"] = getattr(self, method)(timeout)
+            except Exception as e:
+                logger.error(f"Check '{name}' failed: {str(e)}")
+                slot["result"] = {"status": "failed", "error": str(e)}
+            slot["end"] = time.perf_counter()
+
+        # Daemon threads: a probe stuck past its timeout is abandoned, not joined at exit
+        thread = threading.Thread(target=run, name=f"validate-{name}", daemon=True)
+        check_start = time.perf_counter()
+        thread.start()
+        return thread, slot, check_start, timeout
+
+    def _load_cache(self) -> Dict:
+        """Cached results that are still within their check's lifetime."""
+        if not CACHE_FILE.exists():
+            return {}
+        try:
+            with open(CACHE_FILE) as f:
+                cache = json.load(f)
+        except ValueError:
+            return {}
+        now = time.time()
+        return {
+            name: entry for name, entry in cache.items()
+            if name in CHECKS and CHECKS[name][2] is not None
+            and now - entry["cached_at"] < CHECKS[name][2]
+            # A full run must not reuse a readiness result, which skipped part of the check
+            and (self.readiness or entry.get("mode") == "full")
+            and not (self.readiness and name in READINESS_UNCACHED)
+        }
+
+    def _update_cache(self, cache: Dict, ran: Dict):
+        updated = dict(cache)
+        for name in ran:
+            result = self.results["tests"][name]
+            if self.readiness and name in READINESS_UNCACHED:
+                continue
+            if CHECKS[name][2] is not None and result["status"] == "passed":
+                updated[name] = {"result": result, "cached_at": time.time(), "mode": self.results["mode"]}
+        if updated != cache:
+            CACHE_FILE.parent.mkdir(parents=True, exist_ok=True)
+            with open(CACHE_FILE, 'w') as f:
+                json.dump(updated, f, indent=2)
+
+    def validate_environment(self, timeout: float) -> Dict:
         """Validate environment variables."""
         required_vars = [
             'CLOUDFLARE_TOKEN',
@@ -74,13 +184,13 @@ class UnifiedValidator:
             if not os.getenv(var):
                 missing.append(var)
         
-        self.results["tests"]["environment"] = {
+        return {
             "status": "passed" if not missing else "failed",
             "missing_variables": missing
         }
 
-    def validate_gpu(self):
-        """Validate GPU configuration and performance."""
+    def validate_gpu(self, timeout: float) -> Dict:
+        """Validate GPU configuration and performance (the benchmark is skipped for readiness)."""
         try:
             gpu_info = {
                 "pytorch_version": torch.__version__,
@@ -99,6 +209,7 @@ class UnifiedValidator:
                     }
                 })
 
+            if torch.cuda.is_available() and not self.readiness:
                 # Performance test
                 size = 10000
                 x = torch.randn(size, size, device='cuda')
@@ -115,18 +226,18 @@ class UnifiedValidator:
                     "computation_time": f"{start_time.elapsed_time(end_time):.2f}ms"
                 }
 
-            self.results["tests"]["gpu"] = {
+            return {
                 "status": "passed",
                 "info": gpu_info
             }
         except Exception as e:
             logger.error(f"GPU validation failed: {str(e)}")
-            self.results["tests"]["gpu"] = {
+            return {
                 "status": "failed",
                 "error": str(e)
             }
 
-    def validate_services(self):
+    def validate_services(self, timeout: float) -> Dict:
         """Validate Docker services."""
         try:
             required_services = {
@@ -137,7 +248,8 @@ class UnifiedValidator:
                 'justica_nginx': 80
             }
             
-            containers = self.docker_client.containers.list()
+            docker_client = docker.from_env(timeout=max(1, int(timeout)))
+            containers = docker_client.containers.list()
             running_containers = {c.name: c for c in containers}
             
             service_status = {}
@@ -154,18 +266,18 @@ class UnifiedValidator:
                         "port": port
                     }
             
-            self.results["tests"]["services"] = {
+            return {
                 "status": "passed" if all(s["status"] == "running" for s in service_status.values()) else "failed",
                 "services": service_status
             }
         except Exception as e:
             logger.error(f"Service validation failed: {str(e)}")
-            self.results["tests"]["services"] = {
+            return {
                 "status": "failed",
                 "error": str(e)
             }
 
-    def validate_directories(self):
+    def validate_directories(self, timeout: float) -> Dict:
         """Validate project directory structure."""
         required_dirs = [
             "config/monitoring/grafana",
@@ -187,23 +299,25 @@ class UnifiedValidator:
             if not full_path.exists():
                 missing_dirs.append(dir_path)
                 
-        self.results["tests"]["directories"] = {
+        return {
             "status": "passed" if not missing_dirs else "failed",
             "missing_directories": missing_dirs
         }
 
-    def validate_redis(self):
+    def validate_redis(self, timeout: float) -> Dict:
         """Validate Redis connection."""
         try:
             r = redis.Redis(
                 host='localhost',
                 port=int(os.getenv('REDIS_PORT', 6379)),
                 password=os.getenv('REDIS_PASSWORD'),
-                ssl=os.getenv('REDIS_TLS_ENABLED', 'true').lower() == 'true'
+                ssl=os.getenv('REDIS_TLS_ENABLED', 'true').lower() == 'true',
+                socket_connect_timeout=timeout,
+                socket_timeout=timeout
             )
             r.ping()
             
-            self.results["tests"]["redis"] = {
+            return {
                 "status": "passed",
                 "info": {
                     "connected": True,
@@ -212,12 +326,12 @@ class UnifiedValidator:
             }
         except Exception as e:
             logger.error(f"Redis validation failed: {str(e)}")
-            self.results["tests"]["redis"] = {
+            return {
                 "status": "failed",
                 "error": str(e)
             }
 
-    def validate_system_resources(self):
+    def validate_system_resources(self, timeout: float) -> Dict:
         """Validate system resources."""
         try:
             memory = psutil.virtual_memory()
@@ -241,13 +355,13 @@ class UnifiedValidator:
                 }
             }
             
-            self.results["tests"]["resources"] = {
+            return {
                 "status": "passed",
                 "info": resources
             }
         except Exception as e:
             logger.error(f"Resource validation failed: {str(e)}")
-            self.results["tests"]["resources"] = {
+            return {
                 "status": "failed",
                 "error": str(e)
             }
@@ -264,18 +378,33 @@ class UnifiedValidator:
             
         logger.info(f"Validation results saved to: {output_file}")
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Validate the AI server environment.")
+    parser.add_argument("--readiness", action="store_true",
+                        help="Fast subset for container start-up and deploy gates")
+    parser.add_argument("--checks", help=f"Comma-separated checks to run ({', '.join(CHECKS)})")
+    parser.add_argument("--no-cache", action="store_true", help="Re-run checks even if a cached result is valid")
+    parser.add_argument("--timeout-scale", type=float, default=1.0, help="Multiply every check's timeout")
+    return parser.parse_args()
+
 def main():
     """Main execution function."""
-    validator = UnifiedValidator()
-    validator.validate_all()
+    args = parse_args()
+    validator = UnifiedValidator(readiness=args.readiness, use_cache=not args.no_cache,
+                                 timeout_scale=args.timeout_scale)
+    validator.validate_all(args.checks.split(",") if args.checks else None)
     
     # Print summary
     print("\n=== Validation Summary ===")
-    print(f"Status: {validator.results['status']}")
+    print(f"Status: {validator.results['status']} ({validator.results.get('duration_ms', 0):.0f}ms)")
     for test_name, test_results in validator.results["tests"].items():
-        print(f"\n{test_name.upper()}: {test_results['status']}")
+        timing = "cached" if test_results.get("cached") else f"{test_results.get('duration_ms', 0):.0f}ms"
+        print(f"\n{test_name.upper()}: {test_results['status']} ({timing})")
         if test_results["status"] == "failed" and "error" in test_results:
             print(f"Error: {test_results['error']}")
 
+    # Non-zero exit status fails deploy gates and container health checks
+    sys.exit(0 if validator.results["status"] == "passed" else 1)
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
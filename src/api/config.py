@@ -1,7 +1,7 @@
 # src/api/config.py
 
 from pydantic import BaseSettings, SecretStr, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 import os
 from pathlib import Path
 
@@ -23,11 +23,82 @@ class Settings(BaseSettings):
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     WORKERS: int = 4
+    SHUTDOWN_GRACE_PERIOD_S: float = 30.0  # Also bounds draining an old model version on swap
     
     # GPU Settings
     GPU_MEMORY_FRACTION: float = 0.9
     MIN_MEMORY_AVAILABLE: int = 4000  # Minimum 4GB required
     MAX_BATCH_SIZE: int = 32
+    BATCH_MAX_WAIT_MS: float = 2.0
+    STREAMS_PER_DEVICE: int = 4  # CUDA streams independent models and image jobs overlap on
+    
+    # Shape Bucketing Settings (pad inputs to static shapes for compiled graphs / CUDA graph replay)
+    SHAPE_BUCKETING_ENABLED: bool = False
+    SHAPE_BUCKET_MODE: str = "compile"  # eager, compile or cuda_graph
+    SHAPE_BUCKET_BATCH_SIZES: List[int] = [1, 2, 4, 8, 16, 32]
+    SHAPE_BUCKET_DIM_SIZES: List[int] = [8, 16, 32, 64, 128, 256, 512, 1024, 2048]  # For the dims a model declares in dynamic_dims
+    
+    # Autotuning Settings (results persist under MODEL_CACHE_PATH/tuning per model hash and device)
+    AUTOTUNE_ON_STARTUP: bool = False
+    AUTOTUNE_SLO_MS: float = 100.0
+    AUTOTUNE_BATCH_SIZES: List[int] = [1, 2, 4, 8, 16, 32, 64, 128]
+    AUTOTUNE_CONCURRENCY: List[int] = [1, 2, 4, 8]
+    AUTOTUNE_INPUT_SHAPES: Dict[str, List[int]] = {}  # model -> shape of one input item
+    
+    # Scheduling Settings (X-Priority / X-Deadline-Ms request headers override defaults)
+    SCHEDULER_MAX_CONCURRENT: int = 4
+    SCHEDULER_INTERACTIVE_DEADLINE_MS: int = 2000
+    SCHEDULER_BULK_DEADLINE_MS: int = 55000  # Below nginx's 60s proxy_read_timeout
+    SCHEDULER_PROBE_INTERVAL_S: float = 5.0  # One job per interval runs despite a pessimistic estimate
+    
+    # Model Settings
+    MODEL_BUILDERS: Dict[str, str] = {}  # name -> "package.module:builder"
+    PIPELINE_MODELS: Dict[str, List[str]] = {}  # name -> stage devices, e.g. ["cuda:0", "cuda:1"]
+    PIPELINE_MICRO_BATCHES: int = 4
+    
+    # Retrieval (RAG) Settings
+    EMBEDDING_MODEL: str = "embedder"
+    EMBEDDING_DIM: int = 384
+    EMBEDDING_MAX_LENGTH: int = 512
+    VECTOR_INDEX_NPROBE: int = 8
+    
+    # Vision Settings (batched decode/letterbox into one NCHW tensor for /vision/infer)
+    VISION_INPUT_SIZE: List[int] = [224, 224]  # Height, width
+    VISION_DTYPE: str = "float16"  # float16, float32 or uint8 (unnormalized)
+    VISION_MEAN: List[float] = [123.675, 116.28, 103.53]  # RGB, 0-255 scale
+    VISION_STD: List[float] = [58.395, 57.12, 57.375]
+    VISION_MAX_IMAGES: int = 32
+    VISION_DECODE_WORKERS: int = 4
+    
+    # Audio Settings (video-translation workload)
+    AUDIO_MODEL: str = "asr"
+    AUDIO_SAMPLE_RATE: int = 16000
+    AUDIO_WINDOW_S: float = 30.0
+    AUDIO_OVERLAP_S: float = 2.0
+    AUDIO_MAX_IN_FLIGHT: int = 8
+    
+    # Generation Settings (continuous batching with a paged KV cache)
+    GENERATION_KV_CACHE_MB: int = 4096
+    GENERATION_BLOCK_SIZE: int = 16
+    GENERATION_MAX_SEQS: int = 64
+    GENERATION_MAX_STEP_TOKENS: int = 4096
+    GENERATION_EOS_TOKEN_ID: Optional[int] = None
+    
+    # Model Host Settings (one process owns models/devices, workers submit over shared memory)
+    MODEL_HOST_ENABLED: bool = False
+    MODEL_HOST_SHM_NAME: str = "ai_model_host"
+    MODEL_HOST_SLOTS: int = 64
+    MODEL_HOST_SLOT_MB: int = 16
+    
+    # Cluster Settings (nodes publish heartbeats to Redis, the router dispatches on them)
+    CLUSTER_ENABLED: bool = False
+    NODE_ID: str = os.getenv("HOSTNAME", "localhost")
+    NODE_URL: str = "http://justica_ai_server:8000"
+    HEARTBEAT_INTERVAL_S: float = 1.0
+    HEARTBEAT_TTL_S: float = 5.0
+    ROUTER_PORT: int = 8080
+    ROUTER_MAX_RETRIES: int = 2
+    ROUTER_TIMEOUT_S: float = 60.0
     
     # Redis Settings
     REDIS_HOST: str = "localhost"
@@ -40,9 +111,29 @@ class Settings(BaseSettings):
     AI_DATA_PATH: Path = Field(..., env='AI_DATA_PATH')
     MODEL_CACHE_PATH: Path = Field(..., env='MODEL_CACHE_PATH')
     
+    # Result Store Settings (large outputs are written to AI_DATA_PATH/results and returned as handles)
+    RESULT_INLINE_MAX_BYTES: int = 256 * 1024  # Larger outputs are offloaded
+    RESULT_TTL_S: float = 3600.0
+    RESULT_QUOTA_GB: float = 10.0
+    RESULT_EVICT_INTERVAL_S: float = 60.0
+    RESULT_ACCEL_REDIRECT_PREFIX: Optional[str] = None  # e.g. "/internal-results/" to let nginx send files
+    
+    # Logging Settings (JSON lines written by a background thread)
+    LOG_LEVEL: str = "INFO"
+    LOG_JSON: bool = True
+    LOG_SAMPLE_RATE: float = 0.1  # Fraction of successful requests logged; errors are always kept
+    LOG_QUEUE_SIZE: int = 10000
+    
     # Monitoring Settings
     PROMETHEUS_PORT: int = 9090
     GRAFANA_PORT: int = 3000
+    METRICS_PORT: int = 8001
+    METRICS_LATENCY_BUCKETS: List[float] = [.005, .01, .025, .05, .075, .1, .15, .25, .5, .75, 1.0, 2.5, 5.0]
+    METRICS_HISTORY_MAX_SERIES: int = 128
+    METRICS_HISTORY_RESOLUTIONS: List[List[int]] = [[1, 3600], [10, 2160], [60, 1440]]  # [seconds, slots]
+    PROFILE_SAMPLE_INTERVAL_MS: float = 5.0
+    PROFILE_MAX_DURATION_S: int = 300
+    METRICS_BATCH_BUCKETS: List[float] = [.01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0]
     
     class Config:
         env_file = '.env'
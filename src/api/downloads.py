@@ -0,0 +1,104 @@
+# src/api/downloads.py
+
+import os
+import re
+from pathlib import Path
+from typing import Optional, Tuple
+
+import anyio
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+
+CHUNK_SIZE = 1 << 20
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    Inclusive ``(start, end)`` of a single-range ``Range`` header.
+
+    Returns None when the whole file should be sent (no header, several ranges or an
+    unknown unit, which RFC 9110 allows a server to ignore).
+
+    Raises:
+        ValueError: If the range cannot be satisfied
+    """
+    if not header:
+        return None
+    match = _RANGE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - length, 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size or start > end:
+        raise ValueError(f"Range {header} not satisfiable for {size} bytes")
+    return start, end
+
+
+async def _read_range(path: Path, start: int, end: int):
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def file_response(request: Request, path: Path, media_type: str, etag: str,
+                  filename: Optional[str] = None, accel_path: Optional[str] = None) -> Response:
+    """
+    Serve a file without loading it into memory, with resumable downloads.
+
+    With ``accel_path`` the body is left to nginx (``X-Accel-Redirect``), which sends
+    it with sendfile and handles ranges itself. Otherwise the whole file is streamed
+    by FileResponse, and a single ``Range`` (honoured only if ``If-Range`` still
+    matches the ETag) is answered with 206 Partial Content.
+
+    Args:
+        request: Incoming request, for the Range and If-Range headers
+        path: File to send
+        media_type: Content type of the file
+        etag: Strong ETag of the (immutable) content
+        filename: Download name for Content-Disposition
+        accel_path: Internal nginx location of the file
+
+    Returns:
+        Response streaming the requested bytes
+    """
+    headers = {"etag": etag, "accept-ranges": "bytes"}
+    if filename:
+        headers["content-disposition"] = f'attachment; filename="{filename}"'
+
+    if accel_path is not None:
+        headers["x-accel-redirect"] = accel_path
+        return Response(status_code=200, media_type=media_type, headers=headers)
+
+    size = os.stat(path).st_size
+    if_range = request.headers.get("if-range")
+    if if_range is None or if_range == etag:
+        try:
+            byte_range = parse_range(request.headers.get("range"), size)
+        except ValueError:
+            return Response(status_code=416, headers={"content-range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+            headers["content-length"] = str(end - start + 1)
+            if request.method == "HEAD":
+                return Response(status_code=206, media_type=media_type, headers=headers)
+            return StreamingResponse(_read_range(path, start, end), status_code=206,
+                                     media_type=media_type, headers=headers)
+
+    return FileResponse(path, media_type=media_type, headers=headers, method=request.method)
@@ -0,0 +1,327 @@
+# src/api/router.py
+
+import asyncio
+import json
+import logging
+import time
+from collections import defaultdict
+from contextlib import suppress
+from typing import AsyncIterator, Dict, List, Optional, Set
+
+import httpx
+
+from src.core.cluster import NodeDirectory, NodeState, redis_from_settings
+
+# Scoring weights: a resident model is worth this many GB of free memory, and every
+# queued or in-flight request costs this many
+AFFINITY_BONUS_GB = 8.0
+QUEUE_PENALTY_GB = 1.0
+
+# Only errors raised before the request reached a node are retried, so work is never duplicated
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+RETRYABLE_STATUS = {503}
+UNREACHABLE_COOLDOWN_S = 5.0  # Skip a node this long after a connection failure
+
+HOP_BY_HOP_HEADERS = {
+    b"connection", b"keep-alive", b"proxy-authenticate", b"proxy-authorization",
+    b"te", b"trailer", b"transfer-encoding", b"upgrade", b"host"
+}
+MAX_INSPECTED_BODY = 64 * 1024  # Buffered for model detection and retries; the rest streams through
+RESULTS_PREFIX = "/results/"
+
+
+class ClientGone(Exception):
+    """Raised when the client disconnects while its request is being forwarded"""
+
+
+class RequestBody:
+    """
+    Body of one forwarded request, read from the client as it goes upstream.
+
+    The first ``MAX_INSPECTED_BODY`` bytes are buffered, so small JSON bodies can be
+    inspected for the model and resent on a retry; anything beyond streams straight
+    through, so uploads of any size pass with bounded memory.
+    """
+    def __init__(self, receive):
+        self.receive = receive
+        self.prefix: List[bytes] = []
+        self.prefix_bytes = 0
+        self.complete = False  # The client's last chunk has been read
+        self.streamed = False  # Bytes beyond the prefix went upstream; the body cannot be resent
+        self.finished = asyncio.Event()
+
+    async def _next(self) -> bytes:
+        message = await self.receive()
+        if message["type"] == "http.disconnect":
+            raise ClientGone()
+        if not message.get("more_body"):
+            self.complete = True
+            self.finished.set()
+        return message.get("body", b"")
+
+    async def read_prefix(self):
+        """Buffer the start of the body (all of it, if it is small)."""
+        while not self.complete and self.prefix_bytes < MAX_INSPECTED_BODY:
+            chunk = await self._next()
+            self.prefix.append(chunk)
+            self.prefix_bytes += len(chunk)
+
+    @property
+    def replayable(self) -> bool:
+        return not self.streamed
+
+    def content(self):
+        """Upstream request content: the buffered bytes, or a stream continuing after them."""
+        if self.complete:
+            return b"".join(self.prefix)
+        return self._stream()
+
+    async def _stream(self) -> AsyncIterator[bytes]:
+        for chunk in self.prefix:
+            yield chunk
+        while not self.complete:
+            self.streamed = True
+            chunk = await self._next()
+            if chunk:
+                yield chunk
+
+
+class RequestRouter:
+    """
+    ASGI application that forwards requests to the best AI server node.
+
+    Nodes are discovered from their Redis heartbeats. Each request goes to the
+    node with the highest score, where free device memory counts for the node,
+    queued work (from the heartbeat plus requests this router has in flight) counts
+    against it, and having the requested model resident adds a bonus. Draining
+    nodes (shutting down or swapping a model) only get work no other node can take.
+    The model is taken from the ``X-Model`` header or the ``model`` field of a small
+    JSON body. Connection failures and 503 responses are retried on the next best
+    node as long as the request body can still be resent. Result downloads
+    (``/results/<node>/<id>``) always go to the node named in the path.
+
+    Request and response bodies are streamed through, so large uploads, SSE and
+    NDJSON endpoints keep working. When the client disconnects, the upstream
+    request is closed, which the node sees as a disconnect of its own.
+    """
+    def __init__(self, directory: NodeDirectory, client: Optional[httpx.AsyncClient] = None,
+                 max_retries: int = 2, refresh_interval_s: float = 0.5,
+                 log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.directory = directory
+        self.client = client or httpx.AsyncClient(timeout=httpx.Timeout(60.0, connect=2.0))
+        self.max_retries = max_retries
+        self.refresh_interval_s = refresh_interval_s
+
+        self._nodes: List[NodeState] = []
+        self._refreshed = 0.0
+        self._refresh_lock = asyncio.Lock()
+        self.in_flight: Dict[str, int] = defaultdict(int)
+        self._unreachable_until: Dict[str, float] = {}
+        self.forwarded: Dict[str, int] = defaultdict(int)
+        self.disconnected = 0  # Requests whose client went away before the response finished
+
+    async def nodes(self) -> List[NodeState]:
+        """Cached node list, refreshed from Redis at most every ``refresh_interval_s``."""
+        if time.monotonic() - self._refreshed < self.refresh_interval_s:
+            return self._nodes
+        async with self._refresh_lock:
+            if time.monotonic() - self._refreshed >= self.refresh_interval_s:
+                try:
+                    self._nodes = await self.directory.nodes()
+                except Exception:
+                    # Keep routing on the last known nodes while Redis is unavailable
+                    self.logger.exception("Node directory refresh failed")
+                self._refreshed = time.monotonic()
+        return self._nodes
+
+    def score(self, node: NodeState, model: Optional[str]) -> float:
+        load = node.queue_depth + self.in_flight[node.node_id]
+        score = node.free_memory_mb / 1024 - QUEUE_PENALTY_GB * load
+        if model is not None and model in node.resident_models:
+            score += AFFINITY_BONUS_GB
+        return score
+
+    async def pick(self, model: Optional[str], exclude: Set[str],
+                   pinned: Optional[str] = None) -> Optional[NodeState]:
+        now = time.monotonic()
+        if pinned is not None:
+            # Stored results live on the node that produced them, draining or not
+            return next((n for n in await self.nodes() if n.node_id == pinned and n.node_id not in exclude), None)
+        live = [n for n in await self.nodes()
+                if n.node_id not in exclude and self._unreachable_until.get(n.node_id, 0.0) <= now]
+        candidates = [n for n in live if not n.draining] or live
+        if not candidates:
+            return None
+        return max(candidates, key=lambda n: self.score(n, model))
+
+    @staticmethod
+    def _model_for(headers: Dict[bytes, bytes], body: bytes) -> Optional[str]:
+        model = headers.get(b"x-model")
+        if model is not None:
+            return model.decode()
+        if b"json" in headers.get(b"content-type", b"") and 0 < len(body) <= MAX_INSPECTED_BODY:
+            try:
+                data = json.loads(body)
+                return data.get("model") if isinstance(data, dict) else None
+            except ValueError:
+                return None
+        return None
+
+    @staticmethod
+    def _node_for(path: str) -> Optional[str]:
+        """Node ID of a ``/results/<node>/<id>`` download, which only that node can serve."""
+        if path.startswith(RESULTS_PREFIX):
+            parts = path[len(RESULTS_PREFIX):].split("/")
+            if len(parts) == 2:
+                return parts[0]
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":
+            return
+
+        if scope["path"] == "/router/nodes":
+            await self._send_json(send, 200, await self._status())
+            return
+
+        body = RequestBody(receive)
+        try:
+            await body.read_prefix()
+        except ClientGone:
+            return
+
+        forward = asyncio.ensure_future(self._forward(scope, send, body))
+        watcher = asyncio.ensure_future(self._wait_for_disconnect(body))
+        try:
+            done, _ = await asyncio.wait({forward, watcher}, return_when=asyncio.FIRST_COMPLETED)
+            if forward not in done:
+                # Closing the upstream request tells the node the client is gone
+                forward.cancel()
+                with suppress(asyncio.CancelledError, Exception):
+                    await forward
+                self.disconnected += 1
+                return
+            with suppress(ClientGone):
+                forward.result()
+        finally:
+            watcher.cancel()
+            if not forward.done():
+                forward.cancel()
+
+    @staticmethod
+    async def _wait_for_disconnect(body: RequestBody):
+        """Return once the client disconnects; only listens after the whole body was read."""
+        await body.finished.wait()
+        while True:
+            message = await body.receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    async def _forward(self, scope, send, body: RequestBody):
+        headers = {k.lower(): v for k, v in scope["headers"]}
+        model = self._model_for(headers, b"".join(body.prefix) if body.complete else b"")
+        pinned = self._node_for(scope["path"])
+        forward_headers = [(k, v) for k, v in scope["headers"] if k.lower() not in HOP_BY_HOP_HEADERS]
+        if scope.get("client"):
+            forward_headers.append((b"x-forwarded-for", scope["client"][0].encode()))
+
+        target = scope["path"]
+        if scope.get("query_string"):
+            target += "?" + scope["query_string"].decode()
+
+        tried: Set[str] = set()
+        for attempt in range(self.max_retries + 1):
+            node = await self.pick(model, tried, pinned)
+            if node is None:
+                break
+            tried.add(node.node_id)
+
+            self.in_flight[node.node_id] += 1
+            try:
+                request = self.client.build_request(scope["method"], node.url.rstrip("/") + target,
+                                                    headers=forward_headers, content=body.content())
+                try:
+                    response = await self.client.send(request, stream=True)
+                except RETRYABLE_ERRORS as e:
+                    self._unreachable_until[node.node_id] = time.monotonic() + UNREACHABLE_COOLDOWN_S
+                    if not body.replayable:
+                        self.logger.warning(f"Node {node.node_id} unreachable mid-upload, not retrying: {str(e)}")
+                        break
+                    self.logger.warning(f"Node {node.node_id} unreachable, retrying: {str(e)}")
+                    continue
+
+                if (response.status_code in RETRYABLE_STATUS and attempt < self.max_retries
+                        and body.replayable):
+                    await response.aclose()
+                    self.logger.warning(f"Node {node.node_id} returned {response.status_code}, retrying")
+                    continue
+
+                self.forwarded[node.node_id] += 1
+                await self._stream_response(send, response, node)
+                return
+            finally:
+                self.in_flight[node.node_id] -= 1
+
+        await self._send_json(send, 503, {"detail": "No AI server node available"})
+
+    async def _stream_response(self, send, response: httpx.Response, node: NodeState):
+        headers = [(k, v) for k, v in response.headers.raw if k.lower() not in HOP_BY_HOP_HEADERS]
+        headers.append((b"x-routed-node", node.node_id.encode()))
+        try:
+            await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+            async for chunk in response.aiter_raw():
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            await response.aclose()
+
+    @staticmethod
+    async def _send_json(send, status: int, content: Dict):
+        body = json.dumps(content).encode()
+        await send({"type": "http.response.start", "status": status,
+                    "headers": [(b"content-type", b"application/json"),
+                                (b"content-length", str(len(body)).encode())]})
+        await send({"type": "http.response.body", "body": body})
+
+    async def _status(self) -> Dict:
+        return {
+            "disconnected": self.disconnected,
+            "nodes": [
+                {**vars(node), "in_flight": self.in_flight[node.node_id],
+                 "forwarded": self.forwarded[node.node_id], "score": round(self.score(node, None), 3)}
+                for node in await self.nodes()
+            ]
+        }
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.client.aclose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+def create_router(settings) -> RequestRouter:
+    """Router wired to the configured Redis server."""
+    return RequestRouter(
+        NodeDirectory(redis_from_settings(settings)),
+        client=httpx.AsyncClient(timeout=httpx.Timeout(settings.ROUTER_TIMEOUT_S, connect=2.0)),
+        max_retries=settings.ROUTER_MAX_RETRIES
+    )
+
+
+if __name__ == "__main__":
+    import uvicorn
+    from src.api.config import settings
+
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(create_router(settings), host="0.0.0.0", port=settings.ROUTER_PORT)
@@ -1,20 +1,60 @@
 # E:/justica/src/api/server.py
 
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, Header, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
 import torch
 import cv2
 import numpy as np
+import psutil
 from pathlib import Path
 from typing import Dict, List, Optional
+import asyncio
+import json
 import logging
+import os
+import secrets
+import shutil
+import tempfile
+import time
 
 # Fix the import path
 from src.core.gpu.gpu_utils import GPUManager  # Changed from src.core.gpu_utils
+from src.core.gpu.streams import StreamExecutor
+from src.core.monitoring.metrics import AIServerMetrics
+from src.core.monitoring.history import MetricsHistory
+from src.core.monitoring.profiling import ProfilerBusy, ProfilingManager, ProfilingMiddleware
+from src.core.cluster import HeartbeatPublisher, WorkerCommands, redis_from_settings
+from src.core.result_store import ResultStore, StoredResult
+from src.core.scheduler import (
+    DeadlineScheduler, DeadlineExceeded, ClientDisconnected, Priority,
+    deadline_from_request, cancel_on_disconnect
+)
+from src.api.config import settings
+from src.api.downloads import file_response
+from src.utils.structured_logging import (
+    RequestLoggingMiddleware, setup_logging, log_phase, set_request_field, logging_stats
+)
+from src.ml.artifact_cache import ArtifactCache
+from src.ml.registry import ModelRegistry
+from src.ml.model_host import ModelHostClient, TensorRing
+from src.ml.batching import BatcherPool, DynamicBatcher, tensor_batch_fn
+from src.ml.autotune import Autotuner, TuningResult
+from src.ml.shape_buckets import ShapeBucketer, BucketedExecutor, bucketed_batch_fn
+from src.ml.rag import RetrievalService
+from src.ml.vector_index import VectorIndex
+from src.ml.generation import GenerationEngine
+from src.ml.audio import AudioPipeline
+from src.ml.image_preprocess import ImageBatchPreprocessor
+from src.ml.kv_cache import PagedKVCache
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (queued, written by a background thread)
+setup_logging(
+    level=settings.LOG_LEVEL,
+    json_format=settings.LOG_JSON,
+    sample_rate=settings.LOG_SAMPLE_RATE,
+    queue_size=settings.LOG_QUEUE_SIZE
+)
 logger = logging.getLogger(__name__)
 
 # Initialize FastAPI app
@@ -33,9 +73,365 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# On-demand profiling (off by default, middleware only checks a flag)
+profiling = ProfilingManager(settings.AI_DATA_PATH / "profiles")
+app.add_middleware(ProfilingMiddleware, manager=profiling)
+
+# Request IDs, phase timings and one (sampled) access record per request
+app.add_middleware(RequestLoggingMiddleware)
+
+# Read-only view of the metrics history written by the unified metrics server
+metrics_history: Optional[MetricsHistory] = None
+
+def get_metrics_history() -> MetricsHistory:
+    """Open the history buffers on first use; the collector may start after us."""
+    global metrics_history
+    if metrics_history is None:
+        metrics_history = MetricsHistory(settings.AI_DATA_PATH / "metrics_history", readonly=True)
+    return metrics_history
+
 # Initialize GPU Manager
 gpu_manager = GPUManager()
 
+# Request metrics (aggregated across workers by the unified metrics server)
+ai_metrics = AIServerMetrics(latency_buckets=settings.METRICS_LATENCY_BUCKETS,
+                             batch_buckets=settings.METRICS_BATCH_BUCKETS)
+
+# Deadline-aware admission for model and image execution
+scheduler = DeadlineScheduler(
+    max_concurrent=settings.SCHEDULER_MAX_CONCURRENT,
+    default_deadlines={
+        Priority.INTERACTIVE: settings.SCHEDULER_INTERACTIVE_DEADLINE_MS / 1000,
+        Priority.BULK: settings.SCHEDULER_BULK_DEADLINE_MS / 1000
+    },
+    metrics=ai_metrics,
+    probe_interval_s=settings.SCHEDULER_PROBE_INTERVAL_S
+)
+
+# Initialize model registry backed by the shared on-disk artifact cache
+artifact_cache = ArtifactCache(settings.MODEL_CACHE_PATH)
+model_registry = ModelRegistry(artifact_cache)
+model_registry.register_entrypoints(settings.MODEL_BUILDERS)
+for pipeline_model, pipeline_devices in settings.PIPELINE_MODELS.items():
+    model_registry.enable_pipeline(pipeline_model, pipeline_devices, settings.PIPELINE_MICRO_BATCHES)
+
+# Independent models and image jobs run on their own CUDA streams (threads on CPU)
+stream_executor = StreamExecutor(model_registry.device, settings.STREAMS_PER_DEVICE, metrics=ai_metrics)
+
+# Request batching shared by inference, embedding and vector search
+batchers = BatcherPool(max_batch_size=settings.MAX_BATCH_SIZE, max_wait_ms=settings.BATCH_MAX_WAIT_MS,
+                       metrics=ai_metrics)
+
+# Static-shape execution for run_model, one executable per shape bucket and model
+shape_bucketer = ShapeBucketer(settings.SHAPE_BUCKET_BATCH_SIZES, settings.SHAPE_BUCKET_DIM_SIZES)
+bucketed_executors: Dict[str, BucketedExecutor] = {}
+
+def model_batch_fn(model_name: str, model: Optional[torch.nn.Module] = None):
+    """
+    Batch function for /run-model, bucketed when SHAPE_BUCKETING_ENABLED is set.
+
+    Each model's batches run on the model's own stream.
+    """
+    model = model or model_registry.get(model_name)
+    device = model_registry.device
+    if not settings.SHAPE_BUCKETING_ENABLED:
+        return stream_executor.wrap(f"model:{model_name}", tensor_batch_fn(model, device))
+    executor = BucketedExecutor(model, device, shape_bucketer,
+                                mode=settings.SHAPE_BUCKET_MODE, name=model_name)
+    bucketed_executors[model_name] = executor
+    return stream_executor.wrap(f"model:{model_name}", bucketed_batch_fn(executor))
+
+async def get_model_batcher(model_name: str) -> DynamicBatcher:
+    """The model's batcher; a model used for the first time is loaded off the event loop."""
+    model = await model_registry.aget(model_name)
+    return batchers.get(f"model:{model_name}", lambda: model_batch_fn(model_name, model))
+
+# Batch size / concurrency tuning per model and device, read back at startup
+autotuner = Autotuner(
+    artifact_cache,
+    slo_ms=settings.AUTOTUNE_SLO_MS,
+    batch_sizes=settings.AUTOTUNE_BATCH_SIZES,
+    concurrency_levels=settings.AUTOTUNE_CONCURRENCY
+)
+
+def apply_tuning(result: TuningResult):
+    """Use a tuning result for the model's batch size and batches in flight."""
+    batchers.configure(f"model:{result.model}", result.max_batch_size, max_in_flight=result.max_concurrent)
+
+@app.on_event("startup")
+async def load_tuning():
+    """Apply stored tunings; measure missing ones when AUTOTUNE_ON_STARTUP is set."""
+    device = model_registry.device
+    for name in settings.MODEL_BUILDERS:
+        try:
+            result = await asyncio.to_thread(autotuner.load, name, device)
+            shape = settings.AUTOTUNE_INPUT_SHAPES.get(name)
+            if result is None and settings.AUTOTUNE_ON_STARTUP and shape is not None:
+                model = await asyncio.to_thread(model_registry.get, name)
+                result = await asyncio.to_thread(
+                    autotuner.load_or_tune, name, model, torch.randn(1, *shape), device
+                )
+            if result is not None:
+                apply_tuning(result)
+        except Exception:
+            logger.exception(f"Autotuning '{name}' failed")
+
+# Load reports for the multi-node router
+heartbeat: Optional[HeartbeatPublisher] = None
+
+async def collect_load() -> Dict:
+    """Free memory, queue depth and resident models of this worker."""
+    device = model_registry.device
+    if device.type == "cuda":
+        free_bytes, _ = torch.cuda.mem_get_info(device)
+    else:
+        free_bytes = psutil.virtual_memory().available
+    stats = scheduler.stats()
+    return {
+        "free_memory_mb": free_bytes / 2**20,
+        "queue_depth": stats["running"] + stats["queued"],
+        "resident_models": model_registry.loaded()
+    }
+
+@app.on_event("startup")
+async def start_heartbeat():
+    global heartbeat
+    if settings.CLUSTER_ENABLED:
+        heartbeat = HeartbeatPublisher(
+            redis_from_settings(settings), settings.NODE_ID, settings.NODE_URL, collect_load,
+            interval_s=settings.HEARTBEAT_INTERVAL_S, ttl_s=settings.HEARTBEAT_TTL_S
+        )
+        heartbeat.start()
+
+@app.on_event("shutdown")
+async def graceful_shutdown():
+    """
+    Finish queued work before the worker exits.
+
+    uvicorn has already stopped accepting connections and waited for open requests
+    (up to SHUTDOWN_GRACE_PERIOD_S); this drains work that outlives them. Routers
+    see the worker as draining until it is gone.
+    """
+    if heartbeat is not None:
+        await heartbeat.set_draining("shutdown")
+    if worker_commands is not None:
+        await worker_commands.stop()
+
+    grace = settings.SHUTDOWN_GRACE_PERIOD_S
+    drained = await asyncio.gather(
+        scheduler.drain(grace),
+        batchers.drain(grace),
+        *(engine.drain(grace) for engine in generation_engines.values())
+    )
+    if not all(drained):
+        logger.warning(f"Shutdown grace period of {grace}s expired with work still queued")
+    if heartbeat is not None:
+        await heartbeat.stop()
+
+# Large outputs go to disk once and are downloaded by handle
+result_store = ResultStore(
+    settings.AI_DATA_PATH / "results",
+    ttl_s=settings.RESULT_TTL_S,
+    quota_bytes=int(settings.RESULT_QUOTA_GB * 2**30)
+)
+result_eviction: Optional[asyncio.Task] = None
+
+def result_handle(result: StoredResult) -> Dict:
+    """Client-facing handle; the node ID lets the router send downloads to this node."""
+    return result.handle(f"/results/{settings.NODE_ID}/{result.result_id}")
+
+def offload(nbytes: int) -> bool:
+    """Whether an output goes to the result store; outputs over the whole quota stay inline."""
+    return settings.RESULT_INLINE_MAX_BYTES < nbytes <= result_store.quota_bytes
+
+def store_tensor(tensor: torch.Tensor) -> StoredResult:
+    """Save a CPU tensor as ``.npy``; bfloat16, which NumPy lacks, is upcast to float32."""
+    if tensor.dtype == torch.bfloat16:
+        tensor = tensor.float()
+    return result_store.put_array(tensor.numpy())
+
+@app.on_event("startup")
+async def start_result_eviction():
+    global result_eviction
+
+    async def evict_loop():
+        while True:
+            try:
+                await asyncio.to_thread(result_store.evict)
+            except Exception:
+                logger.exception("Result eviction failed")
+            await asyncio.sleep(settings.RESULT_EVICT_INTERVAL_S)
+
+    result_eviction = asyncio.get_running_loop().create_task(evict_loop())
+
+# Retrieval subsystem for the RAG workload
+vector_index = VectorIndex(settings.AI_DATA_PATH / "vector_index", dim=settings.EMBEDDING_DIM)
+retrieval = RetrievalService(
+    model_registry, vector_index, batchers,
+    model_name=settings.EMBEDDING_MODEL,
+    max_length=settings.EMBEDDING_MAX_LENGTH
+)
+
+# Chunked audio pipeline for the video-translation workload
+audio_pipeline = AudioPipeline(
+    model_registry, batchers, settings.AUDIO_MODEL,
+    sample_rate=settings.AUDIO_SAMPLE_RATE,
+    window_s=settings.AUDIO_WINDOW_S,
+    overlap_s=settings.AUDIO_OVERLAP_S,
+    max_in_flight=settings.AUDIO_MAX_IN_FLIGHT
+)
+
+# Batched image decoding straight into model-ready tensors
+image_preprocessor = ImageBatchPreprocessor(
+    *settings.VISION_INPUT_SIZE,
+    dtype=getattr(torch, settings.VISION_DTYPE),
+    mean=settings.VISION_MEAN,
+    std=settings.VISION_STD,
+    max_batch_size=settings.VISION_MAX_IMAGES,
+    max_workers=settings.VISION_DECODE_WORKERS,
+    device=model_registry.device
+)
+
+# Continuous-batching generation engines (and their tokenizers), one per generative model
+generation_engines: Dict[str, GenerationEngine] = {}
+generation_tokenizers: Dict[str, object] = {}
+
+async def get_generation_engine(model_name: str) -> GenerationEngine:
+    """Create the engine and its paged KV cache on first use of a model."""
+    engine = generation_engines.get(model_name)
+    if engine is None:
+        model = await model_registry.aget(model_name)
+        engine = generation_engines.get(model_name)  # Created by a concurrent request meanwhile
+    if engine is None:
+        device = model_registry.device
+        cache = PagedKVCache(
+            model.num_layers, model.num_heads, model.head_dim,
+            memory_budget_bytes=settings.GENERATION_KV_CACHE_MB * 1024 * 1024,
+            block_size=settings.GENERATION_BLOCK_SIZE,
+            dtype=torch.float16 if device.type == "cuda" else torch.float32,
+            device=device
+        )
+        engine = GenerationEngine(
+            model, cache,
+            max_num_seqs=settings.GENERATION_MAX_SEQS,
+            max_step_tokens=settings.GENERATION_MAX_STEP_TOKENS,
+            eos_token_id=settings.GENERATION_EOS_TOKEN_ID
+        )
+        generation_engines[model_name] = engine
+    return engine
+
+# Hot model swaps: load and warm a new version, switch atomically, drain the old one
+swap_lock = asyncio.Lock()
+swap_status: Dict[str, Dict] = {}
+SWAP_IN_PROGRESS = ("pending", "loading", "warming", "draining")
+
+# Admin commands that every worker of this node must run (Redis pub/sub), if WORKERS > 1
+worker_commands: Optional[WorkerCommands] = None
+
+async def set_swap_state(model_name: str, **fields):
+    """Update this worker's swap status and report it for the node-wide view."""
+    status = swap_status[model_name]
+    status.update(fields)
+    if worker_commands is not None:
+        try:
+            await worker_commands.report(f"swap:{model_name}", status)
+        except Exception:
+            logger.exception(f"Reporting swap state of '{model_name}' failed")
+
+async def swap_model(model_name: str, artifact: Optional[str], warmup_shape: Optional[List[int]],
+                     promote: bool):
+    """Replace a served model without dropping requests queued on the old version."""
+    async with swap_lock:
+        # Routers send new work elsewhere while this worker loads, warms and drains
+        if heartbeat is not None:
+            await heartbeat.set_draining(f"swap:{model_name}")
+        try:
+            await set_swap_state(model_name, state="loading")
+            new_model = await asyncio.to_thread(model_registry.build, model_name, artifact)
+
+            # Warm up through the same batch function traffic will use (compiles buckets)
+            new_batch_fn = model_batch_fn(model_name, new_model)
+            if warmup_shape:
+                await set_swap_state(model_name, state="warming")
+                await asyncio.to_thread(new_batch_fn, [torch.randn(1, *warmup_shape)])
+
+            # Switch: new requests now see the new version everywhere
+            old_model = model_registry.activate(model_name, new_model)
+            old_batcher = batchers.replace(f"model:{model_name}", new_batch_fn)
+            old_engine = generation_engines.pop(model_name, None)
+            if promote and artifact and artifact != model_name:
+                await asyncio.to_thread(artifact_cache.alias, model_name, "weights", artifact)
+
+            await set_swap_state(model_name, state="draining")
+            grace = settings.SHUTDOWN_GRACE_PERIOD_S
+            drained = await asyncio.gather(
+                old_batcher.drain(grace) if old_batcher is not None else asyncio.sleep(0, True),
+                old_engine.drain(grace) if old_engine is not None else asyncio.sleep(0, True)
+            )
+            if not all(drained):
+                logger.warning(f"Old version of '{model_name}' still busy after {grace}s, releasing it")
+
+            # Stops the stage threads of a pipeline-parallel model and frees device memory
+            del old_batcher, old_engine
+            model_registry.retire(old_model)
+            del old_model
+            await set_swap_state(model_name, state="done", finished=time.time())
+            logger.info(f"Swapped model '{model_name}' to '{artifact or model_name}'")
+        except Exception as e:
+            logger.exception(f"Model swap for '{model_name}' failed")
+            await set_swap_state(model_name, state="failed", error=str(e), finished=time.time())
+        finally:
+            if heartbeat is not None:
+                await heartbeat.set_draining(f"swap:{model_name}", False)
+
+async def run_swap_command(payload: Dict):
+    """Start a swap in this worker, unless one of the same model is still running."""
+    model_name = payload["model"]
+    if swap_status.get(model_name, {}).get("state") in SWAP_IN_PROGRESS:
+        logger.warning(f"Ignoring swap of '{model_name}': a swap is already in progress")
+        return
+    swap_status[model_name] = {"state": "pending", "artifact": payload.get("artifact") or model_name,
+                               "started": time.time()}
+    await swap_model(model_name, payload.get("artifact"), payload.get("warmup_shape"),
+                     payload.get("promote", True))
+
+@app.on_event("startup")
+async def start_worker_commands():
+    global worker_commands
+    if settings.WORKERS > 1:
+        worker_commands = WorkerCommands(redis_from_settings(settings), settings.NODE_ID)
+        worker_commands.on("swap_model", run_swap_command)
+        await worker_commands.start()
+
+# Client for the shared model host process (attached lazily, the host may start after us)
+model_host_client: Optional[ModelHostClient] = None
+
+def get_model_host_client() -> ModelHostClient:
+    """Attach to the model host's shared-memory ring on first use."""
+    global model_host_client
+    if model_host_client is None:
+        ring = TensorRing(
+            settings.MODEL_HOST_SHM_NAME,
+            settings.MODEL_HOST_SLOTS,
+            settings.MODEL_HOST_SLOT_MB * 1024 * 1024
+        )
+        model_host_client = ModelHostClient(ring)
+    return model_host_client
+
+async def run_scheduled(request: Request, key: str, fn):
+    """Run work through the scheduler, cancelling it if the client disconnects."""
+    priority, deadline = deadline_from_request(request)
+    with log_phase("scheduled"):
+        return await cancel_on_disconnect(
+            request,
+            scheduler.run(fn, key=key, priority=priority, deadline=deadline)
+        )
+
+async def require_admin(x_api_key: str = Header(...)):
+    """Reject admin calls that do not carry the API secret key."""
+    if not secrets.compare_digest(x_api_key, settings.API_SECRET_KEY.get_secret_value()):
+        raise HTTPException(status_code=403, detail="Invalid API key")
+
 @app.get("/health")
 async def health_check() -> Dict:
     """
@@ -54,33 +450,164 @@ async def health_check() -> Dict:
             "gpu_stats": gpu_stats
         }
     except Exception as e:
-        logger.error(f"Health check failed: {str(e)}")
+        logger.exception("Health check failed")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics/history")
+async def get_metrics_history_window(window: float = 300, series: Optional[str] = None,
+                                     percentiles: str = "50,90,99", resolution: Optional[int] = None,
+                                     points: bool = False) -> Dict:
+    """
+    Windowed min/max/avg/percentiles of the collected metrics, kept on the box.
+
+    ``series`` is a regular expression on series names such as
+    ``gpu_utilization{gpu=0}``; ``points`` also returns the per-bucket values.
+    """
+    try:
+        return await asyncio.to_thread(
+            get_metrics_history().query,
+            window,
+            pattern=series,
+            percentiles=[float(p) for p in percentiles.split(",") if p],
+            resolution=resolution,
+            points=points
+        )
+    except FileNotFoundError:
+        raise HTTPException(status_code=503, detail="Metrics history is not available yet")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Metrics history query failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+# CUDA filters keep per-call scratch buffers, so every lane gets its own
+blur_filters: Dict[tuple, object] = {}
+
+def blur_filter(lane, image_type: int):
+    key = (lane.index, image_type)
+    if key not in blur_filters:
+        blur_filters[key] = cv2.cuda.createGaussianFilter(image_type, image_type, (15, 15), 0)
+    return blur_filters[key]
+
 @app.post("/process-image")
-async def process_image(file: UploadFile = File(...)):
+async def process_image(request: Request, file: UploadFile = File(...)):
     """
     Process an uploaded image using GPU-accelerated OpenCV.
+
+    Results larger than RESULT_INLINE_MAX_BYTES (but within the store quota) are
+    written to the result store and returned as a handle to download from ``/results``.
     """
     try:
         contents = await file.read()
-        np_image = np.frombuffer(contents, np.uint8)
-        image = cv2.imdecode(np_image, cv2.IMREAD_COLOR)
 
-        # Upload image to GPU
-        gpu_image = cv2.cuda_GpuMat()
-        gpu_image.upload(image)
+        def blur(lane):
+            np_image = np.frombuffer(contents, np.uint8)
+            image = cv2.imdecode(np_image, cv2.IMREAD_COLOR)
 
-        # Apply Gaussian Blur on GPU
-        gpu_blurred = cv2.cuda.GaussianBlur(gpu_image, (15, 15), 0)
-        result_image = gpu_blurred.download()
+            with profiling.timers.timer("process_image.gpu"), log_phase("gpu"):
+                if lane.cv_stream is not None:
+                    # Upload, blur and download on this lane's stream, overlapping other jobs
+                    gpu_image = cv2.cuda_GpuMat()
+                    gpu_image.upload(image, stream=lane.cv_stream)
+                    gpu_blurred = blur_filter(lane, gpu_image.type()).apply(gpu_image, stream=lane.cv_stream)
+                    result_image = gpu_blurred.download(stream=lane.cv_stream)
+                    lane.cv_stream.waitForCompletion()
+                else:
+                    result_image = cv2.GaussianBlur(image, (15, 15), 0)
 
-        _, buffer = cv2.imencode('.jpg', result_image)
-        return JSONResponse(content={"status": "success", "data": buffer.tobytes().decode('latin1')})
+            with profiling.timers.timer("process_image.encode"), log_phase("encode"):
+                _, buffer = cv2.imencode('.jpg', result_image)
+            if offload(buffer.nbytes):
+                with log_phase("store"):
+                    return result_store.put_bytes(buffer.data, "image/jpeg", ".jpg")
+            return buffer.tobytes()
+
+        data = await run_scheduled(request, "process_image", lambda: stream_executor.run(blur))
+        if isinstance(data, StoredResult):
+            return {"status": "success", "result": result_handle(data)}
+        return JSONResponse(content={"status": "success", "data": data.decode('latin1')})
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Client disconnected")
     except Exception as e:
-        logger.error(f"Image processing failed: {str(e)}")
+        logger.exception("Image processing failed")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/vision/infer")
+async def vision_infer(request: Request, files: List[UploadFile] = File(...), model: str = Form(...)) -> Dict:
+    """
+    Run a vision model on a batch of uploaded images.
+
+    The images are decoded and letterboxed into one NCHW tensor that goes to the
+    model as is; the letterbox geometry maps outputs back to the original images.
+    """
+    try:
+        blobs = [await file.read() for file in files]
+        device = model_registry.device
+        set_request_field("model", model)
+        set_request_field("device", str(device))
+
+        async def infer():
+            with profiling.timers.timer("vision.preprocess"), log_phase("preprocess"):
+                batch, infos = await asyncio.to_thread(image_preprocessor, blobs)
+            batcher = await get_model_batcher(model)
+            scheduler.release_slot()  # The batcher bounds device work from here
+            start = time.perf_counter()
+            with profiling.timers.timer("vision.inference"), log_phase("inference"):
+                output = await batcher.submit(batch)
+            ai_metrics.observe_inference(model, str(device), time.perf_counter() - start)
+            return output, infos
+
+        output, infos = await run_scheduled(request, f"vision:{model}", infer)
+        letterbox = [vars(info) for info in infos]
+        if offload(output.numel() * output.element_size()):
+            with log_phase("store"):
+                stored = await asyncio.to_thread(store_tensor, output)
+            return {"status": "success", "result": result_handle(stored), "letterbox": letterbox}
+        return {"status": "success", "output": output.tolist(), "letterbox": letterbox}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    except Exception as e:
+        logger.exception("Vision inference failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/process-audio")
+async def process_audio(file: UploadFile = File(...)):
+    """
+    Run the audio track of an uploaded audio/video file through the audio model.
+
+    Results stream back as newline-delimited JSON, one line per window, in order.
+    """
+    try:
+        upload_dir = settings.AI_DATA_PATH / "uploads"
+        upload_dir.mkdir(parents=True, exist_ok=True)
+        suffix = Path(file.filename or "").suffix
+        with tempfile.NamedTemporaryFile(dir=upload_dir, suffix=suffix, delete=False) as tmp:
+            # Copy in chunks; containers like mp4 need a seekable file for ffmpeg
+            await asyncio.to_thread(shutil.copyfileobj, file.file, tmp, 1 << 20)
+            media_path = Path(tmp.name)
+    except Exception as e:
+        logger.exception("Audio upload failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def result_stream():
+        try:
+            async for result in audio_pipeline.process(media_path):
+                yield json.dumps(result) + "\n"
+        except Exception as e:
+            logger.exception("Audio processing failed")
+            yield json.dumps({"error": str(e)}) + "\n"
+        finally:
+            media_path.unlink(missing_ok=True)
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson",
+                             headers={"X-Accel-Buffering": "no"})
+
 @app.get("/gpu-info")
 async def get_gpu_info() -> Dict:
     """
@@ -99,13 +626,16 @@ async def get_gpu_info() -> Dict:
             "compute_capability": f"{gpu_properties.major}.{gpu_properties.minor}"
         }
     except Exception as e:
-        logger.error(f"Failed to get GPU info: {str(e)}")
+        logger.exception("Failed to get GPU info")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/run-model")
-async def run_model(data: Dict):
+async def run_model(request: Request, data: Dict):
     """
     Run inference on a given input using a pre-loaded model.
+
+    Outputs larger than RESULT_INLINE_MAX_BYTES (but within the store quota) are saved
+    as ``.npy`` in the result store and returned as a handle instead of a nested list.
     """
     try:
         # Placeholder for model inference
@@ -113,16 +643,349 @@ async def run_model(data: Dict):
         if input_data is None:
             raise ValueError("No input data provided")
 
-        # Example dummy model operation
-        device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        input_tensor = torch.tensor(input_data).to(device)
-        output = input_tensor * 2  # Dummy operation
+        model_name = data.get("model")
+        device = model_registry.device
+        set_request_field("model", model_name)
+        set_request_field("device", "model_host" if settings.MODEL_HOST_ENABLED else str(device))
+
+        async def infer() -> torch.Tensor:
+            if model_name is not None and settings.MODEL_HOST_ENABLED:
+                # Models live in the host process; only the tensor crosses over shared memory
+                start = time.perf_counter()
+                output = await get_model_host_client().infer(model_name, torch.tensor(input_data))
+                ai_metrics.observe_inference(model_name, "model_host", time.perf_counter() - start)
+                return output
+
+            if model_name is not None:
+                batcher = await get_model_batcher(model_name)
+                scheduler.release_slot()  # The batcher bounds device work from here
+                start = time.perf_counter()
+                with profiling.timers.timer("run_model.inference"), log_phase("inference"):
+                    output = await batcher.submit(torch.tensor(input_data))
+                ai_metrics.observe_inference(model_name, str(device), time.perf_counter() - start)
+            else:
+                output = await stream_executor.run(
+                    lambda lane: (torch.tensor(input_data).to(device) * 2).cpu()  # Dummy operation
+                )
+
+            return output.cpu()
+
+        output = await run_scheduled(request, f"run_model:{model_name}", infer)
+        if offload(output.numel() * output.element_size()):
+            with log_phase("store"):
+                stored = await asyncio.to_thread(store_tensor, output)
+            return {"status": "success", "result": result_handle(stored)}
+        return {"status": "success", "output": output.tolist()}
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ClientDisconnected:
+        raise HTTPException(status_code=499, detail="Client disconnected")
+    except Exception as e:
+        logger.exception("Model inference failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.api_route("/results/{node_id}/{result_id}", methods=["GET", "HEAD"])
+async def download_result(request: Request, node_id: str, result_id: str):
+    """
+    Download a stored result, with Range support for resuming.
+
+    Behind nginx (RESULT_ACCEL_REDIRECT_PREFIX set) the file is sent by nginx.
+    """
+    found = await asyncio.to_thread(result_store.get, result_id)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+    try:
+        result, path = found
+        accel_path = None
+        if settings.RESULT_ACCEL_REDIRECT_PREFIX:
+            accel_path = settings.RESULT_ACCEL_REDIRECT_PREFIX.rstrip("/") + "/" + result_store.relative_path(result)
+        return file_response(request, path, result.media_type, etag=f'"{result.result_id}"',
+                             filename=result.filename, accel_path=accel_path)
+    except Exception as e:
+        logger.exception("Result download failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/results/{node_id}/{result_id}")
+async def delete_result(node_id: str, result_id: str) -> Dict:
+    """
+    Delete a result once it has been downloaded, freeing its space before the TTL.
+    """
+    if not await asyncio.to_thread(result_store.delete, result_id):
+        raise HTTPException(status_code=404, detail="Result not found or expired")
+    return {"status": "success"}
+
+@app.post("/generate")
+async def generate(data: Dict):
+    """
+    Stream generated tokens as Server-Sent Events.
+
+    Body: {"model", "prompt" or "prompt_ids", "max_new_tokens", "temperature"}.
+    Each event carries {"id", "text"}; the stream ends with "data: [DONE]".
+    """
+    try:
+        model_name = data.get("model")
+        if model_name is None:
+            raise ValueError("No model provided")
+
+        engine = await get_generation_engine(model_name)
+        tokenizer = None
+        prompt_ids = data.get("prompt_ids")
+        if prompt_ids is None:
+            tokenizer = generation_tokenizers.get(model_name)
+            if tokenizer is None:
+                tokenizer = await asyncio.to_thread(model_registry.load_tokenizer, model_name)
+                generation_tokenizers[model_name] = tokenizer
+            prompt_ids = tokenizer.encode(data.get("prompt", "")).ids
+
+        tokens = engine.generate(
+            prompt_ids,
+            max_new_tokens=int(data.get("max_new_tokens", 128)),
+            temperature=float(data.get("temperature", 0.0))
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logger.exception("Generation failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+    async def event_stream():
+        try:
+            async for token in tokens:
+                text = tokenizer.decode([token]) if tokenizer is not None else None
+                yield f"data: {json.dumps({'id': token, 'text': text})}\n\n"
+            yield "data: [DONE]\n\n"
+        except Exception as e:
+            logger.exception("Generation stream failed")
+            yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+        finally:
+            await tokens.aclose()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/models")
+async def list_models() -> Dict:
+    """
+    List cached model artifacts and the models loaded in this worker.
+    """
+    try:
+        return {
+            "loaded": model_registry.loaded(),
+            "pipelines": model_registry.pipeline_stats(),
+            "cache_size_bytes": artifact_cache.total_size(),
+            "artifacts": [vars(entry) for entry in artifact_cache.manifest()]
+        }
+    except Exception as e:
+        logger.exception("Failed to list models")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/admin/models/swap", dependencies=[Depends(require_admin)])
+async def start_model_swap(data: Dict) -> Dict:
+    """
+    Hot-swap a model in every worker of this node: {"model", "artifact", "warmup_shape", "promote"}.
+
+    ``artifact`` names the new weights in the artifact cache (defaults to the model's
+    current entry, i.e. a reload). With several workers the swap is broadcast over
+    Redis so they all serve the same version. It runs in the background; poll
+    GET /admin/models/swap for its state. With ``promote`` the model name is pointed
+    at the new weights so restarted workers load them too.
+    """
+    try:
+        model_name = data.get("model")
+        if model_name is None:
+            raise ValueError("No model provided")
+        if swap_status.get(model_name, {}).get("state") in SWAP_IN_PROGRESS:
+            raise ValueError(f"A swap of '{model_name}' is already in progress")
+
+        payload = {
+            "model": model_name,
+            "artifact": data.get("artifact"),
+            "warmup_shape": data.get("warmup_shape") or settings.AUTOTUNE_INPUT_SHAPES.get(model_name),
+            "promote": bool(data.get("promote", True))
+        }
+        if worker_commands is not None:
+            workers = await worker_commands.publish("swap_model", payload)
+        else:
+            asyncio.get_running_loop().create_task(run_swap_command(payload))
+            workers = 1
+        return {"status": "accepted", "model": model_name, "workers": workers}
+    except Exception as e:
+        logger.exception("Failed to start model swap")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/admin/models/swap", dependencies=[Depends(require_admin)])
+async def model_swap_status() -> Dict:
+    """
+    State of the most recent swap of every model, per worker PID.
+    """
+    try:
+        if worker_commands is None:
+            return {name: {str(os.getpid()): status} for name, status in swap_status.items()}
+        statuses = {}
+        for name in set(settings.MODEL_BUILDERS) | set(swap_status):
+            workers = await worker_commands.statuses(f"swap:{name}")
+            if workers:
+                statuses[name] = workers
+        return statuses
+    except Exception as e:
+        logger.exception("Failed to read swap status")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/rag/documents")
+async def upsert_documents(data: Dict) -> Dict:
+    """
+    Embed and index documents: {"documents": [{"id", "text", "metadata"}]}.
+    """
+    try:
+        documents = data.get("documents")
+        if not documents:
+            raise ValueError("No documents provided")
+        written = await retrieval.upsert(documents)
+        return {"status": "success", "upserted": written, "total": len(vector_index)}
+    except Exception as e:
+        logger.exception("Document upsert failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/rag/documents/delete")
+async def delete_documents(data: Dict) -> Dict:
+    """
+    Remove documents from the index: {"ids": [...]}.
+    """
+    try:
+        removed = await retrieval.delete(data.get("ids", []))
+        return {"status": "success", "deleted": removed, "total": len(vector_index)}
+    except Exception as e:
+        logger.exception("Document delete failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/rag/search")
+async def search_documents(data: Dict) -> Dict:
+    """
+    Top-k retrieval: {"query", "k", "nprobe"}; nprobe=0 forces an exact scan.
+    """
+    try:
+        query = data.get("query")
+        if not query:
+            raise ValueError("No query provided")
+        hits = await retrieval.search(
+            query,
+            k=int(data.get("k", 10)),
+            nprobe=data.get("nprobe", settings.VECTOR_INDEX_NPROBE)
+        )
+        return {"status": "success", "results": hits}
+    except Exception as e:
+        logger.exception("Search failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/admin/rag/train", dependencies=[Depends(require_admin)])
+async def train_vector_index(data: Dict) -> Dict:
+    """
+    Train the IVF quantizer: {"nlist"}; defaults to sqrt(number of vectors).
+    """
+    try:
+        nlist = int(data.get("nlist") or max(1, int(len(vector_index) ** 0.5)))
+        await asyncio.to_thread(vector_index.train_ivf, nlist)
+        await asyncio.to_thread(vector_index.flush)
+        return {"status": "success", "nlist": nlist, "total": len(vector_index)}
+    except Exception as e:
+        logger.exception("Index training failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/admin/shape-buckets", dependencies=[Depends(require_admin)])
+async def shape_bucket_stats() -> Dict:
+    """
+    Per-model bucket hit rates, padding waste and build times of this worker.
+    """
+    return {name: executor.stats() for name, executor in bucketed_executors.items()}
+
+@app.post("/admin/autotune", dependencies=[Depends(require_admin)])
+async def autotune_model(data: Dict) -> Dict:
+    """
+    Re-measure a model on this device: {"model", "input_shape", "slo_ms"}.
+
+    ``input_shape`` is the shape of one input item (without the batch dimension) and
+    defaults to AUTOTUNE_INPUT_SHAPES. The result is stored and applied immediately;
+    other workers pick it up on their next start.
+    """
+    try:
+        model_name = data.get("model")
+        if model_name is None:
+            raise ValueError("No model provided")
+        shape = data.get("input_shape") or settings.AUTOTUNE_INPUT_SHAPES.get(model_name)
+        if shape is None:
+            raise ValueError(f"No input shape known for model '{model_name}'")
 
-        return {"status": "success", "output": output.cpu().tolist()}
+        device = model_registry.device
+        model = await asyncio.to_thread(model_registry.get, model_name)
+        result = await asyncio.to_thread(
+            autotuner.retune, model_name, model, torch.randn(1, *shape), device, data.get("slo_ms")
+        )
+        apply_tuning(result)
+        return {"status": "success", "tuning": vars(result)}
     except Exception as e:
-        logger.error(f"Model inference failed: {str(e)}")
+        logger.exception("Autotuning failed")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/admin/streams", dependencies=[Depends(require_admin)])
+async def stream_stats() -> Dict:
+    """
+    Get per-stream jobs, occupancy and the models assigned to each stream.
+    """
+    return stream_executor.stats()
+
+@app.get("/admin/results", dependencies=[Depends(require_admin)])
+async def result_store_stats() -> Dict:
+    """
+    Get the size and eviction counters of the result store.
+    """
+    try:
+        return await asyncio.to_thread(result_store.stats)
+    except Exception as e:
+        logger.exception("Result store stats failed")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/admin/profile/start", dependencies=[Depends(require_admin)])
+async def start_profiling(data: Dict) -> Dict:
+    """
+    Start profiling this worker.
+
+    Modes: "sampling" samples Python stacks for ``duration_s`` seconds, "torch" runs
+    torch.profiler around the next ``requests`` requests. Both enable hot-path timers.
+    """
+    try:
+        mode = data.get("mode", "sampling")
+        if mode == "sampling":
+            duration = min(float(data.get("duration_s", 30)), settings.PROFILE_MAX_DURATION_S)
+            interval = float(data.get("interval_ms", settings.PROFILE_SAMPLE_INTERVAL_MS)) / 1000
+            return profiling.start_sampling(duration, interval)
+        if mode == "torch":
+            return profiling.start_torch(int(data.get("requests", 10)))
+        raise ValueError(f"Unknown profiling mode: {mode}")
+    except ProfilerBusy as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except Exception as e:
+        logger.exception("Failed to start profiling")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/admin/profile/stop", dependencies=[Depends(require_admin)])
+async def stop_profiling() -> Dict:
+    """
+    Stop profiling and return the written trace files and hot-path timers.
+    """
+    try:
+        return {"traces": await profiling.stop(), "timers": profiling.timers.snapshot()}
+    except Exception as e:
+        logger.exception("Failed to stop profiling")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def profiling_status() -> Dict:
+    """
+    Get profiler state, hot-path timers and the traces available on disk.
+    """
+    return {**profiling.status(), "timers": profiling.timers.snapshot(), "logging": logging_stats()}
+
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=8000, access_log=False,
+                timeout_graceful_shutdown=int(settings.SHUTDOWN_GRACE_PERIOD_S))
\ No newline at end of file
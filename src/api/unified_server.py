@@ -4,9 +4,14 @@ import logging
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
-from prometheus_client import start_http_server
+from prometheus_client import start_http_server, CollectorRegistry, REGISTRY, multiprocess
 from src.core.monitoring.server import GPUMonitor
-from src.api.server import app as api_app
+from src.core.monitoring.history import MetricsHistory
+from src.api.config import settings
+from src.ml.model_host import run_model_host
+import multiprocessing
+import os
+import shutil
 import threading
 import time
 
@@ -14,32 +19,90 @@ import time
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+def setup_multiprocess_metrics():
+    """
+    Let every uvicorn worker write its metrics to a shared directory.
+
+    Must run before the workers are spawned; this process imported prometheus_client
+    earlier, so its own GPU metrics stay in memory and are served alongside.
+    """
+    metrics_dir = settings.AI_DATA_PATH / "prometheus_multiproc"
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    metrics_dir.mkdir(parents=True, exist_ok=True)
+    os.environ["PROMETHEUS_MULTIPROC_DIR"] = str(metrics_dir)
+
 def run_metrics_server(port: int = 8001):
     """Run the Prometheus metrics server."""
     try:
-        start_http_server(port)
-        monitor = GPUMonitor()
+        if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+
+        start_http_server(port, registry=registry)
+        monitor = GPUMonitor(
+            registry=registry,
+            latency_buckets=settings.METRICS_LATENCY_BUCKETS,
+            history=MetricsHistory(
+                settings.AI_DATA_PATH / "metrics_history",
+                max_series=settings.METRICS_HISTORY_MAX_SERIES,
+                resolutions=settings.METRICS_HISTORY_RESOLUTIONS
+            )
+        )
         logger.info(f"Metrics server started on port {port}")
         
         while True:
             monitor.collect_metrics()
+            monitor.run_latency_test()
+            monitor.record_history()
             time.sleep(1)
-    except Exception as e:
-        logger.error(f"Metrics server error: {e}")
+    except Exception:
+        logger.exception("Metrics server error")
         raise
 
+def start_model_host() -> multiprocessing.Process:
+    """Start the process that owns the models and GPUs for all API workers."""
+    ctx = multiprocessing.get_context("spawn")
+    host = ctx.Process(
+        target=run_model_host,
+        args=(
+            settings.MODEL_HOST_SHM_NAME,
+            settings.MODEL_HOST_SLOTS,
+            settings.MODEL_HOST_SLOT_MB,
+            settings.MODEL_CACHE_PATH,
+            settings.MODEL_BUILDERS,
+            settings.MAX_BATCH_SIZE,
+            settings.PIPELINE_MODELS,
+            settings.PIPELINE_MICRO_BATCHES
+        ),
+        name="model-host",
+        daemon=True
+    )
+    host.start()
+    logger.info(f"Started model host process (pid {host.pid})")
+    return host
+
 def main():
+    if settings.WORKERS > 1:
+        setup_multiprocess_metrics()
+
     # Start metrics server in a separate thread
     metrics_thread = threading.Thread(
         target=run_metrics_server,
-        args=(8001,),
+        args=(settings.METRICS_PORT,),
         daemon=True
     )
     metrics_thread.start()
     logger.info("Started metrics collection thread")
 
+    if settings.MODEL_HOST_ENABLED:
+        start_model_host()
+
     # Run the main API server
-    uvicorn.run(api_app, host="0.0.0.0", port=8000)
+    # Access records come from RequestLoggingMiddleware (sampled, off the event loop)
+    uvicorn.run("src.api.server:app", host="0.0.0.0", port=8000, workers=settings.WORKERS, access_log=False,
+                timeout_graceful_shutdown=int(settings.SHUTDOWN_GRACE_PERIOD_S))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
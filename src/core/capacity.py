@@ -0,0 +1,303 @@
+# src/core/capacity.py
+
+import heapq
+import itertools
+import json
+import math
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Deque, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+PROFILE_METRIC = "ai_inference_seconds"
+
+
+class LatencyProfile:
+    """
+    Empirical service-time distribution of one model, from a Prometheus histogram.
+
+    Samples are drawn by inverting the bucket CDF with linear interpolation inside
+    each bucket; the ``+Inf`` bucket is treated as extending the last finite bucket
+    by its own width.
+    """
+    def __init__(self, bounds: Sequence[float], cumulative: Sequence[float]):
+        finite = [(b, c) for b, c in zip(bounds, cumulative) if math.isfinite(b)]
+        if not finite or cumulative[-1] <= 0:
+            raise ValueError("Latency profile needs at least one observation")
+        self.bounds = [b for b, _ in finite]
+        self.cumulative = [c for _, c in finite]
+        if cumulative[-1] > self.cumulative[-1]:
+            width = self.bounds[-1] - (self.bounds[-2] if len(self.bounds) > 1 else 0.0)
+            self.bounds.append(self.bounds[-1] + width)
+            self.cumulative.append(cumulative[-1])
+
+        edges = np.array([0.0] + self.bounds)
+        cdf = np.array([0.0] + self.cumulative) / self.cumulative[-1]
+        # Drop empty buckets so the inverse CDF is strictly increasing
+        keep = np.concatenate([[True], np.diff(cdf) > 0])
+        self._edges, self._cdf = edges[keep], cdf[keep]
+
+    @property
+    def count(self) -> float:
+        return self.cumulative[-1]
+
+    def mean(self) -> float:
+        return float(np.sum(np.diff(self._cdf) * (self._edges[1:] + self._edges[:-1]) / 2))
+
+    def sample(self, rng: np.random.Generator, size: Optional[int] = None):
+        return np.interp(rng.random(size), self._cdf, self._edges)
+
+    def to_dict(self) -> Dict:
+        return {"bounds": self.bounds, "cumulative": self.cumulative}
+
+    @classmethod
+    def from_dict(cls, data: Dict) -> "LatencyProfile":
+        return cls(data["bounds"], data["cumulative"])
+
+
+def profiles_from_prometheus(text: str, metric: str = PROFILE_METRIC) -> Dict[str, LatencyProfile]:
+    """
+    Build one LatencyProfile per model from Prometheus exposition text.
+
+    Series of the same model on different devices are summed.
+    """
+    from prometheus_client.parser import text_string_to_metric_families
+
+    buckets: Dict[str, Dict[float, float]] = defaultdict(lambda: defaultdict(float))
+    for family in text_string_to_metric_families(text):
+        if family.name != metric:
+            continue
+        for sample in family.samples:
+            if sample.name == f"{metric}_bucket":
+                model = sample.labels.get("model", "default")
+                buckets[model][float(sample.labels["le"])] += sample.value
+
+    profiles = {}
+    for model, counts in buckets.items():
+        bounds = sorted(counts)
+        if counts[bounds[-1]] > 0:
+            profiles[model] = LatencyProfile(bounds, [counts[b] for b in bounds])
+    return profiles
+
+
+def save_profiles(profiles: Dict[str, LatencyProfile], path: Path):
+    with open(path, "w") as f:
+        json.dump({model: p.to_dict() for model, p in profiles.items()}, f, indent=2)
+
+
+def load_profiles(path: Path) -> Dict[str, LatencyProfile]:
+    with open(path) as f:
+        return {model: LatencyProfile.from_dict(data) for model, data in json.load(f).items()}
+
+
+def synthetic_trace(rate: float, duration_s: float, mix: Dict[str, float],
+                    burstiness: float = 1.0, seed: int = 0) -> List[Tuple[float, str]]:
+    """
+    Arrival trace of ``(timestamp, model)`` pairs.
+
+    Inter-arrival times are gamma distributed with mean ``1 / rate``; ``burstiness``
+    is their coefficient of variation (1.0 is Poisson, larger is burstier).
+    """
+    rng = np.random.default_rng(seed)
+    shape = 1 / burstiness ** 2
+    expected = int(rate * duration_s * 1.2) + 16
+    gaps = rng.gamma(shape, 1 / (rate * shape), expected)
+    times = np.cumsum(gaps)
+    while times[-1] < duration_s:
+        times = np.concatenate([times, times[-1] + np.cumsum(rng.gamma(shape, 1 / (rate * shape), expected))])
+    times = times[times < duration_s]
+
+    models = list(mix)
+    weights = np.array([mix[m] for m in models], dtype=float)
+    choices = rng.choice(len(models), size=len(times), p=weights / weights.sum())
+    return [(float(t), models[c]) for t, c in zip(times, choices)]
+
+
+def load_trace(path: Path) -> List[Tuple[float, str]]:
+    """
+    Read a recorded trace: JSON lines with ``timestamp`` (seconds) and ``model``.
+
+    Timestamps are shifted so the trace starts at zero.
+    """
+    trace = []
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                trace.append((float(record["timestamp"]), record.get("model", "default")))
+    trace.sort()
+    start = trace[0][0] if trace else 0.0
+    return [(t - start, model) for t, model in trace]
+
+
+@dataclass
+class ServingConfig:
+    """Data class for the simulated serving stack"""
+    workers: int = 4  # uvicorn worker processes
+    devices: int = 1  # Devices shared by all workers; one batch runs per device at a time
+    max_batch_size: int = 32
+    max_wait_ms: float = 2.0
+    max_concurrent: int = 4  # DeadlineScheduler slots per worker
+    max_in_flight: int = 1  # DynamicBatcher batches running at once per model and worker
+    batch_scaling: float = 0.3  # Batch of b takes sample * b ** batch_scaling
+    deadline_s: Optional[float] = None  # Drop requests still waiting for a slot after this
+
+
+@dataclass
+class _Request:
+    arrival: float
+    model: str
+    worker: int
+    service_start: float = 0.0
+
+
+@dataclass
+class _Batcher:
+    queue: List[_Request] = field(default_factory=list)
+    timer_seq: Optional[int] = None  # Sequence number of the pending flush event
+    running: int = 0  # Batches started and not yet done, at most max_in_flight
+
+
+class CapacitySimulator:
+    """
+    Discrete-event model of the serving stack.
+
+    Requests are spread over workers; each worker admits at most ``max_concurrent``
+    requests (the DeadlineScheduler) and batches them per model (DynamicBatcher:
+    flush at ``max_batch_size`` or after ``max_wait_ms``). As in DynamicBatcher, at
+    most ``max_in_flight`` batches per model run at once; requests arriving while
+    they are all busy keep collecting and go out together, up to ``max_batch_size``,
+    when one finishes. Batches wait for a free device, and their service time is drawn
+    from the model's measured profile and scaled by batch size. Pure Python and
+    NumPy; 100k requests simulate in about a second on CPU.
+    """
+    def __init__(self, profiles: Dict[str, LatencyProfile], config: ServingConfig, seed: int = 0):
+        self.profiles = profiles
+        self.config = config
+        self.rng = np.random.default_rng(seed)
+
+    def run(self, trace: List[Tuple[float, str]]) -> Dict:
+        cfg = self.config
+        events: List[Tuple[float, int, str, tuple]] = []
+        seq = itertools.count()
+
+        def push(time: float, kind: str, *args):
+            heapq.heappush(events, (time, next(seq), kind, args))
+
+        active = [0] * cfg.workers
+        waiting: List[Deque[_Request]] = [deque() for _ in range(cfg.workers)]
+        batchers: Dict[Tuple[int, str], _Batcher] = defaultdict(_Batcher)
+        device_queue: Deque[Tuple[int, str, List[_Request]]] = deque()
+        free_devices = cfg.devices
+        device_busy_time = 0.0
+
+        latencies, queue_delays, batch_sizes = [], [], []
+        per_model: Dict[str, List[float]] = defaultdict(list)
+        dropped = 0
+        last_time = 0.0
+
+        for i, (timestamp, model) in enumerate(trace):
+            if model not in self.profiles:
+                raise KeyError(f"No latency profile for model '{model}'")
+            push(timestamp, "arrival", _Request(timestamp, model, i % cfg.workers))
+
+        def start_batches(now: float):
+            nonlocal free_devices, device_busy_time
+            while free_devices and device_queue:
+                worker, model, batch = device_queue.popleft()
+                free_devices -= 1
+                service = float(self.profiles[model].sample(self.rng)) * len(batch) ** cfg.batch_scaling
+                device_busy_time += service
+                for request in batch:
+                    request.service_start = now
+                push(now + service, "done", worker, model, batch)
+
+        def flush(now: float, worker: int, model: str):
+            batcher = batchers[(worker, model)]
+            batcher.timer_seq = None
+            # Whatever cannot start now is flushed when a running batch finishes
+            while batcher.queue and batcher.running < cfg.max_in_flight:
+                batch = batcher.queue[:cfg.max_batch_size]
+                del batcher.queue[:cfg.max_batch_size]
+                batcher.running += 1
+                batch_sizes.append(len(batch))
+                device_queue.append((worker, model, batch))
+            start_batches(now)
+
+        def admit(now: float, request: _Request):
+            active[request.worker] += 1
+            batcher = batchers[(request.worker, request.model)]
+            batcher.queue.append(request)
+            if len(batcher.queue) >= cfg.max_batch_size:
+                flush(now, request.worker, request.model)
+            elif batcher.timer_seq is None:
+                batcher.timer_seq = next(seq)
+                push(now + cfg.max_wait_ms / 1000, "flush", request.worker, request.model, batcher.timer_seq)
+
+        while events:
+            now, _, kind, args = heapq.heappop(events)
+            last_time = now
+
+            if kind == "arrival":
+                request = args[0]
+                if active[request.worker] < cfg.max_concurrent:
+                    admit(now, request)
+                else:
+                    waiting[request.worker].append(request)
+
+            elif kind == "flush":
+                worker, model, timer_seq = args
+                if batchers[(worker, model)].timer_seq == timer_seq:
+                    flush(now, worker, model)
+
+            elif kind == "done":
+                worker, model, batch = args
+                free_devices += 1
+                for request in batch:
+                    latencies.append(now - request.arrival)
+                    queue_delays.append(request.service_start - request.arrival)
+                    per_model[model].append(now - request.arrival)
+                active[worker] -= len(batch)
+
+                batcher = batchers[(worker, model)]
+                batcher.running -= 1
+                if batcher.queue:
+                    flush(now, worker, model)
+
+                while waiting[worker] and active[worker] < cfg.max_concurrent:
+                    request = waiting[worker].popleft()
+                    if cfg.deadline_s is not None and now - request.arrival > cfg.deadline_s:
+                        dropped += 1
+                        continue
+                    admit(now, request)
+                start_batches(now)
+
+        return self._summarize(trace, latencies, queue_delays, batch_sizes, per_model,
+                               dropped, device_busy_time, last_time)
+
+    def _summarize(self, trace, latencies, queue_delays, batch_sizes, per_model, dropped,
+                   device_busy_time, last_time) -> Dict:
+        duration = max(last_time, trace[-1][0] if trace else 0.0) or 1.0
+        completed = sum(len(values) for values in per_model.values())
+        latencies = np.array(latencies) if latencies else np.zeros(1)
+        queue_delays = np.array(queue_delays) if queue_delays else np.zeros(1)
+
+        def ms(values, q):
+            return round(float(np.percentile(values, q)) * 1000, 3)
+
+        return {
+            "config": vars(self.config),
+            "requests": len(trace),
+            "completed": completed,
+            "dropped": dropped,
+            "throughput_rps": round(completed / duration, 2),
+            "device_utilization": round(device_busy_time / (duration * self.config.devices), 4),
+            "mean_batch_size": round(float(np.mean(batch_sizes)), 2) if batch_sizes else 0.0,
+            "latency_ms": {"p50": ms(latencies, 50), "p95": ms(latencies, 95), "p99": ms(latencies, 99)},
+            "queue_delay_ms": {"mean": round(float(queue_delays.mean()) * 1000, 3),
+                               "p99": ms(queue_delays, 99)},
+            "models": {model: {"completed": len(values), "p99_ms": ms(values, 99)}
+                       for model, values in per_model.items()}
+        }
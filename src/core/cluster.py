@@ -0,0 +1,246 @@
+# src/core/cluster.py
+
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+NODE_SET_KEY = "ai:nodes"
+NODE_KEY_PREFIX = "ai:node:"
+COMMAND_CHANNEL_PREFIX = "ai:commands:"
+COMMAND_STATUS_PREFIX = "ai:command-status:"
+
+
+@dataclass
+class NodeHeartbeat:
+    """Data class for the load report of one server worker"""
+    node_id: str
+    url: str  # Base URL the router forwards to
+    free_memory_mb: float  # Free device memory (host memory on CPU nodes)
+    queue_depth: int  # Jobs waiting or running in the worker's scheduler
+    resident_models: List[str] = field(default_factory=list)
+    draining: bool = False  # Node is shutting down or swapping models; avoid it
+    timestamp: float = 0.0
+
+
+@dataclass
+class NodeState:
+    """Data class for one node, aggregated over the heartbeats of its workers"""
+    node_id: str
+    url: str
+    free_memory_mb: float
+    queue_depth: int
+    resident_models: List[str]
+    draining: bool
+    workers: int
+    age_s: float  # Age of the oldest contributing heartbeat
+
+
+def redis_from_settings(settings):
+    """Async Redis client for the configured Redis server."""
+    import redis.asyncio as aioredis
+    return aioredis.Redis(
+        host=settings.REDIS_HOST,
+        port=settings.REDIS_PORT,
+        password=settings.REDIS_PASSWORD.get_secret_value(),
+        ssl=settings.REDIS_TLS_ENABLED,
+        db=settings.REDIS_DB
+    )
+
+
+class HeartbeatPublisher:
+    """
+    Periodically publishes this worker's load to Redis.
+
+    Each uvicorn worker writes its own key ``ai:node:<node>:<pid>`` with a TTL, so a
+    crashed worker or node disappears from the directory on its own; the node ID is
+    also added to the ``ai:nodes`` set for discovery. While any reason to drain is
+    set (shutdown, a model swap) the heartbeat says so and routers avoid the node.
+    """
+    def __init__(self, redis_client, node_id: str, url: str,
+                 collect: Callable[[], Awaitable[Dict]], interval_s: float = 1.0,
+                 ttl_s: float = 5.0, log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.redis = redis_client
+        self.node_id = node_id
+        self.url = url
+        self.collect = collect
+        self.interval_s = interval_s
+        self.ttl_s = ttl_s
+        self.key = f"{NODE_KEY_PREFIX}{node_id}:{os.getpid()}"
+        self._task: Optional[asyncio.Task] = None
+        self._drain_reasons: Set[str] = set()
+
+    @property
+    def draining(self) -> bool:
+        return bool(self._drain_reasons)
+
+    async def set_draining(self, reason: str, draining: bool = True):
+        """Start (or end) draining for ``reason`` and publish the change right away."""
+        if draining:
+            self._drain_reasons.add(reason)
+        else:
+            self._drain_reasons.discard(reason)
+        try:
+            await self.publish()
+        except Exception:
+            self.logger.exception("Heartbeat publish failed")
+
+    async def publish(self):
+        load = await self.collect()
+        heartbeat = NodeHeartbeat(node_id=self.node_id, url=self.url, draining=self.draining,
+                                  timestamp=time.time(), **load)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.set(self.key, json.dumps(asdict(heartbeat)), px=int(self.ttl_s * 1000))
+            pipe.sadd(NODE_SET_KEY, self.node_id)
+            await pipe.execute()
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.publish()
+            except Exception:
+                self.logger.exception("Heartbeat publish failed")
+            await asyncio.sleep(self.interval_s)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        """Stop publishing and remove this worker's heartbeat right away."""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        try:
+            await self.redis.delete(self.key)
+        except Exception:
+            self.logger.exception("Heartbeat removal failed")
+
+
+class NodeDirectory:
+    """Reads the live nodes and their load from the heartbeats in Redis."""
+    def __init__(self, redis_client, log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+        self.redis = redis_client
+
+    async def nodes(self) -> List[NodeState]:
+        node_ids = [n.decode() if isinstance(n, bytes) else n
+                    for n in await self.redis.smembers(NODE_SET_KEY)]
+        now = time.time()
+        states = []
+        for node_id in node_ids:
+            keys = [key async for key in self.redis.scan_iter(match=f"{NODE_KEY_PREFIX}{node_id}:*")]
+            values = await self.redis.mget(keys) if keys else []
+            beats = [NodeHeartbeat(**json.loads(v)) for v in values if v is not None]
+            if not beats:
+                # Every worker's heartbeat expired: forget the node
+                await self.redis.srem(NODE_SET_KEY, node_id)
+                continue
+
+            models = sorted({model for beat in beats for model in beat.resident_models})
+            states.append(NodeState(
+                node_id=node_id,
+                url=beats[0].url,
+                # Workers share the devices, so the tightest report is the node's headroom
+                free_memory_mb=min(beat.free_memory_mb for beat in beats),
+                queue_depth=sum(beat.queue_depth for beat in beats),
+                resident_models=models,
+                draining=any(beat.draining for beat in beats),
+                workers=len(beats),
+                age_s=now - min(beat.timestamp for beat in beats)
+            ))
+        return states
+
+
+class WorkerCommands:
+    """
+    Delivers admin commands to every uvicorn worker of a node over Redis pub/sub.
+
+    An admin call lands on one worker; publishing it on the node's channel makes all
+    workers (the receiving one included) run the handler registered for it. Workers
+    report per-command state into a Redis hash so any of them can answer status
+    queries for the whole node.
+    """
+    def __init__(self, redis_client, node_id: str, status_ttl_s: float = 86400.0,
+                 log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.redis = redis_client
+        self.channel = f"{COMMAND_CHANNEL_PREFIX}{node_id}"
+        self.status_prefix = f"{COMMAND_STATUS_PREFIX}{node_id}:"
+        self.status_ttl_s = status_ttl_s
+        self.worker = str(os.getpid())
+        self._handlers: Dict[str, Callable[[Dict], Awaitable[Any]]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self._subscribed = asyncio.Event()
+
+    def on(self, command: str, handler: Callable[[Dict], Awaitable[Any]]):
+        """Run ``handler(payload)`` in this worker whenever ``command`` is published."""
+        self._handlers[command] = handler
+
+    async def publish(self, command: str, payload: Dict) -> int:
+        """
+        Send a command to every worker of the node.
+
+        Returns:
+            Number of workers that received it
+        """
+        return await self.redis.publish(self.channel, json.dumps({"command": command, "payload": payload}))
+
+    async def report(self, name: str, status: Dict):
+        """Record this worker's state for ``name`` (e.g. a model being swapped)."""
+        key = f"{self.status_prefix}{name}"
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, self.worker, json.dumps(status))
+            pipe.expire(key, int(self.status_ttl_s))
+            await pipe.execute()
+
+    async def statuses(self, name: str) -> Dict[str, Dict]:
+        """State reported for ``name`` by every worker, keyed by worker PID."""
+        values = await self.redis.hgetall(f"{self.status_prefix}{name}")
+        return {(k.decode() if isinstance(k, bytes) else k): json.loads(v) for k, v in values.items()}
+
+    async def _dispatch(self, message: Dict):
+        handler = self._handlers.get(message.get("command"))
+        if handler is None:
+            self.logger.warning(f"No handler for worker command {message.get('command')!r}")
+            return
+        try:
+            await handler(message.get("payload", {}))
+        except Exception:
+            self.logger.exception(f"Worker command {message.get('command')!r} failed")
+
+    async def _loop(self):
+        while True:
+            try:
+                async with self.redis.pubsub() as pubsub:
+                    await pubsub.subscribe(self.channel)
+                    self._subscribed.set()
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            asyncio.get_running_loop().create_task(self._dispatch(json.loads(message["data"])))
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.logger.exception("Worker command subscription failed, resubscribing")
+                self._subscribed.clear()
+                await asyncio.sleep(1.0)
+
+    async def start(self, timeout: float = 5.0):
+        """Subscribe to the node's channel; returns once commands can be received."""
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+        await asyncio.wait_for(self._subscribed.wait(), timeout)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
@@ -0,0 +1,199 @@
+# src/core/gpu/streams.py
+
+import asyncio
+import contextvars
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Any, Callable, Dict, List, Optional
+
+import torch
+
+try:
+    import cv2
+except ImportError:
+    cv2 = None
+
+
+def _cuda_tensors(value) -> List[torch.Tensor]:
+    """CUDA tensors in a job's arguments (nested lists, tuples and dicts included)."""
+    if isinstance(value, torch.Tensor):
+        return [value] if value.is_cuda else []
+    if isinstance(value, (list, tuple)):
+        return [t for item in value for t in _cuda_tensors(item)]
+    if isinstance(value, dict):
+        return [t for item in value.values() for t in _cuda_tensors(item)]
+    return []
+
+
+class StreamLane:
+    """
+    One execution lane: a CUDA stream (plus an OpenCV stream for image operations)
+    and the thread that issues work to it.
+
+    On CPU devices both streams are None and the lane is just a thread, so the same
+    scheduling runs without a GPU.
+    """
+    def __init__(self, index: int, device: torch.device):
+        self.index = index
+        self.name = f"{device}:{index}"
+        self.device = device
+        self.stream = torch.cuda.Stream(device) if device.type == "cuda" else None
+        self.cv_stream = cv2.cuda_Stream() if device.type == "cuda" and cv2 is not None else None
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"stream-{index}")
+
+        self.inflight = 0
+        self.jobs = 0
+        self.busy_s = 0.0
+        self.keys: List[str] = []
+
+    def context(self):
+        """Make this lane's stream current for torch work issued by the calling thread."""
+        return torch.cuda.stream(self.stream) if self.stream is not None else nullcontext()
+
+    def adopt(self, producer: Optional[torch.cuda.Stream], tensors: List[torch.Tensor]):
+        """
+        Order this lane after ``producer`` (the stream its inputs were written on) and
+        mark the input tensors as used here, so the caching allocator doesn't hand their
+        memory to other work while this lane may still read it.
+        """
+        if self.stream is None:
+            return
+        if producer is not None:
+            self.stream.wait_stream(producer)
+        for tensor in tensors:
+            tensor.record_stream(self.stream)
+
+    def synchronize(self):
+        """Wait for this lane's work only, not for the whole device."""
+        if self.stream is not None:
+            self.stream.synchronize()
+        if self.cv_stream is not None:
+            self.cv_stream.waitForCompletion()
+
+
+class StreamExecutor:
+    """
+    Runs independent GPU jobs on separate CUDA streams so they overlap.
+
+    Work with a key (a model, a task) always lands on the same lane, which keeps it
+    ordered and gives each model its own stream; keys are spread over the lanes as
+    they first appear. Keyless jobs take the least busy lane. Each job runs with its
+    lane's stream current (the OpenCV stream is passed in for ``cv2.cuda`` calls) and
+    the lane is synchronized when the job returns, which is the only point the
+    caller waits: at the response boundary, never device-wide.
+
+    Occupancy (jobs, in-flight count and busy time per lane) is exported through the
+    metrics object when one is given. Busy time runs from job start to stream
+    completion, so it includes host-side launch time.
+    """
+    def __init__(self, device: torch.device, num_streams: int = 4, metrics=None,
+                 log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.device = torch.device(device)
+        self.lanes = [StreamLane(i, self.device) for i in range(num_streams)]
+        self.metrics = metrics
+        self._assigned: Dict[str, StreamLane] = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    def lane_for(self, key: Optional[str] = None) -> StreamLane:
+        with self._lock:
+            if key is None:
+                return min(self.lanes, key=lambda lane: lane.inflight)
+            lane = self._assigned.get(key)
+            if lane is None:
+                lane = min(self.lanes, key=lambda lane: (len(lane.keys), lane.inflight))
+                lane.keys.append(key)
+                self._assigned[key] = lane
+            return lane
+
+    def _begin(self, lane: StreamLane):
+        with self._lock:
+            lane.inflight += 1
+        if self.metrics is not None:
+            self.metrics.stream_inflight.labels(stream=lane.name).inc()
+
+    def _end(self, lane: StreamLane, busy_s: Optional[float]):
+        """Account a finished job; ``busy_s`` is None for a job cancelled before it ran."""
+        with self._lock:
+            lane.inflight -= 1
+            if busy_s is not None:
+                lane.jobs += 1
+                lane.busy_s += busy_s
+        if self.metrics is not None:
+            self.metrics.stream_inflight.labels(stream=lane.name).dec()
+            if busy_s is not None:
+                self.metrics.observe_stream(lane.name, busy_s)
+
+    def _producer(self) -> Optional[torch.cuda.Stream]:
+        """The calling thread's current stream, which queued the job's inputs."""
+        return torch.cuda.current_stream(self.device) if self.device.type == "cuda" else None
+
+    def _execute(self, lane: StreamLane, producer: Optional[torch.cuda.Stream],
+                 fn: Callable, *args) -> Any:
+        start = time.perf_counter()
+        try:
+            lane.adopt(producer, _cuda_tensors(args))
+            with lane.context():
+                result = fn(*args)
+            lane.synchronize()
+            return result
+        finally:
+            self._end(lane, time.perf_counter() - start)
+
+    async def run(self, fn: Callable[[StreamLane], Any], key: Optional[str] = None) -> Any:
+        """
+        Run ``fn(lane)`` on a lane's thread and stream and wait for its results.
+
+        Args:
+            fn: Job; receives the lane for its ``cv_stream``
+            key: Affinity key (model or task name); keyless jobs take the least busy lane
+
+        Returns:
+            The job's return value, with all of its stream work complete
+        """
+        lane = self.lane_for(key)
+        self._begin(lane)
+        # Carry request context (log fields, phase timers) into the lane thread
+        context = contextvars.copy_context()
+        future = lane.executor.submit(context.run, self._execute, lane, self._producer(), fn, lane)
+        # Cancelled while still queued behind the lane's previous job: it never runs
+        future.add_done_callback(lambda f: self._end(lane, None) if f.cancelled() else None)
+        return await asyncio.wrap_future(future)
+
+    def wrap(self, key: str, fn: Callable) -> Callable:
+        """
+        Bind a function that already has its own thread (e.g. a batcher's batch
+        function) to the lane of ``key``: it runs with that lane's stream current.
+        """
+        lane = self.lane_for(key)
+
+        def run(*args):
+            self._begin(lane)
+            return self._execute(lane, self._producer(), fn, *args)
+        return run
+
+    def stats(self) -> Dict:
+        """Per-lane jobs, in-flight count, assigned keys and occupancy."""
+        elapsed = time.perf_counter() - self._started
+        with self._lock:
+            return {
+                "device": str(self.device),
+                "streams": [
+                    {
+                        "stream": lane.name,
+                        "cuda": lane.stream is not None,
+                        "jobs": lane.jobs,
+                        "inflight": lane.inflight,
+                        "busy_s": round(lane.busy_s, 4),
+                        "occupancy": round(lane.busy_s / elapsed, 4) if elapsed else 0.0,
+                        "keys": list(lane.keys)
+                    }
+                    for lane in self.lanes
+                ]
+            }
@@ -0,0 +1,230 @@
+# src/core/monitoring/history.py
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# (resolution seconds, slots): 1 h of 1 s samples, 6 h of 10 s, 24 h of 1 min
+DEFAULT_RESOLUTIONS = ((1, 3600), (10, 2160), (60, 1440))
+
+# Aggregate columns stored per slot and series
+MIN, MAX, SUM, COUNT = range(4)
+
+
+class MetricsHistory:
+    """
+    Fixed-size, multi-resolution ring buffers of metric samples.
+
+    Every resolution keeps ``slots`` buckets of ``(min, max, sum, count)`` per series in
+    a float32 memory map, plus the absolute bucket number each slot currently holds.
+    A sample is folded into the current bucket of every resolution, so downsampling
+    costs nothing at query time and memory never grows. Slots are reused when their
+    bucket number changes, which also makes gaps (e.g. a restart) read as empty.
+
+    The collector process writes; API workers open the same files read-only, so the
+    history survives a Prometheus outage and can be queried from any worker.
+    """
+    def __init__(self, root: Path, max_series: int = 128,
+                 resolutions: Sequence[Sequence[int]] = DEFAULT_RESOLUTIONS,
+                 readonly: bool = False, log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.root = Path(root)
+        self.readonly = readonly
+        self.meta_path = self.root / "meta.json"
+        self.series_path = self.root / "series.json"
+        self._lock = threading.Lock()
+
+        if readonly:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            max_series, resolutions = meta["max_series"], meta["resolutions"]
+        else:
+            self.root.mkdir(parents=True, exist_ok=True)
+
+        self.max_series = max_series
+        self.resolutions: List[Tuple[int, int]] = sorted((int(r), int(n)) for r, n in resolutions)
+        self._open()
+
+    def _open(self):
+        meta = {"max_series": self.max_series, "resolutions": [list(r) for r in self.resolutions]}
+        fresh = not self.readonly and (not self.meta_path.exists() or self._read_json(self.meta_path) != meta)
+        mode = "r" if self.readonly else ("w+" if fresh else "r+")
+
+        self.values: Dict[int, np.memmap] = {}
+        self.buckets: Dict[int, np.memmap] = {}
+        for resolution, slots in self.resolutions:
+            self.values[resolution] = np.memmap(self.root / f"res_{resolution}s.f32", dtype=np.float32,
+                                                mode=mode, shape=(slots, self.max_series, 4))
+            self.buckets[resolution] = np.memmap(self.root / f"res_{resolution}s.ids", dtype=np.int64,
+                                                 mode=mode, shape=(slots,))
+            if fresh:
+                self.buckets[resolution][:] = -1
+
+        if fresh:
+            self._write_json(self.series_path, {})
+            self._write_json(self.meta_path, meta)
+            self.logger.info(f"Created metrics history in {self.root} ({self.nbytes / 1e6:.1f}MB)")
+        self._series: Dict[str, int] = self._read_json(self.series_path)
+        self._series_mtime = self._mtime()
+
+    @staticmethod
+    def _read_json(path: Path):
+        if not path.exists():
+            return {}
+        with open(path) as f:
+            return json.load(f)
+
+    def _write_json(self, path: Path, data):
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_name, path)
+
+    def _mtime(self) -> float:
+        return self.series_path.stat().st_mtime if self.series_path.exists() else 0.0
+
+    @property
+    def nbytes(self) -> int:
+        return sum(v.nbytes + self.buckets[r].nbytes for r, v in self.values.items())
+
+    def series(self) -> List[str]:
+        """Names of all recorded series."""
+        if self.readonly and self._mtime() != self._series_mtime:
+            self._series = self._read_json(self.series_path)
+            self._series_mtime = self._mtime()
+        return list(self._series)
+
+    def _columns(self, names: List[str]) -> np.ndarray:
+        added = False
+        for name in names:
+            if name not in self._series:
+                if len(self._series) >= self.max_series:
+                    continue
+                self._series[name] = len(self._series)
+                added = True
+        if added:
+            self._write_json(self.series_path, self._series)
+        return np.array([self._series.get(name, -1) for name in names], dtype=np.int64)
+
+    def record(self, samples: Dict[str, float], timestamp: Optional[float] = None):
+        """
+        Fold one sample per series into every resolution.
+
+        Series beyond ``max_series`` are ignored (and logged once).
+        """
+        if self.readonly:
+            raise RuntimeError("Metrics history is open read-only")
+        if not samples:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+
+        with self._lock:
+            columns = self._columns(list(samples))
+            values = np.fromiter(samples.values(), dtype=np.float32, count=len(samples))
+            kept = columns >= 0
+            if not kept.all() and not getattr(self, "_warned_full", False):
+                self.logger.warning(f"Metrics history is full ({self.max_series} series), dropping new series")
+                self._warned_full = True
+            columns, values = columns[kept], values[kept]
+
+            for resolution, slots in self.resolutions:
+                bucket = int(timestamp // resolution)
+                slot = bucket % slots
+                row = self.values[resolution][slot]
+                if self.buckets[resolution][slot] != bucket:
+                    row[:, MIN] = np.inf
+                    row[:, MAX] = -np.inf
+                    row[:, SUM] = 0
+                    row[:, COUNT] = 0
+                    self.buckets[resolution][slot] = bucket
+                row[columns, MIN] = np.minimum(row[columns, MIN], values)
+                row[columns, MAX] = np.maximum(row[columns, MAX], values)
+                row[columns, SUM] += values
+                row[columns, COUNT] += 1
+
+    def flush(self):
+        for resolution in self.values:
+            self.values[resolution].flush()
+            self.buckets[resolution].flush()
+
+    def _pick_resolution(self, window_s: float) -> Tuple[int, int]:
+        """Finest resolution whose ring still covers the whole window."""
+        for resolution, slots in self.resolutions:
+            if resolution * slots >= window_s:
+                return resolution, slots
+        return self.resolutions[-1]
+
+    def query(self, window_s: float = 300, pattern: Optional[str] = None,
+              percentiles: Sequence[float] = (50, 90, 99), resolution: Optional[int] = None,
+              points: bool = False, now: Optional[float] = None) -> Dict:
+        """
+        Summarize the last ``window_s`` seconds of every series matching ``pattern``.
+
+        Args:
+            window_s: Window length in seconds
+            pattern: Regular expression on series names; all series when omitted
+            percentiles: Percentiles of the per-bucket averages
+            resolution: Force a resolution in seconds instead of picking the finest
+            points: Also return ``[timestamp, min, avg, max]`` per bucket
+
+        Returns:
+            Dictionary with the resolution used and per-series statistics
+
+        Raises:
+            ValueError: If the window, pattern or resolution is invalid
+        """
+        if window_s <= 0:
+            raise ValueError("Window must be positive")
+        try:
+            regex = re.compile(pattern) if pattern else None
+        except re.error as e:
+            raise ValueError(f"Invalid series pattern '{pattern}': {e}")
+        if resolution is None:
+            resolution, _ = self._pick_resolution(window_s)
+        elif resolution not in self.values:
+            raise ValueError(f"Unknown resolution {resolution}s, expected one of {sorted(self.values)}")
+
+        now = time.time() if now is None else now
+
+        first, last = int((now - window_s) // resolution) + 1, int(now // resolution)
+        buckets = np.asarray(self.buckets[resolution])
+        in_window = np.nonzero((buckets >= first) & (buckets <= last))[0]
+        in_window = in_window[np.argsort(buckets[in_window])]
+        data = np.asarray(self.values[resolution][in_window])  # (buckets, series, 4)
+        timestamps = buckets[in_window] * resolution
+
+        result = {}
+        for name in self.series():
+            if regex is not None and not regex.search(name):
+                continue
+            column = data[:, self._series[name]]
+            present = column[:, COUNT] > 0
+            if not present.any():
+                continue
+            column = column[present]
+            averages = column[:, SUM] / column[:, COUNT]
+            stats = {
+                "min": float(column[:, MIN].min()),
+                "max": float(column[:, MAX].max()),
+                "avg": float(column[:, SUM].sum() / column[:, COUNT].sum()),
+                "samples": int(column[:, COUNT].sum())
+            }
+            for p, value in zip(percentiles, np.percentile(averages, percentiles)):
+                stats[f"p{p:g}"] = float(value)
+            if points:
+                stats["points"] = np.column_stack([
+                    timestamps[present], column[:, MIN], averages, column[:, MAX]
+                ]).round(4).tolist()
+            result[name] = stats
+
+        return {"window_s": window_s, "resolution_s": resolution, "series": result}
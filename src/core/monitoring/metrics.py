@@ -1,24 +1,88 @@
 # src/core/metrics.py
 
 import prometheus_client as prom
-from typing import Dict
+from typing import Dict, Optional, Sequence
 import time
 
+from src.utils.structured_logging import current_request
+
+# Request latency buckets in seconds, dense around the interactive SLO range
+DEFAULT_LATENCY_BUCKETS = (.005, .01, .025, .05, .075, .1, .15, .25, .5, .75, 1.0, 2.5, 5.0)
+DEFAULT_TASK_BUCKETS = (.1, .5, 1.0, 2.5, 5.0, 7.5, 10.0, 15.0, 30.0)
+# Batch execution buckets in seconds, wider than per-request latency
+DEFAULT_BATCH_BUCKETS = (.01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+def _exemplar(request_id: Optional[str]) -> Optional[Dict[str, str]]:
+    """
+    Exemplar for a sample, defaulting to the ID of the request being handled.
+
+    Only a single worker (WORKERS=1, in-memory registry) exposes exemplars:
+    prometheus_client's multiprocess mode, used when WORKERS > 1, does not store
+    them and silently drops every one.
+    """
+    if request_id is None:
+        request = current_request()
+        request_id = request.get('request_id') if request else None
+    return {'request_id': request_id} if request_id else None
+
 class AIServerMetrics:
-    def __init__(self):
+    def __init__(self, registry: prom.CollectorRegistry = prom.REGISTRY,
+                 latency_buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+                 task_buckets: Sequence[float] = DEFAULT_TASK_BUCKETS,
+                 batch_buckets: Sequence[float] = DEFAULT_BATCH_BUCKETS):
         # Task Metrics
-        self.active_tasks = prom.Gauge('ai_active_tasks', 'Currently running AI tasks')
+        self.active_tasks = prom.Gauge('ai_active_tasks', 'Currently running AI tasks',
+            multiprocess_mode='livesum', registry=registry)
         self.task_duration = prom.Histogram('ai_task_duration_seconds', 'Task processing time',
-            buckets=[.1, .5, 1.0, 2.5, 5.0, 7.5, 10.0, 15.0, 30.0])
-        
+            buckets=task_buckets, registry=registry)
+
         # Storage Metrics
-        self.storage_usage = prom.Gauge('ai_storage_usage_bytes', 'Storage space used')
-        self.model_cache_size = prom.Gauge('ai_model_cache_bytes', 'Model cache size')
-        
+        self.storage_usage = prom.Gauge('ai_storage_usage_bytes', 'Storage space used',
+            multiprocess_mode='max', registry=registry)
+        self.model_cache_size = prom.Gauge('ai_model_cache_bytes', 'Model cache size',
+            multiprocess_mode='max', registry=registry)
+
+        # Scheduling Metrics
+        self.scheduler_queue_depth = prom.Gauge('ai_scheduler_queue_depth', 'Jobs waiting for an execution slot',
+            multiprocess_mode='livesum', registry=registry)
+        self.scheduler_dropped = prom.Counter('ai_scheduler_dropped_total', 'Jobs dropped before completion',
+            ['reason'], registry=registry)
+
+        # Stream Metrics (occupancy of each execution stream, see StreamExecutor)
+        self.stream_busy = prom.Counter('ai_stream_busy_seconds', 'Time each stream spent running jobs',
+            ['stream'], registry=registry)
+        self.stream_jobs = prom.Counter('ai_stream_jobs', 'Jobs completed on each stream',
+            ['stream'], registry=registry)
+        self.stream_inflight = prom.Gauge('ai_stream_inflight', 'Jobs queued or running on each stream',
+            ['stream'], multiprocess_mode='livesum', registry=registry)
+
         # Performance Metrics
         self.inference_time = prom.Histogram('ai_inference_seconds', 'Model inference time',
-            buckets=[.01, .05, .1, .25, .5, .75, 1.0])
-        
+            ['model', 'device'], buckets=latency_buckets, registry=registry)
+        self.batch_processing_time = prom.Histogram('ai_batch_processing_seconds', 'Batch Processing Time in seconds',
+            ['model'], buckets=batch_buckets, registry=registry)
+
+    def observe_inference(self, model: str, device: str, seconds: float,
+                          request_id: Optional[str] = None):
+        """
+        Record one inference, with the request ID (by default the current request's,
+        set by the request logging middleware) as an exemplar.
+
+        Exemplars are only exposed in the OpenMetrics format, which Prometheus
+        negotiates automatically when exemplar storage is enabled, and only with a
+        single worker (multiprocess mode drops them, see ``_exemplar``).
+        """
+        self.inference_time.labels(model=model, device=device).observe(seconds, exemplar=_exemplar(request_id))
+
+    def observe_batch(self, model: str, seconds: float, request_id: Optional[str] = None):
+        """Record one batch execution (see DynamicBatcher), with a request ID exemplar (single worker only)."""
+        self.batch_processing_time.labels(model=model).observe(seconds, exemplar=_exemplar(request_id))
+
+    def observe_stream(self, stream: str, seconds: float):
+        """Record one job completed on an execution stream."""
+        self.stream_busy.labels(stream=stream).inc(seconds)
+        self.stream_jobs.labels(stream=stream).inc()
+
     def track_task(self, func):
         """Decorator to track task metrics"""
         def wrapper(*args, **kwargs):
@@ -30,4 +94,4 @@ class AIServerMetrics:
                 return result
             finally:
                 self.active_tasks.dec()
-        return wrapper
\ No newline at end of file
+        return wrapper
@@ -0,0 +1,385 @@
+# src/core/monitoring/profiling.py
+
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import torch
+
+_NULL_CONTEXT = nullcontext()
+
+
+class ProfilerBusy(RuntimeError):
+    """A profiler of the requested kind is already running in this worker."""
+
+
+class HotPathTimers:
+    """
+    Cheap named timers for request hot paths.
+
+    When disabled, ``timer()`` returns a shared null context so instrumented code
+    pays one attribute lookup and nothing else.
+    """
+    def __init__(self):
+        self.enabled = False
+        self._lock = threading.Lock()
+        self._stats: Dict[str, List[float]] = defaultdict(lambda: [0, 0.0, 0.0])  # count, total, max
+
+    def timer(self, name: str):
+        if not self.enabled:
+            return _NULL_CONTEXT
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start)
+
+    def record(self, name: str, seconds: float):
+        with self._lock:
+            stat = self._stats[name]
+            stat[0] += 1
+            stat[1] += seconds
+            stat[2] = max(stat[2], seconds)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Per-timer count, mean and max in milliseconds."""
+        with self._lock:
+            return {
+                name: {
+                    "count": count,
+                    "mean_ms": total / count * 1000 if count else 0.0,
+                    "max_ms": max_s * 1000,
+                    "total_ms": total * 1000
+                }
+                for name, (count, total, max_s) in self._stats.items()
+            }
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class SamplingProfiler:
+    """
+    In-process stack sampler in the spirit of py-spy.
+
+    A daemon thread snapshots every thread's Python stack through
+    ``sys._current_frames()`` at a fixed interval. Samples are written as a
+    collapsed-stack file (flamegraph.pl / speedscope) and a Chrome trace in which
+    consecutive identical stacks are merged into one slice, when sampling stops or
+    reaches its duration; ``on_finished`` is then called from the sampler thread.
+    """
+    def __init__(self, output_dir: Path, interval: float = 0.005,
+                 on_finished: Optional[Callable[["SamplingProfiler"], None]] = None):
+        self.output_dir = Path(output_dir)
+        self.interval = interval
+        self.on_finished = on_finished
+        self.outputs: Optional[Dict] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._samples: List[tuple] = []  # (timestamp, thread_id, stack)
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, duration: float):
+        """Sample for at most ``duration`` seconds in the background."""
+        if self.running:
+            raise ProfilerBusy("Sampling profiler is already running")
+        self._samples = []
+        self.outputs = None
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(duration,),
+                                        name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def _run(self, duration: float):
+        own_id = threading.get_ident()
+        deadline = time.perf_counter() + duration
+        while not self._stop.is_set() and time.perf_counter() < deadline:
+            now = time.perf_counter()
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self._samples.append((now, thread_id, tuple(reversed(stack))))
+            self._stop.wait(self.interval)
+
+        self.outputs = self._write()
+        if self.on_finished is not None:
+            self.on_finished(self)
+
+    def stop(self) -> Dict[str, str]:
+        """
+        Stop sampling and write the collected samples.
+
+        Returns:
+            Paths of the written flamegraph and Chrome trace files
+        """
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+        return self.outputs
+
+    def _write(self) -> Dict[str, str]:
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%d_%H%M%S")
+        folded_path = self.output_dir / f"sampling_{stamp}.folded"
+        trace_path = self.output_dir / f"sampling_{stamp}.trace.json"
+
+        folded = Counter(";".join(stack) for _, _, stack in self._samples)
+        with open(folded_path, "w") as f:
+            for stack, count in folded.most_common():
+                f.write(f"{stack} {count}\n")
+
+        # Merge consecutive identical stacks per thread into Chrome "complete" events
+        events = []
+        open_slices: Dict[int, list] = {}
+        start_time = self._samples[0][0] if self._samples else 0.0
+        for timestamp, thread_id, stack in self._samples:
+            ts_us = (timestamp - start_time) * 1e6
+            current = open_slices.get(thread_id)
+            if current is not None and current[1] == stack:
+                current[2] = ts_us + self.interval * 1e6
+                continue
+            if current is not None:
+                events.extend(self._slice_events(thread_id, *current))
+            open_slices[thread_id] = [ts_us, stack, ts_us + self.interval * 1e6]
+        for thread_id, current in open_slices.items():
+            events.extend(self._slice_events(thread_id, *current))
+
+        with open(trace_path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+        return {"flamegraph": str(folded_path), "chrome_trace": str(trace_path),
+                "samples": len(self._samples)}
+
+    @staticmethod
+    def _slice_events(thread_id: int, start_us: float, stack: tuple, end_us: float) -> List[Dict]:
+        return [
+            {"name": frame, "ph": "X", "ts": start_us, "dur": end_us - start_us,
+             "pid": os.getpid(), "tid": thread_id}
+            for frame in stack
+        ]
+
+
+class TorchProfilerSession:
+    """
+    Runs ``torch.profiler`` around the next N requests and exports a Chrome trace.
+
+    The profiler has to be disabled by the thread that enabled it, so ``start``,
+    ``request_finished`` and ``stop`` run on the event loop; only the slow
+    ``export`` is meant to run in a worker thread.
+    """
+    def __init__(self, output_dir: Path, num_requests: int):
+        self.output_dir = Path(output_dir)
+        self.remaining = num_requests
+        self.trace_path: Optional[Path] = None
+        self._collecting = True
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+
+        activities = [torch.profiler.ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(torch.profiler.ProfilerActivity.CUDA)
+        self._profiler = torch.profiler.profile(activities=activities, record_shapes=True,
+                                                with_stack=True)
+        self._profiler.__enter__()
+
+    @property
+    def running(self) -> bool:
+        return self._collecting
+
+    def request_finished(self) -> bool:
+        """
+        Count a finished request.
+
+        Returns:
+            True for the request that used up the budget and stopped the profiler
+        """
+        with self._lock:
+            if not self._collecting:
+                return False
+            self.remaining -= 1
+            if self.remaining > 0:
+                return False
+        return self.stop()
+
+    def stop(self) -> bool:
+        """Stop collecting; returns False if the profiler was already stopped."""
+        with self._lock:
+            if not self._collecting:
+                return False
+            self._collecting = False
+            self._profiler.__exit__(None, None, None)
+            return True
+
+    def export(self) -> Dict[str, str]:
+        """Write the Chrome trace of a stopped session (once) and return its path."""
+        with self._export_lock:
+            if self.trace_path is None:
+                self.output_dir.mkdir(parents=True, exist_ok=True)
+                trace_path = self.output_dir / f"torch_{time.strftime('%Y%m%d_%H%M%S')}.trace.json"
+                self._profiler.export_chrome_trace(str(trace_path))
+                self.trace_path = trace_path
+        return {"chrome_trace": str(self.trace_path)}
+
+
+class ProfilingManager:
+    """
+    Owns the on-demand profilers and hot-path timers for one worker process.
+
+    Everything is off by default; the request middleware only checks ``active``.
+    Profilers that end on their own (sampling duration, torch request count) switch
+    the timers back off once nothing else is running, and their traces are kept for
+    the next ``stop()``. Note that with several uvicorn workers each call profiles
+    the worker that received it.
+    """
+    def __init__(self, output_dir: Path, log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.output_dir = Path(output_dir)
+        self.timers = HotPathTimers()
+        self.sampler: Optional[SamplingProfiler] = None
+        self.torch_session: Optional[TorchProfilerSession] = None
+        self.finished: Dict[str, Dict] = {}  # Traces of profilers that ended on their own
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.timers.enabled or self.torch_session is not None
+
+    def _update_timers(self):
+        self.timers.enabled = self.sampler is not None or self.torch_session is not None
+
+    def start_sampling(self, duration: float, interval: float) -> Dict:
+        """
+        Sample Python stacks for ``duration`` seconds, with the hot-path timers on.
+
+        Raises:
+            ProfilerBusy: If a sampler is already running
+        """
+        with self._lock:
+            if self.sampler is not None:
+                raise ProfilerBusy("Sampling profiler is already running")
+            self.sampler = SamplingProfiler(self.output_dir, interval=interval,
+                                            on_finished=self._sampler_finished)
+            self.sampler.start(duration)
+            self._update_timers()
+        self.logger.info(f"Sampling profiler started for {duration}s at {interval * 1000:.1f}ms")
+        return self.status()
+
+    def _sampler_finished(self, sampler: SamplingProfiler):
+        with self._lock:
+            if self.sampler is not sampler:  # Stopped explicitly
+                return
+            self.finished["sampling"] = sampler.outputs
+            self.sampler = None
+            self._update_timers()
+        self.logger.info(f"Sampling profiler finished, trace written to {sampler.outputs['chrome_trace']}")
+
+    def start_torch(self, num_requests: int) -> Dict:
+        """
+        Run torch.profiler around the next ``num_requests`` requests, with the timers on.
+
+        Raises:
+            ProfilerBusy: If a torch.profiler session is already running
+        """
+        with self._lock:
+            if self.torch_session is not None:
+                raise ProfilerBusy("torch.profiler session already running")
+            self.torch_session = TorchProfilerSession(self.output_dir, num_requests)
+            self._update_timers()
+        self.logger.info(f"torch.profiler armed for {num_requests} requests")
+        return self.status()
+
+    async def request_finished(self):
+        """Called by the middleware after each request while profiling is active."""
+        session = self.torch_session
+        if session is None or not session.request_finished():
+            return
+        outputs = await asyncio.to_thread(session.export)
+        with self._lock:
+            if self.torch_session is session:  # Otherwise stop() already reported it
+                self.finished["torch"] = outputs
+                self.torch_session = None
+                self._update_timers()
+        self.logger.info(f"torch.profiler trace written to {session.trace_path}")
+
+    async def stop(self) -> Dict:
+        """Stop every active profiler and return the written trace files."""
+        with self._lock:
+            sampler, self.sampler = self.sampler, None
+            session, self.torch_session = self.torch_session, None
+            outputs, self.finished = self.finished, {}
+            self._update_timers()
+        if session is not None:
+            session.stop()
+        # Joining the sampler and exporting the trace write files, so keep them off the
+        # loop; the join is also outside the lock because on_finished takes it
+        return await asyncio.to_thread(self._collect, outputs, sampler, session)
+
+    @staticmethod
+    def _collect(outputs: Dict, sampler: Optional[SamplingProfiler],
+                 session: Optional[TorchProfilerSession]) -> Dict:
+        if sampler is not None:
+            outputs["sampling"] = sampler.stop()
+        if session is not None:
+            outputs["torch"] = session.export()
+        return outputs
+
+    def status(self) -> Dict:
+        return {
+            "sampling": self.sampler is not None and self.sampler.running,
+            "torch": self.torch_session is not None and self.torch_session.running,
+            "timers_enabled": self.timers.enabled,
+            "finished": list(self.finished),
+            "traces": sorted(p.name for p in self.output_dir.glob("*.trace.json"))
+            if self.output_dir.exists() else []
+        }
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware feeding per-endpoint timers and request-count-bound profilers.
+
+    Timers are named after the matched route template (``GET /results/{node_id}/{result_id}``),
+    so their number stays bounded whatever paths clients send.
+    """
+    def __init__(self, app, manager: ProfilingManager):
+        self.app = app
+        self.manager = manager
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.manager.active:
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if self.manager.timers.enabled:
+                # The router stores the matched route in the scope
+                path = getattr(scope.get("route"), "path", None) or "<unmatched>"
+                self.manager.timers.record(f"{scope['method']} {path}", time.perf_counter() - start)
+            await self.manager.request_finished()
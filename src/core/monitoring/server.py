@@ -1,48 +1,71 @@
 import psutil
 import torch
 import time
-from prometheus_client import start_http_server, Gauge, Counter
+from prometheus_client import start_http_server, Gauge, Counter, Histogram, CollectorRegistry, REGISTRY
 import GPUtil
 from pathlib import Path
+from typing import Dict, Optional, Sequence
 import logging
 
+from src.core.monitoring.metrics import DEFAULT_LATENCY_BUCKETS
+from src.core.monitoring.history import MetricsHistory
+
 class GPUMonitor:
-    def __init__(self):
-        # GPU Core Metrics
-        self.gpu_utilization = Gauge('gpu_utilization', 'GPU Utilization in %')
-        self.gpu_memory_used = Gauge('gpu_memory_used_mb', 'GPU Memory Used in MB')
-        self.gpu_memory_total = Gauge('gpu_memory_total_mb', 'GPU Total Memory in MB')
-        self.gpu_temperature = Gauge('gpu_temperature_celsius', 'GPU Temperature in Celsius')
-        self.gpu_power_draw = Gauge('gpu_power_watts', 'GPU Power Usage in Watts')
-        
+    def __init__(self, registry: CollectorRegistry = REGISTRY,
+                 latency_buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS,
+                 history: Optional[MetricsHistory] = None):
+        # Optional on-box history of every collected sample (survives Prometheus outages)
+        self.history = history
+        self._samples: Dict[str, float] = {}
+        self._latency_streams: Dict[int, torch.cuda.Stream] = {}
+
+        # GPU Core Metrics (one series per device)
+        self.gpu_utilization = Gauge('gpu_utilization', 'GPU Utilization in %', ['gpu'], registry=registry)
+        self.gpu_memory_used = Gauge('gpu_memory_used_mb', 'GPU Memory Used in MB', ['gpu'], registry=registry)
+        self.gpu_memory_total = Gauge('gpu_memory_total_mb', 'GPU Total Memory in MB', ['gpu'], registry=registry)
+        self.gpu_temperature = Gauge('gpu_temperature_celsius', 'GPU Temperature in Celsius', ['gpu'], registry=registry)
+        self.gpu_power_draw = Gauge('gpu_power_watts', 'GPU Power Usage in Watts', ['gpu'], registry=registry)
+
         # GPU Performance Metrics
-        self.gpu_memory_bandwidth = Gauge('gpu_memory_bandwidth_gbps', 'GPU Memory Bandwidth in GB/s')
-        self.gpu_pcie_throughput = Gauge('gpu_pcie_throughput_gbps', 'GPU PCIe Throughput in GB/s')
-        self.gpu_compute_mode = Gauge('gpu_compute_mode', 'GPU Compute Mode')
-        
+        self.gpu_memory_bandwidth = Gauge('gpu_memory_bandwidth_gbps', 'GPU Memory Bandwidth in GB/s', ['gpu'], registry=registry)
+        self.gpu_pcie_throughput = Gauge('gpu_pcie_throughput_gbps', 'GPU PCIe Throughput in GB/s', ['gpu'], registry=registry)
+        self.gpu_compute_mode = Gauge('gpu_compute_mode', 'GPU Compute Mode', ['gpu'], registry=registry)
+
         # System Metrics
-        self.cpu_usage = Gauge('cpu_usage_percent', 'CPU Usage in %')
-        self.system_memory_used = Gauge('system_memory_gb', 'System Memory Used in GB')
-        self.disk_usage = Gauge('disk_usage_percent', 'Disk Usage in %')
-        
-        # AI Server Metrics
-        self.active_tasks = Gauge('ai_active_tasks', 'Number of Active AI Tasks')
-        self.queue_size = Gauge('ai_queue_size', 'Number of Tasks in Queue')
-        self.model_loading_time = Gauge('ai_model_loading_seconds', 'Time to Load Models in seconds')
-        
+        self.cpu_usage = Gauge('cpu_usage_percent', 'CPU Usage in %', registry=registry)
+        self.system_memory_used = Gauge('system_memory_gb', 'System Memory Used in GB', registry=registry)
+        self.disk_usage = Gauge('disk_usage_percent', 'Disk Usage in %', registry=registry)
+
+        # AI Server Metrics (active task count is exported by the API workers, see AIServerMetrics)
+        self.queue_size = Gauge('ai_queue_size', 'Number of Tasks in Queue', registry=registry)
+        self.model_loading_time = Gauge('ai_model_loading_seconds', 'Time to Load Models in seconds', registry=registry)
+
         # Operation Counters
-        self.gpu_operations = Counter('gpu_operations_total', 'Total GPU Operations')
-        self.memory_allocation_errors = Counter('gpu_memory_errors_total', 'GPU Memory Allocation Errors')
-        self.cuda_errors = Counter('gpu_cuda_errors_total', 'CUDA Errors')
-        
-        # Performance Metrics
-        self.inference_latency = Gauge('ai_inference_latency_ms', 'Model Inference Latency in ms')
-        self.batch_processing_time = Gauge('ai_batch_processing_ms', 'Batch Processing Time in ms')
-        
+        self.gpu_operations = Counter('gpu_operations_total', 'Total GPU Operations', registry=registry)
+        self.memory_allocation_errors = Counter('gpu_memory_errors_total', 'GPU Memory Allocation Errors', registry=registry)
+        self.cuda_errors = Counter('gpu_cuda_errors_total', 'CUDA Errors', registry=registry)
+
+        # Performance Metrics (histograms keep every sample so percentiles survive scraping)
+        # Batch processing time is exported by the API workers (AIServerMetrics.observe_batch)
+        self.inference_latency = Histogram('ai_inference_latency_seconds', 'Model Inference Latency in seconds',
+            ['device'], buckets=latency_buckets, registry=registry)
+
         # Storage Metrics
         self.storage_path = Path('/data')
-        self.storage_used = Gauge('storage_used_gb', 'Storage Used in GB')
-        self.storage_free = Gauge('storage_free_gb', 'Storage Free in GB')
+        self.storage_used = Gauge('storage_used_gb', 'Storage Used in GB', registry=registry)
+        self.storage_free = Gauge('storage_free_gb', 'Storage Free in GB', registry=registry)
+
+    def observe_inference(self, device: str, seconds: float, trace_id: Optional[str] = None):
+        """Record an inference latency sample, optionally with a trace exemplar."""
+        exemplar: Optional[Dict[str, str]] = {'trace_id': trace_id} if trace_id else None
+        self.inference_latency.labels(device=device).observe(seconds, exemplar=exemplar)
+        self._samples[f'ai_inference_latency_seconds{{device={device}}}'] = seconds
+
+    def _set(self, gauge: Gauge, value: float, name: str, **labels):
+        """Set a gauge and remember the sample for the history buffer."""
+        (gauge.labels(**labels) if labels else gauge).set(value)
+        label_text = ",".join(f"{k}={v}" for k, v in labels.items())
+        self._samples[f"{name}{{{label_text}}}" if labels else name] = value
 
     def collect_metrics(self):
         """Collect all metrics."""
@@ -50,50 +73,64 @@ class GPUMonitor:
             # GPU Metrics
             gpus = GPUtil.getGPUs()
             for gpu in gpus:
-                self.gpu_utilization.set(gpu.load * 100)
-                self.gpu_memory_used.set(gpu.memoryUsed)
-                self.gpu_memory_total.set(gpu.memoryTotal)
-                self.gpu_temperature.set(gpu.temperature)
+                gpu_id = str(gpu.id)
+                self._set(self.gpu_utilization, gpu.load * 100, 'gpu_utilization', gpu=gpu_id)
+                self._set(self.gpu_memory_used, gpu.memoryUsed, 'gpu_memory_used_mb', gpu=gpu_id)
+                self._set(self.gpu_memory_total, gpu.memoryTotal, 'gpu_memory_total_mb', gpu=gpu_id)
+                self._set(self.gpu_temperature, gpu.temperature, 'gpu_temperature_celsius', gpu=gpu_id)
                 if hasattr(gpu, 'powerDraw'):
-                    self.gpu_power_draw.set(gpu.powerDraw)
+                    self._set(self.gpu_power_draw, gpu.powerDraw, 'gpu_power_watts', gpu=gpu_id)
 
             # Additional GPU Metrics (if available)
             if torch.cuda.is_available():
-                device = torch.cuda.current_device()
-                self.gpu_compute_mode.set(torch.cuda.get_device_capability(device)[0])
+                for device in range(torch.cuda.device_count()):
+                    self.gpu_compute_mode.labels(gpu=str(device)).set(torch.cuda.get_device_capability(device)[0])
                 # Update operation counter
                 self.gpu_operations.inc()
 
             # System Metrics
-            self.cpu_usage.set(psutil.cpu_percent())
-            self.system_memory_used.set(psutil.virtual_memory().used / (1024**3))
-            self.disk_usage.set(psutil.disk_usage('/').percent)
+            self._set(self.cpu_usage, psutil.cpu_percent(), 'cpu_usage_percent')
+            self._set(self.system_memory_used, psutil.virtual_memory().used / (1024**3), 'system_memory_gb')
+            self._set(self.disk_usage, psutil.disk_usage('/').percent, 'disk_usage_percent')
 
             # Storage Metrics
             if self.storage_path.exists():
                 usage = psutil.disk_usage(str(self.storage_path))
-                self.storage_used.set(usage.used / (1024**3))
-                self.storage_free.set(usage.free / (1024**3))
+                self._set(self.storage_used, usage.used / (1024**3), 'storage_used_gb')
+                self._set(self.storage_free, usage.free / (1024**3), 'storage_free_gb')
 
-        except Exception as e:
-            logging.error(f"Error collecting metrics: {str(e)}")
+        except Exception:
+            logging.exception("Error collecting metrics")
             self.cuda_errors.inc()
 
+    def record_history(self):
+        """Write the samples gathered since the last call into the history buffer."""
+        if self.history is not None and self._samples:
+            try:
+                self.history.record(self._samples)
+            except Exception:
+                logging.exception("Error recording metrics history")
+        self._samples = {}
+
     def run_latency_test(self):
-        """Run a simple operation to measure GPU latency."""
+        """Run a simple operation to measure GPU latency on every device."""
         try:
             if torch.cuda.is_available():
-                start = torch.cuda.Event(enable_timing=True)
-                end = torch.cuda.Event(enable_timing=True)
-                
-                x = torch.randn(1000, 1000, device='cuda')
-                
-                start.record()
-                torch.matmul(x, x)
-                end.record()
-                
-                torch.cuda.synchronize()
-                self.inference_latency.set(start.elapsed_time(end))
+                for device in range(torch.cuda.device_count()):
+                    # A side stream per device, so the probe never waits on (or stalls) other work
+                    stream = self._latency_streams.setdefault(device, torch.cuda.Stream(device))
+                    with torch.cuda.device(device), torch.cuda.stream(stream):
+                        start = torch.cuda.Event(enable_timing=True)
+                        end = torch.cuda.Event(enable_timing=True)
+
+                        x = torch.randn(1000, 1000, device=f'cuda:{device}')
+
+                        start.record(stream)
+                        torch.matmul(x, x)
+                        end.record(stream)
+
+                        end.synchronize()
+                        self.observe_inference(f'cuda:{device}', start.elapsed_time(end) / 1000)
         except Exception:
             self.cuda_errors.inc()
 
@@ -102,11 +139,12 @@ def run_monitoring_server(port=8001):
     start_http_server(port)
     monitor = GPUMonitor()
     logging.info(f"Metrics server started on port {port}")
-    
+
     while True:
         monitor.collect_metrics()
         monitor.run_latency_test()
+        monitor.record_history()
         time.sleep(1)
 
 if __name__ == "__main__":
-    run_monitoring_server()
\ No newline at end of file
+    run_monitoring_server()
@@ -0,0 +1,313 @@
+# src/core/result_store.py
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows development hosts
+    fcntl = None
+
+_RESULT_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class ResultTooLarge(Exception):
+    """Raised for a result that would not fit in the quota even with the store empty"""
+
+
+@dataclass
+class StoredResult:
+    """Data class for the metadata of one stored result"""
+    result_id: str
+    filename: str  # File name inside the result's shard directory
+    media_type: str
+    size: int  # Size in bytes
+    created: float  # Unix timestamp
+    expires_at: float  # Unix timestamp after which the result may be evicted
+
+    def handle(self, url: str) -> Dict:
+        """Description returned to clients in place of the inline result."""
+        return {
+            "result_id": self.result_id,
+            "url": url,
+            "media_type": self.media_type,
+            "size": self.size,
+            "expires_at": self.expires_at
+        }
+
+
+class ResultStore:
+    """
+    Write-once disk store for large request outputs.
+
+    Results are stored as ``<id[:2]>/<id><suffix>`` under ``root`` next to a
+    ``<id>.json`` sidecar with their metadata; the data file is written before the
+    sidecar, so a result is visible only once it is complete. Content never changes
+    after it is written, so the ID doubles as the ETag. The sidecar's modification
+    time records the last download and drives quota eviction (least recently used
+    first); results past their TTL are evicted regardless of use.
+
+    Every worker on the node shares the directory, so results can be fetched from any
+    of them and eviction tolerates files vanishing underneath it. The quota is shared
+    too: bytes in use are kept in ``usage.lock`` under ``root``, updated under a file
+    lock by every write and delete, and reset to the exact total by each scan.
+    """
+    def __init__(self, root: Path, ttl_s: float = 3600.0, quota_bytes: int = 10 * 2**30,
+                 log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.ttl_s = ttl_s
+        self.quota_bytes = quota_bytes
+        self.usage_path = self.root / "usage.lock"
+        self._lock = threading.RLock()
+        self._usage_file = None
+        self._lock_depth = 0
+        self.evicted = 0
+
+    @contextmanager
+    def _usage_lock(self):
+        """Cross-process lock over the shared usage counter, re-entrant within this process."""
+        with self._lock:
+            if self._usage_file is None:
+                self._usage_file = open(self.usage_path, "a+")
+            outermost = self._lock_depth == 0
+            if outermost and fcntl is not None:
+                fcntl.flock(self._usage_file.fileno(), fcntl.LOCK_EX)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if outermost and fcntl is not None:
+                    fcntl.flock(self._usage_file.fileno(), fcntl.LOCK_UN)
+
+    def _read_usage(self) -> Optional[int]:
+        """Bytes in use on the node (lock held); None when unknown, which forces a scan."""
+        self._usage_file.seek(0)
+        text = self._usage_file.read().strip()
+        return int(text) if text.isdigit() else None
+
+    def _write_usage(self, usage: int):
+        self._usage_file.seek(0)
+        self._usage_file.truncate()
+        self._usage_file.write(str(max(0, usage)))
+        self._usage_file.flush()
+
+    def _add_usage(self, delta: int):
+        with self._usage_lock():
+            usage = self._read_usage()
+            if usage is not None:
+                self._write_usage(usage + delta)
+
+    def _paths(self, result_id: str, suffix: str = "") -> Tuple[Path, Path]:
+        shard = self.root / result_id[:2]
+        return shard / f"{result_id}{suffix}", shard / f"{result_id}.json"
+
+    def _write_atomic(self, path: Path, write: Callable) -> int:
+        """Write through ``write(file)`` to a temporary file, then rename it; returns the size."""
+        fd, tmp_name = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+                size = f.tell()
+            os.replace(tmp_name, path)
+            return size
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+
+    def put_bytes(self, data, media_type: str, suffix: str = "",
+                  ttl_s: Optional[float] = None) -> StoredResult:
+        """
+        Store an output and return its metadata.
+
+        Args:
+            data: Result content (bytes or any buffer, written without copying)
+            media_type: Content type served with the result
+            suffix: File extension, e.g. ``.jpg``
+            ttl_s: Lifetime in seconds; the store default when omitted
+
+        Returns:
+            Metadata of the stored result
+
+        Raises:
+            ResultTooLarge: If the result is larger than the whole quota
+        """
+        data = memoryview(data).cast("B")
+        return self._put(data.nbytes, lambda f: f.write(data), media_type, suffix, ttl_s)
+
+    def put_array(self, array: np.ndarray, ttl_s: Optional[float] = None) -> StoredResult:
+        """Store an array in ``.npy`` format (``numpy.load`` reads it back)."""
+        array = np.ascontiguousarray(array)
+        return self._put(array.nbytes, lambda f: np.lib.format.write_array(f, array, allow_pickle=False),
+                         "application/x-npy", ".npy", ttl_s)
+
+    def _put(self, size: int, write: Callable, media_type: str, suffix: str,
+             ttl_s: Optional[float]) -> StoredResult:
+        self._reserve(size)
+        result_id = uuid.uuid4().hex
+        data_path, meta_path = self._paths(result_id, suffix)
+        data_path.parent.mkdir(exist_ok=True)
+
+        try:
+            written = self._write_atomic(data_path, write)
+        except BaseException:
+            self._add_usage(-size)
+            raise
+        if written != size:
+            self._add_usage(written - size)  # E.g. the .npy header
+
+        now = time.time()
+        result = StoredResult(
+            result_id=result_id,
+            filename=data_path.name,
+            media_type=media_type,
+            size=written,
+            created=now,
+            expires_at=now + (self.ttl_s if ttl_s is None else ttl_s)
+        )
+        self._write_atomic(meta_path, lambda f: f.write(json.dumps(asdict(result)).encode()))
+        return result
+
+    def get(self, result_id: str) -> Optional[Tuple[StoredResult, Path]]:
+        """
+        Metadata and data path of a live result, or None if unknown or expired.
+
+        Marks the result as recently used for quota eviction.
+        """
+        if not _RESULT_ID.match(result_id):
+            return None
+        _, meta_path = self._paths(result_id)
+        try:
+            with open(meta_path) as f:
+                result = StoredResult(**json.load(f))
+        except (FileNotFoundError, ValueError):
+            return None
+        if result.expires_at <= time.time():
+            return None
+        data_path = meta_path.parent / result.filename
+        if not data_path.exists():
+            return None
+        try:
+            os.utime(meta_path)
+        except OSError:
+            pass
+        return result, data_path
+
+    def relative_path(self, result: StoredResult) -> str:
+        """Path of the data file relative to the store root (for X-Accel-Redirect)."""
+        return f"{result.result_id[:2]}/{result.filename}"
+
+    def _reserve(self, size: int):
+        if size > self.quota_bytes:
+            # Checked first: evicting everything would not make room anyway
+            raise ResultTooLarge(f"Result of {size} bytes exceeds the {self.quota_bytes} byte quota")
+        with self._usage_lock():
+            usage = self._read_usage()
+            if usage is not None and usage + size <= self.quota_bytes:
+                self._write_usage(usage + size)
+                return
+            # Unknown or over quota: rescan and evict enough to fit the new result
+            usage = self.evict(reserve=size)["bytes_used"]
+            self._write_usage(usage + size)
+
+    def _scan(self) -> List[Tuple[float, float, int, str]]:
+        """``(last_used, expires_at, size, result_id)`` of every stored result."""
+        entries = []
+        for meta_path in self.root.glob("*/*.json"):
+            try:
+                with open(meta_path) as f:
+                    meta = json.load(f)
+                entries.append((meta_path.stat().st_mtime, meta["expires_at"], meta["size"], meta["result_id"]))
+            except (FileNotFoundError, ValueError, KeyError):
+                continue
+        return entries
+
+    def delete(self, result_id: str) -> bool:
+        if not _RESULT_ID.match(result_id):
+            return False
+        _, meta_path = self._paths(result_id)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            # Sidecar first, so the result disappears before its data does
+            meta_path.unlink()
+            (meta_path.parent / meta["filename"]).unlink(missing_ok=True)
+        except (FileNotFoundError, ValueError, KeyError):
+            return False
+        self._add_usage(-meta.get("size", 0))
+        return True
+
+    def evict(self, reserve: int = 0) -> Dict[str, int]:
+        """
+        Delete expired results, then least recently used ones until under quota.
+
+        Args:
+            reserve: Bytes that must additionally fit under the quota
+
+        Returns:
+            Number of results evicted and bytes in use afterwards
+        """
+        with self._usage_lock():
+            return self._evict(reserve)
+
+    def _evict(self, reserve: int) -> Dict[str, int]:
+        now = time.time()
+        entries = self._scan()
+        evicted = 0
+        usage = 0
+        live = []
+        for last_used, expires_at, size, result_id in entries:
+            if expires_at <= now:
+                evicted += self.delete(result_id)
+            else:
+                live.append((last_used, size, result_id))
+                usage += size
+
+        live.sort()
+        for last_used, size, result_id in live:
+            if usage + reserve <= self.quota_bytes:
+                break
+            if self.delete(result_id):
+                evicted += 1
+                usage -= size
+
+        # Leftovers of writers that crashed between mkstemp and rename
+        for tmp_path in self.root.glob("*/*.tmp"):
+            try:
+                if now - tmp_path.stat().st_mtime > 3600:
+                    tmp_path.unlink()
+            except FileNotFoundError:
+                pass
+
+        # The scan total replaces the running counter of every worker
+        self._write_usage(usage)
+        self.evicted += evicted
+        if evicted:
+            self.logger.info(f"Evicted {evicted} results, {usage / 2**20:.1f}MB in use")
+        return {"evicted": evicted, "bytes_used": usage}
+
+    def stats(self) -> Dict:
+        entries = self._scan()
+        return {
+            "results": len(entries),
+            "bytes_used": sum(size for _, _, size, _ in entries),
+            "quota_bytes": self.quota_bytes,
+            "ttl_s": self.ttl_s,
+            "evicted": self.evicted
+        }
@@ -0,0 +1,299 @@
+# src/core/scheduler.py
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+from contextlib import suppress
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from starlette.requests import Request
+
+T = TypeVar("T")
+
+
+class Priority(IntEnum):
+    """Priority classes; lower values win ties between equal deadlines"""
+    INTERACTIVE = 0
+    BULK = 1
+
+
+class DeadlineExceeded(Exception):
+    """Raised when queued or running work can no longer meet its deadline"""
+
+
+class ClientDisconnected(Exception):
+    """Raised when the client went away before its work finished"""
+
+
+@dataclass
+class _Slot:
+    """Execution slot held by one running job"""
+    scheduler: "DeadlineScheduler"
+    held: bool = True
+
+
+# Slot of the job the current task runs for (set by DeadlineScheduler.run)
+_current_slot: contextvars.ContextVar[Optional[_Slot]] = contextvars.ContextVar("scheduler_slot", default=None)
+
+
+@dataclass(order=True)
+class _Entry:
+    deadline: float
+    priority: int
+    seq: int
+    future: asyncio.Future = field(compare=False)
+
+
+class DeadlineScheduler:
+    """
+    Earliest-deadline-first admission in front of model and image execution.
+
+    At most ``max_concurrent`` jobs hold a slot at once; waiting jobs are ordered by
+    absolute deadline, then priority class. Jobs whose deadline has passed, or cannot
+    be met given the observed run time for their kind of work and priority, are
+    dropped instead of occupying the device. Work without an estimate always runs,
+    and one job per ``probe_interval_s`` runs despite its estimate, so a single slow
+    run cannot lock a kind of work out for good. Jobs that hand their work to a
+    batcher give their slot back with ``release_slot()`` while they wait there.
+    Cancelling the awaiting task (e.g. on client disconnect) removes a queued job or
+    cancels a running one.
+    """
+    def __init__(self, max_concurrent: int = 4, default_deadlines: Optional[Dict[Priority, float]] = None,
+                 metrics=None, probe_interval_s: float = 5.0, log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.max_concurrent = max_concurrent
+        self.default_deadlines = default_deadlines or {Priority.INTERACTIVE: 2.0, Priority.BULK: 55.0}
+        self.metrics = metrics
+        self.probe_interval_s = probe_interval_s
+
+        self._heap: List[_Entry] = []
+        self._active = 0  # Jobs holding a slot
+        self._running = 0  # Admitted jobs, including those that released their slot
+        self._seq = itertools.count()
+        self._estimates: Dict[Tuple[str, int], float] = {}  # EWMA run time per work key and priority
+        self._probed_at: Dict[Tuple[str, int], float] = {}  # Last run that refreshed an estimate
+        self.dropped: Dict[str, int] = {"infeasible": 0, "expired": 0, "timeout": 0, "cancelled": 0}
+
+    def set_max_concurrent(self, max_concurrent: int):
+        """Change the number of execution slots; waiting jobs are admitted right away."""
+        self.max_concurrent = max(1, max_concurrent)
+        with suppress(RuntimeError):  # No running loop yet (called at import time)
+            self._dispatch()
+
+    def estimate(self, key: str, priority: Priority = Priority.INTERACTIVE) -> float:
+        return self._estimates.get((key, int(priority)), 0.0)
+
+    def _observe(self, key: str, priority: Priority, seconds: float, now: float, alpha: float = 0.2):
+        estimate_key = (key, int(priority))
+        previous = self._estimates.get(estimate_key)
+        self._estimates[estimate_key] = seconds if previous is None else (1 - alpha) * previous + alpha * seconds
+        self._probed_at[estimate_key] = now
+
+    def _take_probe(self, key: str, priority: Priority, now: float) -> bool:
+        """Admit one job per probe interval despite its estimate, to refresh the estimate."""
+        estimate_key = (key, int(priority))
+        if now - self._probed_at.get(estimate_key, float("-inf")) < self.probe_interval_s:
+            return False
+        self._probed_at[estimate_key] = now
+        return True
+
+    def release_slot(self):
+        """
+        Give the calling job's slot back while the job keeps running.
+
+        For jobs that queue in a DynamicBatcher: the batcher bounds device work
+        itself, and holding a slot while queued would cap every batch at
+        ``max_concurrent`` items. The job still counts as running for ``drain``.
+        """
+        slot = _current_slot.get()
+        if slot is not None and slot.scheduler is self and slot.held:
+            slot.held = False
+            self._release()
+
+    def _count_drop(self, reason: str):
+        self.dropped[reason] += 1
+        if self.metrics is not None:
+            self.metrics.scheduler_dropped.labels(reason=reason).inc()
+
+    def _drop(self, reason: str, key: str) -> DeadlineExceeded:
+        self._count_drop(reason)
+        return DeadlineExceeded(f"'{key}' dropped: {reason}")
+
+    async def run(self, fn: Callable[[], Awaitable[T]], key: str = "default",
+                  priority: Priority = Priority.INTERACTIVE, deadline: Optional[float] = None) -> T:
+        """
+        Run ``fn()`` once a slot is free and its deadline is still achievable.
+
+        Args:
+            fn: Coroutine function performing the work
+            key: Kind of work, used with the priority to learn the expected run time
+            priority: Priority class
+            deadline: Absolute deadline on the event loop clock; defaults per class
+
+        Raises:
+            DeadlineExceeded: If the work was dropped or ran past its deadline
+        """
+        loop = asyncio.get_running_loop()
+        now = loop.time()
+        if deadline is None:
+            deadline = now + self.default_deadlines[priority]
+
+        probe = False
+        if now + self.estimate(key, priority) > deadline:
+            if not self._take_probe(key, priority, now):
+                raise self._drop("infeasible", key)
+            probe = True
+
+        await self._acquire(deadline, priority, key)
+        slot = _Slot(self)
+        self._running += 1
+        try:
+            start = loop.time()
+            if start > deadline or (not probe and start + self.estimate(key, priority) > deadline):
+                raise self._drop("expired", key)
+            token = _current_slot.set(slot)
+            try:
+                result = await asyncio.wait_for(fn(), timeout=deadline - start)
+            except asyncio.TimeoutError:
+                # The elapsed time is a lower bound of the run time; still worth learning
+                self._observe(key, priority, loop.time() - start, loop.time())
+                raise self._drop("timeout", key)
+            finally:
+                _current_slot.reset(token)
+            self._observe(key, priority, loop.time() - start, loop.time())
+            return result
+        except asyncio.CancelledError:
+            self._count_drop("cancelled")
+            raise
+        finally:
+            self._running -= 1
+            if slot.held:
+                slot.held = False
+                self._release()
+
+    async def _acquire(self, deadline: float, priority: Priority, key: str):
+        if self._active < self.max_concurrent and not self._heap:
+            self._active += 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._heap, _Entry(deadline, int(priority), next(self._seq), future))
+        self._update_queue_metric()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled() and future.exception() is None:
+                # Slot was granted just before we were cancelled: hand it on
+                self._release()
+            self._count_drop("cancelled")
+            raise
+        except DeadlineExceeded:
+            raise self._drop("expired", key)
+
+    def _release(self):
+        self._active -= 1
+        self._dispatch()
+
+    def _dispatch(self):
+        now = asyncio.get_running_loop().time()
+        while self._active < self.max_concurrent and self._heap:
+            entry = heapq.heappop(self._heap)
+            if entry.future.done():
+                continue
+            if now > entry.deadline:
+                entry.future.set_exception(DeadlineExceeded())
+                continue
+            self._active += 1
+            entry.future.set_result(None)
+        self._update_queue_metric()
+
+    def _update_queue_metric(self):
+        if self.metrics is not None:
+            self.metrics.scheduler_queue_depth.set(len(self._heap))
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until no job is queued or running.
+
+        Returns:
+            True if the scheduler went idle within ``timeout`` seconds
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while self._running or self._heap:
+            if deadline is not None and loop.time() >= deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrent": self.max_concurrent,
+            "active": self._active,
+            "running": self._running,
+            "queued": len(self._heap),
+            "dropped": dict(self.dropped),
+            "estimates_ms": {
+                f"{key}:{Priority(priority).name.lower()}": value * 1000
+                for (key, priority), value in self._estimates.items()
+            }
+        }
+
+
+def deadline_from_request(request: Request, default_priority: Priority = Priority.INTERACTIVE):
+    """
+    Read scheduling hints from request headers.
+
+    ``X-Priority: interactive|bulk`` selects the class and ``X-Deadline-Ms`` gives a
+    relative budget in milliseconds.
+
+    Returns:
+        Tuple of (priority, absolute deadline or None)
+    """
+    priority_name = request.headers.get("x-priority", default_priority.name).upper()
+    priority = Priority[priority_name] if priority_name in Priority.__members__ else default_priority
+
+    deadline = None
+    budget_ms = request.headers.get("x-deadline-ms")
+    if budget_ms is not None:
+        deadline = asyncio.get_running_loop().time() + float(budget_ms) / 1000
+    return priority, deadline
+
+
+async def cancel_on_disconnect(request: Request, awaitable: Awaitable[T]) -> T:
+    """
+    Await ``awaitable`` but cancel it as soon as the ASGI ``http.disconnect`` arrives.
+
+    The request body must already have been read, so the next message on the
+    receive channel can only be the disconnect.
+
+    Raises:
+        ClientDisconnected: If the client went away first
+    """
+    work = asyncio.ensure_future(awaitable)
+
+    async def wait_for_disconnect():
+        while True:
+            message = await request.receive()
+            if message["type"] == "http.disconnect":
+                return
+
+    watcher = asyncio.ensure_future(wait_for_disconnect())
+    try:
+        done, _ = await asyncio.wait({work, watcher}, return_when=asyncio.FIRST_COMPLETED)
+        if work in done:
+            return work.result()
+        work.cancel()
+        with suppress(asyncio.CancelledError, Exception):
+            await work
+        raise ClientDisconnected()
+    finally:
+        watcher.cancel()
+        if not work.done():
+            work.cancel()
@@ -0,0 +1,324 @@
+# src/ml/artifact_cache.py
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import torch
+
+try:
+    import fcntl
+except ImportError:  # Windows development hosts
+    fcntl = None
+
+try:
+    from safetensors.torch import load_file as safetensors_load, save_file as safetensors_save
+except ImportError:
+    safetensors_load = None
+    safetensors_save = None
+
+ARTIFACT_KINDS = ("weights", "compiled", "tokenizer")
+
+
+@dataclass
+class ArtifactEntry:
+    """Data class for a single named artifact in the manifest"""
+    name: str
+    kind: str  # One of ARTIFACT_KINDS
+    sha256: str  # Content hash, also the object file name
+    size: int  # Size in bytes
+    format: str  # safetensors, torch, raw
+    created: float  # Unix timestamp
+
+
+class ArtifactCache:
+    """
+    Content-addressed on-disk cache for model weights, compiled graphs and tokenizer files.
+
+    Objects are stored once under ``objects/<sha[:2]>/<sha>`` and referenced from two
+    JSON files in the cache root:
+
+    - ``index.json`` maps content hashes to object metadata (size, reference count).
+    - ``manifest.json`` maps ``<kind>/<name>`` to the hash currently serving that name.
+
+    Weights are read back with memory mapping so every uvicorn worker on the box shares
+    the same page-cache pages instead of holding a private copy.
+    """
+    def __init__(self, root: Path, log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.root = Path(root)
+        self.objects_path = self.root / "objects"
+        self.index_path = self.root / "index.json"
+        self.manifest_path = self.root / "manifest.json"
+        self.lock_path = self.root / ".lock"
+        self.objects_path.mkdir(parents=True, exist_ok=True)
+
+    @contextmanager
+    def _locked(self):
+        """Serialize index/manifest updates across worker processes."""
+        with open(self.lock_path, "a+") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _read_json(self, path: Path) -> Dict:
+        if not path.exists():
+            return {}
+        with open(path, "r") as f:
+            return json.load(f)
+
+    def _write_json(self, path: Path, data: Dict):
+        """Write JSON atomically so readers never observe a partial file."""
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(tmp_name, path)
+
+    def _object_path(self, sha256: str) -> Path:
+        return self.objects_path / sha256[:2] / sha256
+
+    @staticmethod
+    def _stage_copy(src_path: Path, object_path: Path) -> str:
+        """Copy ``src_path`` to a temp file next to ``object_path`` and return its name."""
+        object_path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_name = tempfile.mkstemp(dir=object_path.parent, suffix=".tmp")
+        os.close(fd)
+        try:
+            shutil.copyfile(src_path, tmp_name)
+        except BaseException:
+            os.unlink(tmp_name)
+            raise
+        return tmp_name
+
+    @staticmethod
+    def hash_file(path: Path, chunk_size: int = 1 << 20) -> str:
+        """Compute the SHA-256 of a file without reading it into memory at once."""
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def put_file(self, name: str, kind: str, src_path: Path, fmt: str = "raw") -> ArtifactEntry:
+        """
+        Store a file in the cache and point ``<kind>/<name>`` at it.
+
+        Args:
+            name: Logical artifact name (usually the model name)
+            kind: Artifact kind, one of ARTIFACT_KINDS
+            src_path: File to copy into the cache
+            fmt: Serialization format recorded in the manifest
+
+        Returns:
+            The manifest entry for the stored artifact
+
+        Raises:
+            ValueError: If the artifact kind is unknown
+        """
+        if kind not in ARTIFACT_KINDS:
+            raise ValueError(f"Unknown artifact kind '{kind}', expected one of {ARTIFACT_KINDS}")
+
+        src_path = Path(src_path)
+        sha256 = self.hash_file(src_path)
+        size = src_path.stat().st_size
+        object_path = self._object_path(sha256)
+
+        # Copy outside the lock so large weights don't stall other workers; the object is
+        # only published (and re-checked) under the lock so garbage_collect() cannot
+        # delete it between the rename and the index update.
+        staged = None
+        if not object_path.exists():
+            staged = self._stage_copy(src_path, object_path)
+
+        entry = ArtifactEntry(name=name, kind=kind, sha256=sha256, size=size,
+                              format=fmt, created=time.time())
+
+        with self._locked():
+            if object_path.exists():
+                if staged is not None:
+                    os.unlink(staged)
+            else:
+                if staged is None:
+                    staged = self._stage_copy(src_path, object_path)
+                os.replace(staged, object_path)
+
+            index = self._read_json(self.index_path)
+            manifest = self._read_json(self.manifest_path)
+            key = f"{kind}/{name}"
+
+            previous = manifest.get(key)
+            if previous and previous["sha256"] != sha256 and previous["sha256"] in index:
+                index[previous["sha256"]]["refs"] -= 1
+
+            if not previous or previous["sha256"] != sha256:
+                obj = index.setdefault(sha256, {"size": size, "refs": 0})
+                obj["refs"] += 1
+
+            manifest[key] = asdict(entry)
+            self._write_json(self.index_path, index)
+            self._write_json(self.manifest_path, manifest)
+
+        self.logger.info(f"Cached {key} ({size / 1e6:.1f}MB, sha256={sha256[:12]})")
+        return entry
+
+    def put_bytes(self, name: str, kind: str, data: bytes, fmt: str = "raw") -> ArtifactEntry:
+        """Store an in-memory blob (e.g. a tokenizer file) in the cache."""
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            return self.put_file(name, kind, Path(tmp_name), fmt=fmt)
+        finally:
+            os.unlink(tmp_name)
+
+    def put_state_dict(self, name: str, state_dict: Dict[str, torch.Tensor]) -> ArtifactEntry:
+        """
+        Serialize model weights into the cache.
+
+        safetensors is preferred because its loader maps the file directly; without it the
+        state dict is written with ``torch.save`` which still supports ``mmap=True`` loads.
+        """
+        fd, tmp_name = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        os.close(fd)
+        try:
+            tensors = {k: v.detach().cpu().contiguous() for k, v in state_dict.items()}
+            if safetensors_save is not None:
+                safetensors_save(tensors, tmp_name)
+                fmt = "safetensors"
+            else:
+                torch.save(tensors, tmp_name)
+                fmt = "torch"
+            return self.put_file(name, "weights", Path(tmp_name), fmt=fmt)
+        finally:
+            os.unlink(tmp_name)
+
+    def alias(self, name: str, kind: str, source: str) -> ArtifactEntry:
+        """
+        Point ``<kind>/<name>`` at the object currently stored as ``<kind>/<source>``.
+
+        Used to promote a new model version without copying its weights.
+
+        Raises:
+            KeyError: If the source artifact does not exist
+        """
+        with self._locked():
+            index = self._read_json(self.index_path)
+            manifest = self._read_json(self.manifest_path)
+            source_entry = manifest.get(f"{kind}/{source}")
+            if source_entry is None:
+                raise KeyError(f"No cached artifact {kind}/{source}")
+
+            key = f"{kind}/{name}"
+            sha256 = source_entry["sha256"]
+            previous = manifest.get(key)
+            if previous and previous["sha256"] != sha256 and previous["sha256"] in index:
+                index[previous["sha256"]]["refs"] -= 1
+            if (not previous or previous["sha256"] != sha256) and sha256 in index:
+                index[sha256]["refs"] += 1
+
+            entry = ArtifactEntry(**{**source_entry, "name": name, "created": time.time()})
+            manifest[key] = asdict(entry)
+            self._write_json(self.index_path, index)
+            self._write_json(self.manifest_path, manifest)
+
+        self.logger.info(f"Pointed {key} at {kind}/{source} (sha256={sha256[:12]})")
+        return entry
+
+    def get_entry(self, name: str, kind: str) -> Optional[ArtifactEntry]:
+        """Look up the manifest entry for ``<kind>/<name>``."""
+        entry = self._read_json(self.manifest_path).get(f"{kind}/{name}")
+        return ArtifactEntry(**entry) if entry else None
+
+    def get_path(self, name: str, kind: str, verify: bool = False) -> Optional[Path]:
+        """
+        Get the on-disk path of a cached artifact.
+
+        Args:
+            name: Logical artifact name
+            kind: Artifact kind
+            verify: Re-hash the object and reject it if it does not match the index
+
+        Returns:
+            Path to the object file, or None if it is missing or corrupt
+        """
+        entry = self.get_entry(name, kind)
+        if entry is None:
+            return None
+
+        object_path = self._object_path(entry.sha256)
+        if not object_path.exists():
+            self.logger.warning(f"Manifest entry {kind}/{name} points at a missing object")
+            return None
+
+        if verify and self.hash_file(object_path) != entry.sha256:
+            self.logger.error(f"Integrity check failed for {kind}/{name}")
+            return None
+
+        return object_path
+
+    def load_state_dict(self, name: str, verify: bool = False) -> Dict[str, torch.Tensor]:
+        """
+        Load cached weights through a memory map.
+
+        The returned CPU tensors are backed by the page cache, so loading the same model
+        in several processes costs one copy of physical memory.
+
+        Raises:
+            KeyError: If no weights are cached under ``name``
+        """
+        entry = self.get_entry(name, "weights")
+        path = self.get_path(name, "weights", verify=verify)
+        if entry is None or path is None:
+            raise KeyError(f"No cached weights for model '{name}'")
+
+        if entry.format == "safetensors":
+            if safetensors_load is None:
+                raise RuntimeError("safetensors is required to load this artifact")
+            return safetensors_load(str(path), device="cpu")
+
+        return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+
+    def manifest(self) -> List[ArtifactEntry]:
+        """List every named artifact in the cache."""
+        return [ArtifactEntry(**e) for e in self._read_json(self.manifest_path).values()]
+
+    def total_size(self) -> int:
+        """Total size in bytes of all stored objects."""
+        return sum(obj["size"] for obj in self._read_json(self.index_path).values())
+
+    def garbage_collect(self) -> int:
+        """
+        Remove objects no manifest entry references any more.
+
+        Returns:
+            Number of bytes reclaimed
+        """
+        reclaimed = 0
+        with self._locked():
+            index = self._read_json(self.index_path)
+            for sha256, obj in list(index.items()):
+                if obj["refs"] > 0:
+                    continue
+                object_path = self._object_path(sha256)
+                if object_path.exists():
+                    object_path.unlink()
+                reclaimed += obj["size"]
+                del index[sha256]
+            self._write_json(self.index_path, index)
+
+        self.logger.info(f"Artifact cache GC reclaimed {reclaimed / 1e6:.1f}MB")
+        return reclaimed
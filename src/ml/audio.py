@@ -0,0 +1,239 @@
+# src/ml/audio.py
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from pathlib import Path
+from typing import AsyncIterator, Dict, List
+
+import numpy as np
+import torch
+
+from src.ml.batching import BatcherPool
+from src.ml.registry import ModelRegistry
+
+FRAME_S = 0.02  # Energy frame length used for silence detection
+
+
+@dataclass
+class AudioWindow:
+    """One analysis window cut from the audio stream"""
+    index: int
+    start: int  # First sample, absolute
+    samples: np.ndarray  # float32 mono PCM in [-1, 1]
+    overlap_before: int  # Samples shared with the previous window
+    last: bool = False
+
+
+async def extract_pcm(path: Path, sample_rate: int = 16000, chunk_bytes: int = 1 << 18) -> AsyncIterator[np.ndarray]:
+    """
+    Decode the audio track of any ffmpeg-readable media file as mono float32 chunks.
+
+    ffmpeg writes raw s16le PCM to a pipe that is read in fixed-size chunks, so memory
+    does not grow with media length.
+
+    Raises:
+        RuntimeError: If ffmpeg fails
+    """
+    process = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-i", str(path),
+        "-vn", "-ac", "1", "-ar", str(sample_rate), "-f", "s16le", "-",
+        stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+    )
+    remainder = b""
+    try:
+        while True:
+            data = await process.stdout.read(chunk_bytes)
+            if not data:
+                break
+            data = remainder + data
+            usable = len(data) - len(data) % 2
+            remainder = data[usable:]
+            yield np.frombuffer(data[:usable], dtype="<i2").astype(np.float32) / 32768.0
+
+        returncode = await process.wait()
+        if returncode != 0:
+            stderr = (await process.stderr.read()).decode(errors="replace")
+            raise RuntimeError(f"ffmpeg failed ({returncode}): {stderr.strip()}")
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+class AudioWindower:
+    """
+    Splits a PCM stream into overlapping windows cut at silences.
+
+    Each window aims for ``window_s`` seconds; its end is moved back to the quietest
+    frame within ``search_s`` seconds when that frame is below ``silence_db``, so cuts
+    rarely land in the middle of a word. Consecutive windows overlap by ``overlap_s``.
+    Only the unfinished tail is buffered.
+    """
+    def __init__(self, sample_rate: int = 16000, window_s: float = 30.0, overlap_s: float = 2.0,
+                 search_s: float = 3.0, silence_db: float = -40.0):
+        if overlap_s >= window_s:
+            raise ValueError("Window overlap must be shorter than the window")
+        self.sample_rate = sample_rate
+        self.window = int(window_s * sample_rate)
+        self.overlap = int(overlap_s * sample_rate)
+        self.search = min(int(search_s * sample_rate), self.window - self.overlap - 1)
+        self.frame = max(1, int(FRAME_S * sample_rate))
+        self.silence_rms = 10 ** (silence_db / 20)
+
+        self._buffer = np.empty(0, dtype=np.float32)
+        self._buffer_start = 0  # Absolute sample index of _buffer[0]
+        self._overlap_before = 0
+        self._index = 0
+
+    def _cut_point(self, samples: np.ndarray) -> int:
+        """Pick a window end within the search region, preferring silence."""
+        lo = self.window - self.search
+        region = samples[lo:self.window]
+        frames = len(region) // self.frame
+        if frames == 0:
+            return self.window
+        energy = np.sqrt(np.mean(region[:frames * self.frame].reshape(frames, self.frame) ** 2, axis=1))
+        quietest = int(np.argmin(energy))
+        if energy[quietest] > self.silence_rms:
+            return self.window
+        return lo + (quietest + 1) * self.frame
+
+    def _emit(self, end: int, last: bool = False) -> AudioWindow:
+        window = AudioWindow(self._index, self._buffer_start, self._buffer[:end].copy(),
+                             self._overlap_before, last)
+        self._index += 1
+        advance = end if last else max(1, end - self.overlap)
+        self._overlap_before = 0 if last else end - advance
+        self._buffer = self._buffer[advance:]
+        self._buffer_start += advance
+        return window
+
+    def push(self, chunk: np.ndarray) -> List[AudioWindow]:
+        """Add PCM samples and return every window that is now complete."""
+        self._buffer = np.concatenate([self._buffer, chunk])
+        windows = []
+        while len(self._buffer) > self.window:
+            windows.append(self._emit(self._cut_point(self._buffer)))
+        return windows
+
+    def flush(self) -> List[AudioWindow]:
+        """Emit the final, possibly short, window; nothing if no samples are left."""
+        if len(self._buffer) == 0:
+            return []
+        return [self._emit(len(self._buffer), last=True)]
+
+
+class AudioPipeline:
+    """
+    Streams timestamped model results for long audio with bounded memory.
+
+    Windows are encoded through the BatcherPool (so windows of concurrent requests
+    share batches), at most ``max_in_flight`` windows are outstanding per request,
+    and results are yielded strictly in window order as soon as they are ready.
+
+    The model is called as ``model(audio, lengths)`` with ``audio`` a zero-padded
+    ``(batch, samples)`` float32 tensor. It returns, per window, either a list of
+    segments ``{"start", "end", ...}`` in seconds relative to the window, or a tensor
+    that is reported as one segment spanning the window.
+    """
+    def __init__(self, registry: ModelRegistry, batchers: BatcherPool, model_name: str,
+                 sample_rate: int = 16000, window_s: float = 30.0, overlap_s: float = 2.0,
+                 max_in_flight: int = 8, log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.registry = registry
+        self.batchers = batchers
+        self.model_name = model_name
+        self.sample_rate = sample_rate
+        self.window_s = window_s
+        self.overlap_s = overlap_s
+        self.max_in_flight = max_in_flight
+
+    def _run_batch(self, windows: List[np.ndarray]) -> List:
+        lengths = torch.tensor([len(w) for w in windows])
+        audio = torch.zeros(len(windows), int(lengths.max()))
+        for i, samples in enumerate(windows):
+            audio[i, :len(samples)] = torch.from_numpy(samples)
+
+        device = self.registry.device
+        model = self.registry.get(self.model_name)
+        with torch.inference_mode():
+            outputs = model(audio.to(device), lengths.to(device))
+
+        results = []
+        for i, output in enumerate(outputs):
+            if isinstance(output, torch.Tensor):
+                output = [{"start": 0.0, "end": float(lengths[i]) / self.sample_rate,
+                           "output": output.cpu().tolist()}]
+            results.append(output)
+        return results
+
+    def _stitch(self, window: AudioWindow, segments: List[Dict]) -> List[Dict]:
+        """
+        Shift segments to absolute time and drop duplicates from overlaps.
+
+        Each overlap is split at its midpoint: a segment belongs to the window that
+        owns its midpoint.
+        """
+        offset = window.start / self.sample_rate
+        owned_from = (window.overlap_before / 2) / self.sample_rate
+        owned_to = float("inf")
+        if not window.last:
+            owned_to = (len(window.samples) - self.overlap_s * self.sample_rate / 2) / self.sample_rate
+
+        stitched = []
+        for segment in segments:
+            midpoint = (segment["start"] + segment["end"]) / 2
+            if window.index > 0 and midpoint < owned_from:
+                continue
+            if midpoint >= owned_to:
+                continue
+            stitched.append({**segment, "start": round(offset + segment["start"], 3),
+                             "end": round(offset + segment["end"], 3)})
+        return stitched
+
+    async def process(self, path: Path) -> AsyncIterator[Dict]:
+        """
+        Yield ``{"window", "start", "end", "segments"}`` for each window, in order.
+        """
+        windower = AudioWindower(self.sample_rate, self.window_s, self.overlap_s)
+        batcher = self.batchers.get(f"audio:{self.model_name}", lambda: self._run_batch)
+        in_flight: Dict[int, asyncio.Task] = {}
+        windows: Dict[int, AudioWindow] = {}
+        next_index = 0
+
+        async def drain(block: bool) -> AsyncIterator[Dict]:
+            nonlocal next_index
+            while next_index in in_flight and (block or in_flight[next_index].done()):
+                segments = await in_flight.pop(next_index)
+                window = windows.pop(next_index)
+                yield {
+                    "window": window.index,
+                    "start": round(window.start / self.sample_rate, 3),
+                    "end": round((window.start + len(window.samples)) / self.sample_rate, 3),
+                    "segments": self._stitch(window, segments)
+                }
+                next_index += 1
+                block = len(in_flight) >= self.max_in_flight
+
+        chunks = extract_pcm(path, self.sample_rate)
+        try:
+            async for chunk in chunks:
+                for window in windower.push(chunk):
+                    windows[window.index] = window
+                    in_flight[window.index] = asyncio.ensure_future(batcher.submit(window.samples))
+                async for result in drain(block=len(in_flight) >= self.max_in_flight):
+                    yield result
+
+            for window in windower.flush():
+                windows[window.index] = window
+                in_flight[window.index] = asyncio.ensure_future(batcher.submit(window.samples))
+            async for result in drain(block=True):
+                yield result
+        finally:
+            for task in in_flight.values():
+                task.cancel()
+            # Kills ffmpeg if the client went away mid-stream
+            await chunks.aclose()
@@ -0,0 +1,247 @@
+# src/ml/autotune.py
+
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import torch
+
+from src.ml.artifact_cache import ArtifactCache
+
+try:
+    import fcntl
+except ImportError:  # Windows development hosts
+    fcntl = None
+
+DEFAULT_BATCH_SIZES = (1, 2, 4, 8, 16, 32, 64, 128)
+DEFAULT_CONCURRENCY = (1, 2, 4, 8)
+
+
+@dataclass
+class TuningResult:
+    """Data class for the tuned serving parameters of one model on one device"""
+    model: str
+    model_hash: str  # sha256 of the weights artifact the measurements were taken with
+    device: str  # Device key, see device_key()
+    max_batch_size: int
+    max_concurrent: int
+    throughput: float  # Items per second at the chosen settings
+    p99_ms: float  # p99 batch latency at the chosen settings
+    slo_ms: float
+    measured_at: float  # Unix timestamp
+
+
+def device_key(device: torch.device) -> str:
+    """Stable, filesystem-safe identifier of the device model (not its index)."""
+    if device.type == "cuda":
+        name = torch.cuda.get_device_name(device)
+    else:
+        name = device.type
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+
+class Autotuner:
+    """
+    Measures the best batch size and concurrency for a model on the current device.
+
+    Batch sizes are swept upwards until the p99 batch latency exceeds the SLO (or the
+    device runs out of memory); the batch size with the highest throughput within the
+    SLO wins. Concurrency (batches in flight at once) is then swept at that batch size
+    and the smallest level within 5% of the best throughput is kept.
+
+    Results are stored under ``<cache root>/tuning/<model hash>-<device>.json``, so a
+    new checkpoint or a different card is tuned again while every other combination
+    is read back at startup.
+    """
+    def __init__(self, cache: ArtifactCache, slo_ms: float = 100.0,
+                 batch_sizes: Sequence[int] = DEFAULT_BATCH_SIZES,
+                 concurrency_levels: Sequence[int] = DEFAULT_CONCURRENCY,
+                 iterations: int = 10, log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.cache = cache
+        self.slo_ms = slo_ms
+        self.batch_sizes = sorted(batch_sizes)
+        self.concurrency_levels = sorted(concurrency_levels)
+        self.iterations = iterations
+        self.tuning_path = cache.root / "tuning"
+        self.tuning_path.mkdir(parents=True, exist_ok=True)
+
+    def _model_hash(self, name: str) -> str:
+        entry = self.cache.get_entry(name, "weights")
+        if entry is None:
+            raise KeyError(f"No cached weights for model '{name}'")
+        return entry.sha256
+
+    def _result_path(self, model_hash: str, device: torch.device) -> Path:
+        return self.tuning_path / f"{model_hash}-{device_key(device)}.json"
+
+    def load(self, name: str, device: torch.device) -> Optional[TuningResult]:
+        """
+        Read the stored tuning for the model's current weights on this device.
+
+        Returns:
+            TuningResult, or None if this combination has not been tuned
+        """
+        entry = self.cache.get_entry(name, "weights")
+        if entry is None:
+            return None
+        path = self._result_path(entry.sha256, device)
+        if not path.exists():
+            return None
+        with open(path) as f:
+            return TuningResult(**json.load(f))
+
+    @contextmanager
+    def _locked(self):
+        """Let one worker process tune at a time; measurements would contend otherwise."""
+        with open(self.tuning_path / ".lock", "a+") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+    def load_or_tune(self, name: str, model: torch.nn.Module, sample: torch.Tensor,
+                     device: torch.device) -> TuningResult:
+        """
+        Return the stored tuning, measuring it first if this combination is new.
+
+        Workers starting together block on a file lock, so only the first one tunes
+        and the others read its result.
+        """
+        with self._locked():
+            result = self.load(name, device)
+            if result is None:
+                result = self.tune(name, model, sample, device)
+            return result
+
+    def retune(self, name: str, model: torch.nn.Module, sample: torch.Tensor,
+               device: torch.device, slo_ms: Optional[float] = None) -> TuningResult:
+        """Measure again, replacing any stored tuning; waits for other workers' tuning runs."""
+        with self._locked():
+            return self.tune(name, model, sample, device, slo_ms)
+
+    def _save(self, result: TuningResult, device: torch.device):
+        path = self._result_path(result.model_hash, device)
+        fd, tmp_path = tempfile.mkstemp(dir=self.tuning_path, suffix=".tmp")
+        with os.fdopen(fd, "w") as f:
+            json.dump(asdict(result), f, indent=2)
+        os.replace(tmp_path, path)
+
+    def _time_batches(self, model: torch.nn.Module, batch: torch.Tensor, device: torch.device,
+                      concurrency: int) -> Dict[str, float]:
+        """Run ``iterations`` batches on each of ``concurrency`` threads."""
+        latencies: List[float] = []
+        lock = threading.Lock()
+
+        def worker():
+            local = []
+            with torch.inference_mode():
+                for _ in range(self.iterations):
+                    start = time.perf_counter()
+                    model(batch.to(device, non_blocking=True)).cpu()
+                    local.append(time.perf_counter() - start)
+            with lock:
+                latencies.extend(local)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for future in [pool.submit(worker) for _ in range(concurrency)]:
+                future.result()
+        elapsed = time.perf_counter() - start
+
+        return {
+            "throughput": len(latencies) * batch.shape[0] / elapsed,
+            "p99_ms": float(np.percentile(latencies, 99)) * 1000
+        }
+
+    def tune(self, name: str, model: torch.nn.Module, sample: torch.Tensor,
+             device: torch.device, slo_ms: Optional[float] = None) -> TuningResult:
+        """
+        Sweep batch size and concurrency for a model and persist the choice.
+
+        Args:
+            name: Model name in the artifact cache
+            model: Loaded model on ``device``
+            sample: One input item with a leading batch dimension of 1
+            device: Device the model runs on
+            slo_ms: Target p99 batch latency; defaults to the tuner's SLO
+
+        Returns:
+            The stored TuningResult
+        """
+        slo_ms = slo_ms or self.slo_ms
+        model_hash = self._model_hash(name)
+        self.logger.info(f"Autotuning '{name}' on {device_key(device)} (SLO {slo_ms}ms)")
+
+        best_batch, best = 1, None
+        for batch_size in self.batch_sizes:
+            batch = sample.expand(batch_size, *sample.shape[1:]).contiguous()
+            try:
+                self._time_batches(model, batch, device, 1)  # Warm up kernels and allocator
+                measured = self._time_batches(model, batch, device, 1)
+            except (RuntimeError, MemoryError) as e:
+                self.logger.info(f"Batch size {batch_size} failed, stopping sweep: {str(e)}")
+                break
+            finally:
+                if device.type == "cuda":
+                    torch.cuda.empty_cache()
+            self.logger.debug(f"'{name}' batch {batch_size}: {measured}")
+            if measured["p99_ms"] > slo_ms:
+                break
+            if best is None or measured["throughput"] > best["throughput"]:
+                best_batch, best = batch_size, measured
+
+        if best is None:
+            self.logger.warning(f"'{name}' misses the {slo_ms}ms SLO even at batch size 1")
+            best = self._time_batches(model, sample, device, 1)
+
+        batch = sample.expand(best_batch, *sample.shape[1:]).contiguous()
+        by_concurrency = {1: best}
+        for concurrency in self.concurrency_levels:
+            if concurrency == 1:
+                continue
+            try:
+                measured = self._time_batches(model, batch, device, concurrency)
+            except (RuntimeError, MemoryError) as e:
+                self.logger.info(f"Concurrency {concurrency} failed, stopping sweep: {str(e)}")
+                break
+            if measured["p99_ms"] > slo_ms:
+                break
+            by_concurrency[concurrency] = measured
+
+        # More batches in flight only pay off if they buy more than 5% throughput
+        top = max(measured["throughput"] for measured in by_concurrency.values())
+        best_concurrency = min(concurrency for concurrency, measured in by_concurrency.items()
+                               if measured["throughput"] >= top * 0.95)
+        chosen = by_concurrency[best_concurrency]
+
+        result = TuningResult(
+            model=name,
+            model_hash=model_hash,
+            device=device_key(device),
+            max_batch_size=best_batch,
+            max_concurrent=best_concurrency,
+            throughput=round(chosen["throughput"], 2),
+            p99_ms=round(chosen["p99_ms"], 3),
+            slo_ms=slo_ms,
+            measured_at=time.time()
+        )
+        self._save(result, device)
+        self.logger.info(f"Tuned '{name}': batch {best_batch}, concurrency {best_concurrency}, "
+                         f"{result.throughput:.1f} items/s, p99 {result.p99_ms:.1f}ms")
+        return result
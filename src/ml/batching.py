@@ -0,0 +1,226 @@
+# src/ml/batching.py
+
+import asyncio
+import contextvars
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import torch
+
+BatchFn = Callable[[List[Any]], List[Any]]
+
+
+class DynamicBatcher:
+    """
+    Collects concurrent requests into batches for one model or task.
+
+    Requests wait at most ``max_wait_ms`` for companions; a batch is flushed as
+    soon as it reaches ``max_batch_size``. Up to ``max_in_flight`` batches run at
+    once, each in a worker thread so the event loop keeps accepting requests while
+    the device is busy; while they are all busy, requests keep collecting and go
+    out as the next batch when one finishes.
+
+    Batch execution times go to ``metrics.observe_batch`` when a metrics object is
+    given. Each batch runs in the context of its first request, so per-request
+    context (log fields, the request ID used for exemplars) refers to a request
+    that is actually in the batch.
+    """
+    def __init__(self, name: str, batch_fn: BatchFn, max_batch_size: int = 32,
+                 max_wait_ms: float = 2.0, max_in_flight: int = 1,
+                 executor: Optional[ThreadPoolExecutor] = None, metrics=None,
+                 log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.name = name
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.max_in_flight = max(1, max_in_flight)
+        self.executor = executor or ThreadPoolExecutor(max_workers=self.max_in_flight,
+                                                       thread_name_prefix=f"batch-{name}")
+        self._threads = self.max_in_flight
+        self.metrics = metrics
+
+        self._queue: List[Tuple[Any, asyncio.Future, contextvars.Context]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._running = 0
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self.batches_run = 0
+        self.items_run = 0
+
+    async def submit(self, item: Any) -> Any:
+        """Queue one item and wait for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((item, future, contextvars.copy_context()))
+        self._idle.clear()
+
+        if len(self._queue) >= self.max_batch_size:
+            self._flush(loop)
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait, self._flush, loop)
+
+        return await future
+
+    def set_max_in_flight(self, max_in_flight: int):
+        """Change how many batches may run at once (e.g. from the autotuner)."""
+        max_in_flight = max(1, max_in_flight)
+        if max_in_flight > self._threads:
+            # Running batches finish on the old threads
+            previous = self.executor
+            self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix=f"batch-{self.name}")
+            self._threads = max_in_flight
+            previous.shutdown(wait=False)
+        self.max_in_flight = max_in_flight
+
+    def _flush(self, loop: asyncio.AbstractEventLoop):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        # Whatever cannot start now is flushed when a running batch finishes
+        while self._queue and self._running < self.max_in_flight:
+            batch = self._queue[:self.max_batch_size]
+            del self._queue[:self.max_batch_size]
+            # Requests cancelled while queued are dropped before they reach the device
+            batch = [entry for entry in batch if not entry[1].done()]
+            if batch:
+                # Counted as running from here, so drain() waits for batches not yet started
+                self._running += 1
+                batch[0][2].run(loop.create_task, self._run(batch))
+
+    async def _run(self, batch: List[Tuple[Any, asyncio.Future, contextvars.Context]]):
+        items = [item for item, _, _ in batch]
+        try:
+            start = time.perf_counter()
+            # run_in_executor does not carry context variables into the worker thread
+            context = contextvars.copy_context()
+            results = await asyncio.get_running_loop().run_in_executor(
+                self.executor, context.run, self.batch_fn, items
+            )
+            if self.metrics is not None:
+                self.metrics.observe_batch(self.name, time.perf_counter() - start)
+            for (_, future, _), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except Exception as e:
+            self.logger.exception(f"Batch for '{self.name}' failed")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._running -= 1
+            self.batches_run += 1
+            self.items_run += len(items)
+            if self._queue:
+                self._flush(asyncio.get_running_loop())
+            elif self._running == 0:
+                self._idle.set()
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Run everything queued right away and wait until no batch is running.
+
+        Returns:
+            True if the batcher went idle within ``timeout`` seconds
+        """
+        if self._queue:
+            self._flush(asyncio.get_running_loop())
+        if self._running == 0 and not self._queue:
+            self._idle.set()
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    def stats(self) -> Dict:
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_in_flight": self.max_in_flight,
+            "queued": len(self._queue),
+            "running": self._running,
+            "batches": self.batches_run,
+            "mean_batch_size": self.items_run / self.batches_run if self.batches_run else 0.0
+        }
+
+
+def tensor_batch_fn(model: torch.nn.Module, device: torch.device) -> BatchFn:
+    """
+    Batch function for tensor models: concatenate inputs along dim 0, run once, split.
+
+    Inputs with different trailing shapes are grouped and run separately.
+    """
+    def run(inputs: List[torch.Tensor]) -> List[torch.Tensor]:
+        groups: Dict[Tuple[int, ...], List[int]] = {}
+        for i, tensor in enumerate(inputs):
+            groups.setdefault(tuple(tensor.shape[1:]), []).append(i)
+
+        outputs: List[Optional[torch.Tensor]] = [None] * len(inputs)
+        with torch.inference_mode():
+            for indices in groups.values():
+                # A lone input (e.g. an already batched image tensor) is used without a copy
+                batch = inputs[indices[0]] if len(indices) == 1 else torch.cat([inputs[i] for i in indices])
+                batch = batch.to(device, non_blocking=True)
+                result = model(batch).cpu()
+                sizes = [inputs[i].shape[0] for i in indices]
+                for i, chunk in zip(indices, torch.split(result, sizes)):
+                    outputs[i] = chunk
+        return outputs
+    return run
+
+
+class BatcherPool:
+    """Lazily creates one DynamicBatcher per key (model name, task)."""
+    def __init__(self, max_batch_size: int = 32, max_wait_ms: float = 2.0, metrics=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.metrics = metrics
+        self._batchers: Dict[str, DynamicBatcher] = {}
+        self._batch_sizes: Dict[str, int] = {}  # Per-key overrides, e.g. from the autotuner
+        self._in_flight: Dict[str, int] = {}
+
+    def configure(self, key: str, max_batch_size: int, max_in_flight: Optional[int] = None):
+        """Override the batch size (and batches in flight) for one key, including an existing batcher."""
+        self._batch_sizes[key] = max_batch_size
+        if max_in_flight is not None:
+            self._in_flight[key] = max_in_flight
+        if key in self._batchers:
+            self._batchers[key].max_batch_size = max_batch_size
+            if max_in_flight is not None:
+                self._batchers[key].set_max_in_flight(max_in_flight)
+
+    def _create(self, key: str, batch_fn: BatchFn) -> DynamicBatcher:
+        return DynamicBatcher(key, batch_fn, max_batch_size=self._batch_sizes.get(key, self.max_batch_size),
+                              max_wait_ms=self.max_wait_ms, max_in_flight=self._in_flight.get(key, 1),
+                              metrics=self.metrics)
+
+    def replace(self, key: str, batch_fn: BatchFn) -> Optional[DynamicBatcher]:
+        """
+        Route new submissions for ``key`` to a fresh batcher.
+
+        Returns:
+            The previous batcher, still holding its queued work, so it can be drained
+        """
+        previous = self._batchers.get(key)
+        self._batchers[key] = self._create(key, batch_fn)
+        return previous
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Drain every batcher; True if all went idle within ``timeout`` seconds."""
+        results = await asyncio.gather(*(b.drain(timeout) for b in list(self._batchers.values())))
+        return all(results)
+
+    def get(self, key: str, factory: Callable[[], BatchFn]) -> DynamicBatcher:
+        batcher = self._batchers.get(key)
+        if batcher is None:
+            batcher = self._create(key, factory())
+            self._batchers[key] = batcher
+        return batcher
+
+    def stats(self) -> Dict[str, Dict]:
+        return {key: batcher.stats() for key, batcher in self._batchers.items()}
@@ -0,0 +1,278 @@
+# src/ml/generation.py
+
+import asyncio
+import itertools
+import logging
+from collections import deque
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Deque, List, Optional
+
+import torch
+
+from src.ml.kv_cache import PagedKVCache
+
+
+@dataclass
+class StepBatch:
+    """Flattened (ragged) batch for one decoding iteration"""
+    seq_ids: List[int]
+    input_ids: torch.Tensor  # (tokens,) new tokens of every sequence, concatenated
+    positions: torch.Tensor  # (tokens,) absolute position of each new token
+    slot_mapping: torch.Tensor  # (tokens,) KV cache slot each new token is written to
+    query_ranges: List[tuple]  # Per sequence (start, end) into the flat token arrays
+    context_slots: List[torch.Tensor]  # Per sequence, cache slots of its whole context
+    last_token_index: torch.Tensor  # (sequences,) index of each sequence's last new token
+
+
+@dataclass
+class Sequence:
+    """State of one generation request"""
+    seq_id: int
+    prompt: List[int]
+    max_new_tokens: int
+    temperature: float
+    queue: asyncio.Queue
+    output: List[int] = field(default_factory=list)
+    num_cached: int = 0  # Tokens whose keys/values are already in the cache
+    aborted: bool = False
+
+    @property
+    def tokens(self) -> List[int]:
+        return self.prompt + self.output
+
+
+class GenerationEngine:
+    """
+    Iteration-level (continuous) batching for autoregressive models.
+
+    Every decoding step runs one forward pass over all running sequences; new
+    requests are admitted between steps as soon as the paged KV cache has room for
+    their prompt, so a long generation never blocks short ones behind it. When the
+    cache runs out during decoding, the most recently admitted sequence is preempted
+    and later recomputed from its tokens.
+
+    The model is called as ``model(batch: StepBatch, cache: PagedKVCache)`` and returns
+    logits for each sequence's last token, shape ``(sequences, vocab)``. Its optional
+    ``max_positions`` and ``vocab_size`` attributes bound the requests it accepts, since
+    one out-of-range sequence would fail the shared forward pass of the whole batch.
+    """
+    def __init__(self, model: torch.nn.Module, cache: PagedKVCache, max_num_seqs: int = 32,
+                 max_step_tokens: int = 4096, eos_token_id: Optional[int] = None,
+                 log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.model = model
+        self.cache = cache
+        self.device = cache.k_cache.device
+        self.max_num_seqs = max_num_seqs
+        self.max_step_tokens = max_step_tokens
+        self.eos_token_id = eos_token_id
+        self.max_positions: Optional[int] = getattr(model, "max_positions", None)
+        self.vocab_size: Optional[int] = getattr(model, "vocab_size", None)
+
+        self.waiting: Deque[Sequence] = deque()
+        self.running: List[Sequence] = []
+        self._ids = itertools.count()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.steps = 0
+        self.tokens_generated = 0
+
+    def generate(self, prompt_ids: List[int], max_new_tokens: int = 128,
+                 temperature: float = 0.0) -> AsyncIterator[int]:
+        """
+        Stream generated token ids for a prompt.
+
+        The request is validated eagerly, so invalid input raises ``ValueError`` here
+        rather than on the first iteration. Closing the iterator early (e.g. the client
+        disconnected) aborts the sequence and returns its cache blocks at the next step.
+        """
+        if not prompt_ids:
+            raise ValueError("Prompt must contain at least one token")
+        if max_new_tokens < 1:
+            raise ValueError("max_new_tokens must be at least 1")
+        if self.vocab_size is not None and not all(0 <= t < self.vocab_size for t in prompt_ids):
+            raise ValueError(f"Prompt token ids must be in [0, {self.vocab_size})")
+        total = len(prompt_ids) + max_new_tokens
+        if self.max_positions is not None and total > self.max_positions:
+            raise ValueError(f"Prompt and generation length ({total}) exceed the model's "
+                             f"maximum of {self.max_positions} positions")
+        if self.cache.blocks_needed(-1, total) > self.cache.num_blocks:
+            raise ValueError("Prompt and generation length exceed the KV cache capacity")
+
+        seq = Sequence(next(self._ids), list(prompt_ids), max_new_tokens, temperature, asyncio.Queue())
+        return self._stream(seq)
+
+    async def _stream(self, seq: Sequence) -> AsyncIterator[int]:
+        self.waiting.append(seq)
+        self._ensure_running()
+
+        try:
+            while True:
+                item = await seq.queue.get()
+                if item is None:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            seq.aborted = True
+            self._wake.set()
+
+    def _ensure_running(self):
+        self._wake.set()
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def _loop(self):
+        while True:
+            self._reap_aborted()
+            if not self.running and not self.waiting:
+                self._wake.clear()
+                await self._wake.wait()
+                continue
+
+            batch = self._schedule()
+            if batch is None:
+                await asyncio.sleep(0.001)
+                continue
+
+            try:
+                logits = await asyncio.to_thread(self._forward, batch)
+            except Exception as e:
+                self.logger.exception("Generation step failed")
+                for seq in list(self.running):
+                    seq.queue.put_nowait(e)
+                    self._finish(seq, notify=False)
+                continue
+
+            self._process(batch, logits)
+
+    def _reap_aborted(self):
+        for seq in [s for s in self.running if s.aborted]:
+            self._finish(seq, notify=False)
+        self.waiting = deque(s for s in self.waiting if not s.aborted)
+
+    def _finish(self, seq: Sequence, notify: bool = True):
+        self.cache.free(seq.seq_id)
+        if seq in self.running:
+            self.running.remove(seq)
+        if notify:
+            seq.queue.put_nowait(None)
+
+    def _preempt(self) -> bool:
+        """Evict the most recently admitted sequence; it will be recomputed later."""
+        if len(self.running) <= 1:
+            return False
+        victim = self.running.pop()
+        self.cache.free(victim.seq_id)
+        victim.num_cached = 0
+        self.waiting.appendleft(victim)
+        self.logger.debug(f"Preempted sequence {victim.seq_id} to free KV cache blocks")
+        return True
+
+    def _schedule(self) -> Optional[StepBatch]:
+        # Running sequences first: each needs room for its pending tokens
+        for seq in list(self.running):
+            if seq not in self.running:
+                continue
+            while not self.cache.can_allocate(self.cache.blocks_needed(seq.seq_id, len(seq.tokens))):
+                if not self._preempt():
+                    break
+            if seq in self.running:
+                self.cache.allocate(seq.seq_id, len(seq.tokens))
+
+        # Then admit waiting sequences while the cache and step budget allow
+        step_tokens = sum(len(s.tokens) - s.num_cached for s in self.running)
+        while self.waiting and len(self.running) < self.max_num_seqs:
+            seq = self.waiting[0]
+            new_tokens = len(seq.tokens)
+            if self.running and step_tokens + new_tokens > self.max_step_tokens:
+                break
+            if not self.cache.can_allocate(self.cache.blocks_needed(seq.seq_id, new_tokens)):
+                break
+            self.waiting.popleft()
+            self.cache.allocate(seq.seq_id, new_tokens)
+            self.running.append(seq)
+            step_tokens += new_tokens
+
+        if not self.running:
+            return None
+        return self._build_batch(self.running)
+
+    def _build_batch(self, seqs: List[Sequence]) -> StepBatch:
+        input_ids, positions, slot_mapping, ranges, context_slots, last = [], [], [], [], [], []
+        offset = 0
+        for seq in seqs:
+            tokens = seq.tokens
+            start, end = seq.num_cached, len(tokens)
+            input_ids.extend(tokens[start:end])
+            positions.extend(range(start, end))
+            slot_mapping.append(self.cache.slots(seq.seq_id, start, end))
+            context_slots.append(self.cache.slots(seq.seq_id, 0, end))
+            ranges.append((offset, offset + end - start))
+            offset += end - start
+            last.append(offset - 1)
+
+        return StepBatch(
+            seq_ids=[seq.seq_id for seq in seqs],
+            input_ids=torch.tensor(input_ids, device=self.device),
+            positions=torch.tensor(positions, device=self.device),
+            slot_mapping=torch.cat(slot_mapping),
+            query_ranges=ranges,
+            context_slots=context_slots,
+            last_token_index=torch.tensor(last, device=self.device)
+        )
+
+    def _forward(self, batch: StepBatch) -> torch.Tensor:
+        with torch.inference_mode():
+            return self.model(batch, self.cache).float().cpu()
+
+    def _process(self, batch: StepBatch, logits: torch.Tensor):
+        self.steps += 1
+        seqs = {seq.seq_id: seq for seq in self.running}
+        for i, seq_id in enumerate(batch.seq_ids):
+            seq = seqs.get(seq_id)
+            if seq is None or seq.aborted:
+                continue
+
+            seq.num_cached = len(seq.tokens)
+            token = self._sample(logits[i], seq.temperature)
+            seq.output.append(token)
+            seq.queue.put_nowait(token)
+            self.tokens_generated += 1
+
+            if token == self.eos_token_id or len(seq.output) >= seq.max_new_tokens:
+                self._finish(seq)
+
+    @staticmethod
+    def _sample(logits: torch.Tensor, temperature: float) -> int:
+        if temperature <= 0:
+            return int(torch.argmax(logits))
+        probs = torch.softmax(logits / temperature, dim=-1)
+        return int(torch.multinomial(probs, 1))
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Wait until every admitted and waiting sequence has finished.
+
+        Returns:
+            True if the engine went idle within ``timeout`` seconds
+        """
+        loop = asyncio.get_running_loop()
+        deadline = None if timeout is None else loop.time() + timeout
+        while self.running or self.waiting:
+            if deadline is not None and loop.time() >= deadline:
+                return False
+            await asyncio.sleep(0.01)
+        return True
+
+    def stats(self):
+        return {
+            "running": len(self.running),
+            "waiting": len(self.waiting),
+            "steps": self.steps,
+            "tokens_generated": self.tokens_generated,
+            "kv_cache": self.cache.usage()
+        }
@@ -0,0 +1,193 @@
+# src/ml/image_preprocess.py
+
+import logging
+import queue
+import struct
+from concurrent.futures import ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+import cv2
+import numpy as np
+import torch
+
+# Reduced decode factors, largest first, with the matching cv2.imread flags. EXIF orientation
+# is ignored so decoded pixels keep the stored layout the header sizes describe
+_REDUCED_FLAGS = tuple((factor, flag | cv2.IMREAD_IGNORE_ORIENTATION) for factor, flag in (
+    (8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)))
+_FULL_FLAG = cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+# JPEG start-of-frame markers (baseline, progressive, ...) that carry the image size
+_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+
+def image_size(data: bytes) -> Optional[Tuple[str, int, int]]:
+    """
+    Format, width and height from a JPEG or PNG header, without decoding.
+
+    Returns:
+        ``(format, width, height)``, or None for other or malformed data
+    """
+    if data[:8] == b"\x89PNG\r\n\x1a\n" and len(data) >= 24:
+        width, height = struct.unpack(">II", data[16:24])
+        return "png", width, height
+    if data[:2] != b"\xff\xd8":
+        return None
+    offset = 2
+    while offset + 9 <= len(data):
+        if data[offset] != 0xFF:
+            return None
+        marker = data[offset + 1]
+        if marker == 0xFF:  # Fill byte
+            offset += 1
+            continue
+        if marker in _SOF_MARKERS:
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            return "jpeg", width, height
+        offset += 2 + struct.unpack(">H", data[offset + 2:offset + 4])[0]
+    return None
+
+
+@dataclass
+class LetterboxInfo:
+    """Data class mapping model coordinates back to one original image"""
+    width: int  # Original width
+    height: int  # Original height
+    scale: float  # Model pixels per original pixel
+    pad_x: int  # Left padding in model pixels
+    pad_y: int  # Top padding in model pixels
+
+
+class ImageBatchPreprocessor:
+    """
+    Turns a batch of encoded images into one model-ready NCHW tensor.
+
+    Images are decoded in parallel threads (OpenCV releases the GIL). JPEGs larger
+    than needed are decoded at 1/2, 1/4 or 1/8 scale straight from the DCT
+    coefficients (``IMREAD_REDUCED_*``), chosen from the header so the result is
+    never smaller than the target. Each image is resized into its letterboxed slot
+    of a reused, contiguous ``(N, H, W, 3)`` uint8 staging buffer, so there are no
+    per-image arrays after decoding. The staging buffer is then converted in one
+    vectorized step (layout, BGR to RGB, dtype, normalization) into a freshly
+    allocated NCHW tensor, on the model device when it is a GPU, in which case only
+    the uint8 buffer crosses the bus.
+
+    EXIF orientation is not applied: images are used as stored, which keeps the
+    letterbox geometry consistent with the header size. Clients that need upright
+    images rotate them before upload.
+    """
+    def __init__(self, height: int, width: int, dtype: torch.dtype = torch.float16,
+                 mean: Sequence[float] = (123.675, 116.28, 103.53),
+                 std: Sequence[float] = (58.395, 57.12, 57.375),
+                 fill: int = 114, max_batch_size: int = 32, max_workers: int = 4,
+                 device: Optional[torch.device] = None, log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.height = height
+        self.width = width
+        self.dtype = dtype
+        self.fill = fill
+        self.max_batch_size = max_batch_size
+        self.device = device or torch.device("cpu")
+        # Normalization on the 0-255 scale, RGB order (unused for integer outputs)
+        self.mean = torch.tensor(mean, device=self.device).view(1, 3, 1, 1).to(dtype)
+        self.inv_std = (1 / torch.tensor(std, device=self.device)).view(1, 3, 1, 1).to(dtype)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="image-decode")
+        self._buffers: "queue.SimpleQueue[torch.Tensor]" = queue.SimpleQueue()
+
+    def _acquire_buffer(self) -> torch.Tensor:
+        try:
+            return self._buffers.get_nowait()
+        except queue.Empty:
+            buffer = torch.empty((self.max_batch_size, self.height, self.width, 3), dtype=torch.uint8)
+            return buffer.pin_memory() if self.device.type == "cuda" else buffer
+
+    def _reduced_flag(self, data: bytes) -> int:
+        header = image_size(data)
+        if header is None or header[0] != "jpeg":
+            return _FULL_FLAG
+        _, width, height = header
+        for factor, flag in _REDUCED_FLAGS:
+            if width // factor >= self.width and height // factor >= self.height:
+                return flag
+        return _FULL_FLAG
+
+    def _decode_into(self, slot: np.ndarray, data: bytes) -> LetterboxInfo:
+        flag = self._reduced_flag(data)
+        image = cv2.imdecode(np.frombuffer(data, np.uint8), flag)
+        if image is None:
+            raise ValueError("Image could not be decoded")
+        header = image_size(data)
+        original = (header[1], header[2]) if header else (image.shape[1], image.shape[0])
+
+        h, w = image.shape[:2]
+        scale = min(self.height / h, self.width / w)
+        new_w, new_h = max(1, round(w * scale)), max(1, round(h * scale))
+        top, left = (self.height - new_h) // 2, (self.width - new_w) // 2
+
+        # Only the borders need the fill value; the image covers the rest
+        slot[:top] = self.fill
+        slot[top + new_h:] = self.fill
+        slot[top:top + new_h, :left] = self.fill
+        slot[top:top + new_h, left + new_w:] = self.fill
+        target = slot[top:top + new_h, left:left + new_w]
+        if (new_w, new_h) == (w, h):
+            target[...] = image
+        else:
+            # Reduced decoding leaves at most 2x to shrink, which bilinear handles well
+            interpolation = cv2.INTER_AREA if scale < 0.5 else cv2.INTER_LINEAR
+            cv2.resize(image, (new_w, new_h), dst=target, interpolation=interpolation)
+
+        return LetterboxInfo(width=original[0], height=original[1],
+                             scale=new_w / original[0], pad_x=left, pad_y=top)
+
+    def __call__(self, images: List[bytes]) -> Tuple[torch.Tensor, List[LetterboxInfo]]:
+        """
+        Decode, letterbox and normalize a batch of encoded images.
+
+        Args:
+            images: Encoded images (JPEG, PNG, anything cv2.imdecode reads)
+
+        Returns:
+            ``(N, 3, H, W)`` tensor in RGB order on the configured device, and the
+            letterbox geometry of every image
+
+        Raises:
+            ValueError: If the batch is too large or an image cannot be decoded
+        """
+        if len(images) > self.max_batch_size:
+            raise ValueError(f"Batch of {len(images)} images exceeds {self.max_batch_size}")
+        buffer = self._acquire_buffer()
+        try:
+            staging = buffer[:len(images)]
+            slots = staging.numpy()
+            futures = [self._executor.submit(self._decode_into, slots[i], data)
+                       for i, data in enumerate(images)]
+            # Every decode must finish before the buffer can go back to the pool
+            wait(futures)
+            infos = []
+            for i, future in enumerate(futures):
+                try:
+                    infos.append(future.result())
+                except ValueError as e:
+                    raise ValueError(f"Image {i}: {str(e)}")
+            return self._to_tensor(staging), infos
+        finally:
+            self._buffers.put(buffer)
+
+    def _to_tensor(self, staging: torch.Tensor) -> torch.Tensor:
+        staging = staging.to(self.device, non_blocking=True)
+        if self.device.type == "cuda":
+            # The pinned staging buffer is reused once the upload has finished
+            uploaded = torch.cuda.Event()
+            uploaded.record(torch.cuda.current_stream(self.device))
+            uploaded.synchronize()
+
+        output = torch.empty((staging.shape[0], 3, self.height, self.width), dtype=self.dtype, device=self.device)
+        # NHWC BGR -> NCHW RGB, converting the dtype in the same copy
+        for channel in range(3):
+            output[:, channel].copy_(staging[..., 2 - channel])
+        if self.dtype.is_floating_point:
+            output.sub_(self.mean).mul_(self.inv_std)
+        return output
@@ -0,0 +1,84 @@
+# src/ml/kv_cache.py
+
+import logging
+from typing import Dict, List
+
+import torch
+
+
+class PagedKVCache:
+    """
+    Block-paged key/value cache shared by every sequence of a generation engine.
+
+    Keys and values live in two preallocated tensors of shape
+    ``(layers, num_blocks * block_size, heads, head_dim)``. Each sequence owns a
+    block table (list of block ids); token ``p`` of a sequence is stored in slot
+    ``table[p // block_size] * block_size + p % block_size``. Memory is only
+    committed one block at a time, so short and long sequences share the budget
+    without fragmentation.
+    """
+    def __init__(self, num_layers: int, num_heads: int, head_dim: int, memory_budget_bytes: int,
+                 block_size: int = 16, dtype: torch.dtype = torch.float16,
+                 device: torch.device = torch.device("cpu"), log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.num_layers = num_layers
+        self.block_size = block_size
+        element_size = torch.empty((), dtype=dtype).element_size()
+        bytes_per_block = 2 * num_layers * block_size * num_heads * head_dim * element_size
+        self.num_blocks = max(1, memory_budget_bytes // bytes_per_block)
+
+        shape = (num_layers, self.num_blocks * block_size, num_heads, head_dim)
+        self.k_cache = torch.zeros(shape, dtype=dtype, device=device)
+        self.v_cache = torch.zeros(shape, dtype=dtype, device=device)
+
+        self.free_blocks: List[int] = list(range(self.num_blocks - 1, -1, -1))
+        self.block_tables: Dict[int, List[int]] = {}
+        self.logger.info(f"Paged KV cache: {self.num_blocks} blocks of {block_size} tokens "
+                         f"({self.num_blocks * bytes_per_block / 1e6:.1f}MB)")
+
+    def blocks_needed(self, seq_id: int, num_tokens: int) -> int:
+        """Additional blocks required for ``seq_id`` to hold ``num_tokens`` tokens."""
+        have = len(self.block_tables.get(seq_id, ()))
+        need = -(-num_tokens // self.block_size)
+        return max(0, need - have)
+
+    def can_allocate(self, num_blocks: int) -> bool:
+        return num_blocks <= len(self.free_blocks)
+
+    def allocate(self, seq_id: int, num_tokens: int):
+        """
+        Grow a sequence's block table to hold ``num_tokens`` tokens.
+
+        Raises:
+            MemoryError: If the cache is out of blocks
+        """
+        needed = self.blocks_needed(seq_id, num_tokens)
+        if needed > len(self.free_blocks):
+            raise MemoryError("KV cache is out of blocks")
+        table = self.block_tables.setdefault(seq_id, [])
+        for _ in range(needed):
+            table.append(self.free_blocks.pop())
+
+    def free(self, seq_id: int):
+        self.free_blocks.extend(self.block_tables.pop(seq_id, ()))
+
+    def slots(self, seq_id: int, start: int, end: int) -> torch.Tensor:
+        """Flat cache slots for token positions ``[start, end)`` of a sequence."""
+        table = torch.tensor(self.block_tables[seq_id], device=self.k_cache.device)
+        positions = torch.arange(start, end, device=self.k_cache.device)
+        return table[positions // self.block_size] * self.block_size + positions % self.block_size
+
+    def write(self, layer: int, slots: torch.Tensor, k: torch.Tensor, v: torch.Tensor):
+        """Store keys/values of shape ``(tokens, heads, head_dim)`` at the given slots."""
+        self.k_cache[layer].index_copy_(0, slots, k.to(self.k_cache.dtype))
+        self.v_cache[layer].index_copy_(0, slots, v.to(self.v_cache.dtype))
+
+    def gather(self, layer: int, slots: torch.Tensor):
+        """Keys and values for the given slots, each ``(tokens, heads, head_dim)``."""
+        return self.k_cache[layer].index_select(0, slots), self.v_cache[layer].index_select(0, slots)
+
+    def usage(self) -> Dict[str, int]:
+        return {"total_blocks": self.num_blocks, "free_blocks": len(self.free_blocks),
+                "sequences": len(self.block_tables)}
@@ -0,0 +1,428 @@
+# src/ml/model_host.py
+
+import asyncio
+import errno
+import logging
+import os
+import select
+import struct
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import torch
+
+from src.ml.artifact_cache import ArtifactCache
+from src.ml.registry import ModelRegistry
+
+try:
+    import fcntl
+except ImportError:  # Windows development hosts
+    fcntl = None
+
+# Slot states
+SLOT_FREE = 0
+SLOT_CLAIMED = 1
+SLOT_REQUEST = 2
+SLOT_DONE = 3
+SLOT_ERROR = 4
+SLOT_RUNNING = 5  # Taken by the host
+SLOT_ABANDONED = 6  # Client gave up while the host was running it; the host frees it
+
+# Slot header: state, model name, dtype code, ndim, shape[MAX_DIMS], payload bytes
+MAX_DIMS = 6
+MODEL_NAME_BYTES = 64
+HEADER_FORMAT = f"<I{MODEL_NAME_BYTES}sBB{MAX_DIMS}qQ"
+FIELDS_FORMAT = f"<{MODEL_NAME_BYTES}sBB{MAX_DIMS}qQ"  # Header without the state word
+HEADER_SIZE = 128
+assert struct.calcsize(HEADER_FORMAT) <= HEADER_SIZE
+
+DTYPE_CODES = {
+    torch.float32: 0,
+    torch.float16: 1,
+    torch.bfloat16: 2,
+    torch.int64: 3,
+    torch.int32: 4,
+    torch.uint8: 5,
+    torch.bool: 6,
+}
+CODE_DTYPES = {code: dtype for dtype, code in DTYPE_CODES.items()}
+
+
+class TensorRing:
+    """
+    Fixed-size ring of tensor slots in a named shared-memory segment.
+
+    Each slot is a header followed by a payload area. A request is written into a
+    slot by an API worker, the model host reads it through ``torch.frombuffer``
+    (no copy), runs the model and writes the output back into the same slot.
+    The state word is written last so a reader never sees a half-written payload.
+
+    State changes that both sides may attempt at once (the host taking or finishing
+    a request, a client giving up on it) happen under a cross-process lock, so a
+    slot a client abandoned is freed by the host once it has finished writing to
+    it, never while it still does. Clients ring a FIFO doorbell after publishing a
+    request so an idle host blocks instead of polling.
+    """
+    def __init__(self, name: str, num_slots: int, slot_bytes: int, create: bool = False):
+        self.name = name
+        self.num_slots = num_slots
+        self.slot_bytes = slot_bytes
+        self.stride = HEADER_SIZE + slot_bytes
+
+        size = self.stride * num_slots
+        if create:
+            try:
+                stale = shared_memory.SharedMemory(name=name)
+                stale.close()
+                stale.unlink()
+            except FileNotFoundError:
+                pass
+            self.shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+            self.shm.buf[:size] = bytes(size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+
+        base = Path("/dev/shm" if Path("/dev/shm").exists() else "/tmp")
+        self.lock_path = base / f"{name}.lock"
+        self.doorbell_path = base / f"{name}.doorbell"
+        self._lock_file = None
+        self._thread_lock = threading.Lock()  # flock does not exclude threads of one process
+        self._doorbell_fd: Optional[int] = None
+        if create and hasattr(os, "mkfifo"):
+            self.doorbell_path.unlink(missing_ok=True)
+            os.mkfifo(self.doorbell_path)
+
+    @contextmanager
+    def _lock(self):
+        """Cross-process lock for slot state transitions."""
+        with self._thread_lock:
+            if self._lock_file is None:
+                self._lock_file = open(self.lock_path, "a+")
+            if fcntl is not None:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _offset(self, slot: int) -> int:
+        return slot * self.stride
+
+    def state(self, slot: int) -> int:
+        offset = self._offset(slot)
+        return struct.unpack_from("<I", self.shm.buf, offset)[0]
+
+    def set_state(self, slot: int, state: int):
+        struct.pack_into("<I", self.shm.buf, self._offset(slot), state)
+
+    def claim(self) -> Optional[int]:
+        """Claim a free slot, or return None if the ring is full."""
+        with self._lock():
+            for slot in range(self.num_slots):
+                if self.state(slot) == SLOT_FREE:
+                    self.set_state(slot, SLOT_CLAIMED)
+                    return slot
+        return None
+
+    def release(self, slot: int):
+        """Free a slot the caller owns outright (claimed, or answered and read)."""
+        self.set_state(slot, SLOT_FREE)
+
+    def take(self, slots: List[int]) -> List[int]:
+        """Host side: mark request slots running; returns those still requested."""
+        taken = []
+        with self._lock():
+            for slot in slots:
+                if self.state(slot) == SLOT_REQUEST:
+                    self.set_state(slot, SLOT_RUNNING)
+                    taken.append(slot)
+        return taken
+
+    def abandon(self, slot: int):
+        """
+        Client side: give up on a request (timeout, cancellation).
+
+        A slot the host is still running is left to the host, which frees it after
+        writing its answer; any other slot is freed right away.
+        """
+        with self._lock():
+            self.set_state(slot, SLOT_ABANDONED if self.state(slot) == SLOT_RUNNING else SLOT_FREE)
+
+    def _publish(self, slot: int, state: int):
+        if state not in (SLOT_DONE, SLOT_ERROR):
+            self.set_state(slot, state)
+            return
+        with self._lock():
+            # Nobody is waiting for the answer any more
+            self.set_state(slot, SLOT_FREE if self.state(slot) == SLOT_ABANDONED else state)
+
+    def notify(self):
+        """Wake the host after publishing a request (best effort; the host also polls)."""
+        if not hasattr(os, "mkfifo"):
+            return
+        try:
+            if self._doorbell_fd is None:
+                self._doorbell_fd = os.open(self.doorbell_path, os.O_WRONLY | os.O_NONBLOCK)
+            os.write(self._doorbell_fd, b"\x01")
+        except OSError as e:
+            if e.errno != errno.EAGAIN:  # A full pipe already holds a wakeup
+                # No host reading (yet) or it restarted: reopen on the next request
+                if self._doorbell_fd is not None:
+                    os.close(self._doorbell_fd)
+                self._doorbell_fd = None
+
+    def wait(self, timeout: float):
+        """Host side: block until a client rings the doorbell or ``timeout`` passes."""
+        if not hasattr(os, "mkfifo"):
+            time.sleep(min(timeout, 0.001))
+            return
+        if self._doorbell_fd is None:
+            # Read-write, so the FIFO never reports end-of-file when no client has it open
+            self._doorbell_fd = os.open(self.doorbell_path, os.O_RDWR | os.O_NONBLOCK)
+        readable, _, _ = select.select([self._doorbell_fd], [], [], timeout)
+        if readable:
+            try:
+                while os.read(self._doorbell_fd, 4096):
+                    pass
+            except BlockingIOError:
+                pass
+
+    def write(self, slot: int, tensor: torch.Tensor, model_name: str = "", state: int = SLOT_REQUEST):
+        """
+        Copy a tensor into a slot and publish it with the given state.
+
+        Raises:
+            ValueError: If the tensor does not fit in a slot or has unsupported rank/dtype
+        """
+        tensor = tensor.detach().contiguous()
+        if tensor.dtype not in DTYPE_CODES:
+            raise ValueError(f"Unsupported dtype for shared-memory transfer: {tensor.dtype}")
+        if tensor.dim() > MAX_DIMS:
+            raise ValueError(f"Tensor rank {tensor.dim()} exceeds {MAX_DIMS}")
+
+        nbytes = tensor.numel() * tensor.element_size()
+        if nbytes > self.slot_bytes:
+            raise ValueError(f"Tensor of {nbytes} bytes exceeds slot size {self.slot_bytes}")
+
+        offset = self._offset(slot)
+        payload = self.payload_view(slot, tensor.dtype, tuple(tensor.shape))
+        payload.copy_(tensor.cpu() if tensor.device.type != "cpu" else tensor)
+
+        shape = list(tensor.shape) + [0] * (MAX_DIMS - tensor.dim())
+        # The state word is left alone: a client may be abandoning the slot meanwhile
+        struct.pack_into(FIELDS_FORMAT, self.shm.buf, offset + 4,
+                         model_name.encode()[:MODEL_NAME_BYTES], DTYPE_CODES[tensor.dtype],
+                         tensor.dim(), *shape, nbytes)
+        self._publish(slot, state)
+
+    def write_error(self, slot: int, message: str):
+        """Store an error message in the payload area and mark the slot failed."""
+        data = message.encode()[:self.slot_bytes]
+        start = self._offset(slot) + HEADER_SIZE
+        self.shm.buf[start:start + len(data)] = data
+        offset = self._offset(slot)
+        struct.pack_into(FIELDS_FORMAT, self.shm.buf, offset + 4, b"",
+                         DTYPE_CODES[torch.uint8], 1, len(data), *([0] * (MAX_DIMS - 1)), len(data))
+        self._publish(slot, SLOT_ERROR)
+
+    def header(self, slot: int) -> Tuple[str, torch.dtype, Tuple[int, ...]]:
+        fields = struct.unpack_from(HEADER_FORMAT, self.shm.buf, self._offset(slot))
+        model_name = fields[1].rstrip(b"\x00").decode()
+        dtype = CODE_DTYPES[fields[2]]
+        ndim = fields[3]
+        shape = tuple(fields[4:4 + ndim])
+        return model_name, dtype, shape
+
+    def payload_view(self, slot: int, dtype: torch.dtype, shape: Tuple[int, ...]) -> torch.Tensor:
+        """Zero-copy tensor view over a slot's payload area."""
+        start = self._offset(slot) + HEADER_SIZE
+        count = 1
+        for dim in shape:
+            count *= dim
+        if count == 0:
+            return torch.empty(shape, dtype=dtype)
+        return torch.frombuffer(self.shm.buf, dtype=dtype, count=count, offset=start).view(shape)
+
+    def read(self, slot: int) -> Tuple[str, torch.Tensor]:
+        """Zero-copy view of the tensor currently stored in a slot."""
+        model_name, dtype, shape = self.header(slot)
+        return model_name, self.payload_view(slot, dtype, shape)
+
+    def read_error(self, slot: int) -> str:
+        _, _, shape = self.header(slot)
+        start = self._offset(slot) + HEADER_SIZE
+        return bytes(self.shm.buf[start:start + shape[0]]).decode(errors="replace")
+
+    def close(self, unlink: bool = False):
+        if self._doorbell_fd is not None:
+            os.close(self._doorbell_fd)
+            self._doorbell_fd = None
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+        self.shm.close()
+        if unlink:
+            self.shm.unlink()
+            self.doorbell_path.unlink(missing_ok=True)
+
+
+class ModelHost:
+    """
+    Single process that owns the models and the GPUs.
+
+    API workers push requests into the shared TensorRing; the host drains every
+    pending slot, groups requests for the same model and input shape into one
+    batch, and writes each output back into its slot. Because all workers share
+    one ring, batching sees the traffic of the whole box. When idle it blocks on
+    the ring's doorbell, waking at least every ``idle_timeout`` seconds.
+    """
+    def __init__(self, ring: TensorRing, registry: ModelRegistry, max_batch_size: int = 32,
+                 idle_timeout: float = 0.05, log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.ring = ring
+        self.registry = registry
+        self.max_batch_size = max_batch_size
+        self.idle_timeout = idle_timeout
+        self._running = False
+
+    def pending(self) -> Dict[Tuple[str, torch.dtype, Tuple[int, ...]], List[int]]:
+        """Group pending request slots by (model, dtype, per-sample shape)."""
+        groups = defaultdict(list)
+        for slot in range(self.ring.num_slots):
+            if self.ring.state(slot) == SLOT_REQUEST:
+                model_name, dtype, shape = self.ring.header(slot)
+                groups[(model_name, dtype, shape[1:])].append(slot)
+        return groups
+
+    def process_once(self) -> int:
+        """
+        Run one pass over the ring.
+
+        Returns:
+            Number of requests completed
+        """
+        completed = 0
+        for (model_name, _, _), slots in self.pending().items():
+            for i in range(0, len(slots), self.max_batch_size):
+                # Requests abandoned since the scan are skipped (and already freed)
+                batch_slots = self.ring.take(slots[i:i + self.max_batch_size])
+                if batch_slots:
+                    completed += self._run_batch(model_name, batch_slots)
+        return completed
+
+    def _run_batch(self, model_name: str, slots: List[int]) -> int:
+        try:
+            model = self.registry.get(model_name)
+            inputs = [self.ring.read(slot)[1] for slot in slots]
+            sizes = [t.shape[0] for t in inputs]
+            batch = torch.cat(inputs).to(self.registry.device, non_blocking=True)
+
+            with torch.inference_mode():
+                outputs = model(batch)
+
+            for slot, output in zip(slots, torch.split(outputs, sizes)):
+                try:
+                    self.ring.write(slot, output, model_name, state=SLOT_DONE)
+                except ValueError as e:
+                    self.ring.write_error(slot, str(e))
+        except Exception as e:
+            self.logger.exception(f"Model host batch for '{model_name}' failed")
+            for slot in slots:
+                self.ring.write_error(slot, str(e))
+        return len(slots)
+
+    def serve_forever(self):
+        """Poll the ring until stopped."""
+        self._running = True
+        self.logger.info(f"Model host serving {self.ring.num_slots} slots on '{self.ring.name}'")
+        while self._running:
+            if self.process_once() == 0:
+                self.ring.wait(self.idle_timeout)
+
+    def stop(self):
+        self._running = False
+
+
+class ModelHostClient:
+    """
+    API-worker side of the model host: submits tensors and awaits results.
+
+    The answer is polled with exponential backoff from ``min_poll_interval`` up to
+    ``max_poll_interval``, so short requests return quickly and long ones cost
+    few wakeups.
+    """
+    def __init__(self, ring: TensorRing, min_poll_interval: float = 0.0001,
+                 max_poll_interval: float = 0.002, timeout: float = 30.0):
+        self.ring = ring
+        self.min_poll_interval = min_poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.timeout = timeout
+
+    async def infer(self, model_name: str, tensor: torch.Tensor) -> torch.Tensor:
+        """
+        Run a model in the host process.
+
+        Raises:
+            RuntimeError: If the ring is full or the host reports an error
+            TimeoutError: If the host does not answer in time
+        """
+        slot = self.ring.claim()
+        if slot is None:
+            raise RuntimeError("Model host queue is full")
+
+        try:
+            self.ring.write(slot, tensor, model_name)
+        except BaseException:
+            self.ring.release(slot)
+            raise
+        self.ring.notify()
+
+        answered = False
+        try:
+            deadline = time.monotonic() + self.timeout
+            delay = self.min_poll_interval
+            while True:
+                state = self.ring.state(slot)
+                if state == SLOT_DONE:
+                    answered = True
+                    # Clone so the slot can be reused as soon as it is released
+                    return self.ring.read(slot)[1].clone()
+                if state == SLOT_ERROR:
+                    answered = True
+                    raise RuntimeError(self.ring.read_error(slot))
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Model host did not answer within {self.timeout}s")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.max_poll_interval)
+        finally:
+            if answered:
+                self.ring.release(slot)
+            else:
+                # Timed out or cancelled: the host may still write into the slot
+                self.ring.abandon(slot)
+
+
+def run_model_host(shm_name: str, num_slots: int, slot_mb: int, cache_path: Path,
+                   builders: Dict[str, str], max_batch_size: int = 32,
+                   pipelines: Optional[Dict[str, List[str]]] = None, micro_batches: int = 4):
+    """Entry point for the model host process."""
+    logging.basicConfig(level=logging.INFO)
+    ring = TensorRing(shm_name, num_slots, slot_mb * 1024 * 1024, create=True)
+    registry = ModelRegistry(ArtifactCache(cache_path))
+    registry.register_entrypoints(builders)
+    for name, devices in (pipelines or {}).items():
+        registry.enable_pipeline(name, devices, micro_batches)
+
+    host = ModelHost(ring, registry, max_batch_size=max_batch_size)
+    try:
+        host.serve_forever()
+    finally:
+        ring.close(unlink=True)
@@ -0,0 +1,74 @@
+# src/ml/models/tiny_decoder.py
+
+import math
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+from src.ml.generation import StepBatch
+from src.ml.kv_cache import PagedKVCache
+
+
+class TinyDecoderLayer(nn.Module):
+    def __init__(self, dim: int, num_heads: int):
+        super().__init__()
+        self.num_heads = num_heads
+        self.head_dim = dim // num_heads
+        self.ln1 = nn.LayerNorm(dim)
+        self.qkv = nn.Linear(dim, 3 * dim)
+        self.proj = nn.Linear(dim, dim)
+        self.ln2 = nn.LayerNorm(dim)
+        self.mlp = nn.Sequential(nn.Linear(dim, 4 * dim), nn.GELU(), nn.Linear(4 * dim, dim))
+
+    def forward(self, x: torch.Tensor, layer: int, batch: StepBatch, cache: PagedKVCache) -> torch.Tensor:
+        tokens = x.shape[0]
+        q, k, v = self.qkv(self.ln1(x)).view(tokens, 3, self.num_heads, self.head_dim).unbind(1)
+        cache.write(layer, batch.slot_mapping, k, v)
+
+        attn = torch.empty_like(q)
+        for (start, end), slots in zip(batch.query_ranges, batch.context_slots):
+            keys, values = cache.gather(layer, slots)
+            context = keys.shape[0]
+            # (heads, new, head_dim) x (heads, context, head_dim); new tokens are the tail of the context
+            scores = torch.einsum("nhd,chd->hnc", q[start:end], keys.to(q.dtype)) / math.sqrt(self.head_dim)
+            query_pos = torch.arange(context - (end - start), context, device=x.device)
+            mask = query_pos[:, None] < torch.arange(context, device=x.device)[None, :]
+            scores = scores.masked_fill(mask, float("-inf"))
+            attn[start:end] = torch.einsum("hnc,chd->nhd", F.softmax(scores, dim=-1), values.to(q.dtype))
+
+        x = x + self.proj(attn.reshape(tokens, -1))
+        return x + self.mlp(self.ln2(x))
+
+
+class TinyDecoder(nn.Module):
+    """
+    Minimal GPT-style decoder implementing the GenerationEngine paged interface.
+
+    Small enough to run on CPU; used to exercise continuous batching and the paged
+    KV cache end to end without a real checkpoint.
+    """
+    def __init__(self, vocab_size: int = 256, dim: int = 64, num_layers: int = 2,
+                 num_heads: int = 4, max_positions: int = 2048):
+        super().__init__()
+        self.vocab_size = vocab_size
+        self.max_positions = max_positions
+        self.num_layers = num_layers
+        self.num_heads = num_heads
+        self.head_dim = dim // num_heads
+        self.embed = nn.Embedding(vocab_size, dim)
+        self.pos_embed = nn.Embedding(max_positions, dim)
+        self.layers = nn.ModuleList(TinyDecoderLayer(dim, num_heads) for _ in range(num_layers))
+        self.ln_f = nn.LayerNorm(dim)
+        self.head = nn.Linear(dim, vocab_size, bias=False)
+
+    def forward(self, batch: StepBatch, cache: PagedKVCache) -> torch.Tensor:
+        x = self.embed(batch.input_ids) + self.pos_embed(batch.positions)
+        for layer_idx, layer in enumerate(self.layers):
+            x = layer(x, layer_idx, batch, cache)
+        return self.head(self.ln_f(x[batch.last_token_index]))
+
+
+def build_tiny_decoder() -> TinyDecoder:
+    """Builder for ModelRegistry / MODEL_BUILDERS."""
+    return TinyDecoder()
@@ -0,0 +1,333 @@
+# src/ml/pipeline.py
+
+import logging
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import torch
+import torch.distributed as dist
+
+# Share of a device's free memory that stages may fill (activations need the rest)
+MEMORY_HEADROOM = 0.9
+
+
+def pipeline_layers(model: torch.nn.Module) -> List[torch.nn.Module]:
+    """
+    Ordered layers of a model that can be split into pipeline stages.
+
+    Models expose them with a ``pipeline_layers()`` method returning modules that
+    each map one tensor to one tensor; ``nn.Sequential`` models work as they are.
+
+    Raises:
+        ValueError: If the model cannot be split
+    """
+    if hasattr(model, "pipeline_layers"):
+        return list(model.pipeline_layers())
+    if isinstance(model, torch.nn.Sequential):
+        return list(model)
+    raise ValueError(f"{type(model).__name__} defines no pipeline_layers() and is not nn.Sequential")
+
+
+def module_bytes(module: torch.nn.Module) -> int:
+    """Memory taken by a module's parameters and buffers."""
+    tensors = list(module.parameters()) + list(module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+def device_capacity(device: torch.device) -> Optional[int]:
+    """Usable free memory of a CUDA device; None for CPU devices (no per-device limit)."""
+    if device.type != "cuda":
+        return None
+    free_bytes, _ = torch.cuda.mem_get_info(device)
+    return int(free_bytes * MEMORY_HEADROOM)
+
+
+def partition(sizes: Sequence[int], capacities: Sequence[float]) -> List[int]:
+    """
+    Split layers into contiguous stages, one per device, by memory.
+
+    Minimizes the largest ``stage memory / device capacity`` so every device is
+    filled to about the same fraction, which also balances compute for uniform
+    layers. Devices keep their order; a stage may be empty.
+
+    Args:
+        sizes: Memory of each layer in bytes
+        capacities: Memory available on each device
+
+    Returns:
+        Index of the first layer of every stage after the first (``len(capacities) - 1`` cuts)
+
+    Raises:
+        ValueError: If the layers do not fit on the devices
+    """
+    def cuts_for(ratio: float) -> Optional[List[int]]:
+        cuts, stage, load = [], 0, 0.0
+        for i, size in enumerate(sizes):
+            while load + size > ratio * capacities[stage]:
+                if stage == len(capacities) - 1:
+                    return None
+                cuts.append(i)
+                stage, load = stage + 1, 0.0
+            load += size
+        return cuts + [len(sizes)] * (len(capacities) - 1 - len(cuts))
+
+    if cuts_for(1.0) is None:
+        raise ValueError(f"Layers of {sum(sizes) / 2**20:.1f}MB do not fit on devices with "
+                         f"{[round(c / 2**20, 1) for c in capacities]}MB available")
+    # The optimum is a stage total divided by its capacity; bisect on the ratio
+    low, high = 0.0, 1.0
+    for _ in range(50):
+        middle = (low + high) / 2
+        if cuts_for(middle) is None:
+            low = middle
+        else:
+            high = middle
+    return cuts_for(high)
+
+
+def split_stages(model: torch.nn.Module, devices: Sequence[torch.device],
+                 capacities: Optional[Sequence[float]] = None) -> List[torch.nn.Sequential]:
+    """
+    Split a model into one ``nn.Sequential`` stage per device by measured memory.
+
+    Capacities default to the free memory of each CUDA device; CPU devices (used to
+    simulate several devices) are treated as equal.
+    """
+    layers = pipeline_layers(model)
+    sizes = [module_bytes(layer) for layer in layers]
+    if capacities is None:
+        measured = [device_capacity(d) for d in devices]
+        fallback = max(sum(sizes), 1)
+        capacities = [c if c is not None else fallback for c in measured]
+    cuts = partition(sizes, capacities)
+    bounds = [0] + cuts + [len(layers)]
+    return [torch.nn.Sequential(*layers[start:end]) for start, end in zip(bounds, bounds[1:])]
+
+
+@dataclass
+class _Job:
+    """One forward call travelling through the stages as micro-batches"""
+    outputs: List[Optional[torch.Tensor]]
+    remaining: int
+    done: threading.Event = field(default_factory=threading.Event)
+    error: Optional[BaseException] = None
+
+
+class PipelineModel(torch.nn.Module):
+    """
+    Pipeline-parallel execution of a model split across devices.
+
+    Each stage runs in its own thread on its own device. A batch is split into
+    ``micro_batches`` chunks that flow through the stages in order, so while stage
+    ``k`` works on chunk ``i`` stage ``k - 1`` already works on chunk ``i + 1`` and the
+    devices overlap (GPipe-style fill and drain, inference only). Concurrent calls
+    share the stage threads. With CPU devices the same code runs on host threads,
+    which is how the scheduling is exercised without GPUs.
+    """
+    def __init__(self, stages: Sequence[torch.nn.Module], devices: Sequence[torch.device],
+                 micro_batches: int = 4, log_level: int = logging.INFO):
+        super().__init__()
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        if len(stages) != len(devices):
+            raise ValueError(f"Got {len(stages)} stages for {len(devices)} devices")
+        self.devices = [torch.device(d) for d in devices]
+        self.stages = torch.nn.ModuleList(stage.to(device) for stage, device in zip(stages, self.devices))
+        self.micro_batches = micro_batches
+
+        self._queues: List[queue.Queue] = [queue.Queue() for _ in self.stages]
+        self._threads: List[threading.Thread] = []
+        self._start_lock = threading.Lock()
+        self.busy_s = [0.0] * len(self.stages)
+        self.chunks = [0] * len(self.stages)
+        self._started_at: Optional[float] = None
+
+    @classmethod
+    def from_model(cls, model: torch.nn.Module, devices: Sequence, micro_batches: int = 4,
+                   capacities: Optional[Sequence[float]] = None) -> "PipelineModel":
+        devices = [torch.device(d) for d in devices]
+        pipeline = cls(split_stages(model, devices, capacities), devices, micro_batches)
+        pipeline.logger.info("Split model into stages of " + ", ".join(
+            f"{len(stage)} layers/{module_bytes(stage) / 2**20:.1f}MB on {device}"
+            for stage, device in zip(pipeline.stages, devices)))
+        return pipeline
+
+    def _start(self):
+        with self._start_lock:
+            if self._threads:
+                return
+            self._started_at = time.perf_counter()
+            for index in range(len(self.stages)):
+                thread = threading.Thread(target=self._stage_loop, args=(index,),
+                                          name=f"pipeline-stage-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def _stage_loop(self, index: int):
+        stage, device = self.stages[index], self.devices[index]
+        last = index == len(self.stages) - 1
+        # Inference mode is thread-local, so it is entered in every stage thread
+        with torch.inference_mode():
+            while True:
+                item = self._queues[index].get()
+                if item is None:
+                    return
+                job, chunk, x = item
+                if job.error is not None:
+                    continue
+                try:
+                    start = time.perf_counter()
+                    y = stage(x.to(device))
+                    self.busy_s[index] += time.perf_counter() - start
+                    self.chunks[index] += 1
+                except BaseException as e:
+                    job.error = e
+                    job.done.set()
+                    continue
+
+                if not last:
+                    self._queues[index + 1].put((job, chunk, y))
+                    continue
+                job.outputs[chunk] = y
+                job.remaining -= 1  # Only the last stage thread touches this
+                if job.remaining == 0:
+                    job.done.set()
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        self._start()
+        chunks = x.chunk(min(self.micro_batches, x.shape[0]) or 1)
+        job = _Job(outputs=[None] * len(chunks), remaining=len(chunks))
+        for index, chunk in enumerate(chunks):
+            self._queues[0].put((job, index, chunk))
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return torch.cat(job.outputs)
+
+    def close(self):
+        """Stop the stage threads."""
+        for q in self._queues:
+            q.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def stats(self) -> Dict:
+        """Per-stage memory, busy time and utilization since the first call."""
+        elapsed = time.perf_counter() - self._started_at if self._started_at else 0.0
+        return {
+            "micro_batches": self.micro_batches,
+            "stages": [
+                {
+                    "device": str(device),
+                    "layers": len(stage),
+                    "memory_mb": round(module_bytes(stage) / 2**20, 2),
+                    "chunks": self.chunks[i],
+                    "busy_s": round(self.busy_s[i], 4),
+                    "utilization": round(self.busy_s[i] / elapsed, 4) if elapsed else 0.0
+                }
+                for i, (stage, device) in enumerate(zip(self.stages, self.devices))
+            ]
+        }
+
+
+# Point-to-point transfer of tensors whose shape the receiver does not know yet
+_DTYPES = [torch.float32, torch.float16, torch.bfloat16, torch.float64,
+           torch.int64, torch.int32, torch.uint8, torch.bool]
+_MAX_DIMS = 8
+_STOP = -1
+
+
+def _header(tensor: Optional[torch.Tensor]) -> torch.Tensor:
+    header = torch.full((_MAX_DIMS + 2,), 0, dtype=torch.int64)
+    if tensor is None:
+        header[0] = _STOP
+        return header
+    header[0] = tensor.dim()
+    header[1] = _DTYPES.index(tensor.dtype)
+    header[2:2 + tensor.dim()] = torch.tensor(tensor.shape)
+    return header
+
+
+def recv_tensor(src: int) -> Optional[torch.Tensor]:
+    """Receive a tensor sent with ``send_tensor``; None is the stop signal."""
+    header = torch.empty(_MAX_DIMS + 2, dtype=torch.int64)
+    dist.recv(header, src)
+    ndim = int(header[0])
+    if ndim == _STOP:
+        return None
+    tensor = torch.empty(header[2:2 + ndim].tolist(), dtype=_DTYPES[int(header[1])])
+    dist.recv(tensor, src)
+    return tensor
+
+
+def send_tensor(tensor: Optional[torch.Tensor], dst: int, blocking: bool = True):
+    """Send a tensor (or the stop signal, None) with its shape; returns pending works if non-blocking."""
+    header = _header(tensor)
+    tensors = [header] if tensor is None else [header, tensor.contiguous().cpu()]
+    if blocking:
+        for t in tensors:
+            dist.send(t, dst)
+        return []
+    return [(dist.isend(t, dst), t) for t in tensors]
+
+
+def serve_stage(stage: torch.nn.Module, device: Optional[torch.device] = None):
+    """
+    Run one pipeline stage in a worker process until the driver stops the pipeline.
+
+    Rank ``r`` receives micro-batches from ``r - 1`` and sends its outputs to
+    ``r + 1``; the last rank returns them to the driver (rank 0).
+    """
+    rank, world_size = dist.get_rank(), dist.get_world_size()
+    device = device or torch.device("cpu")
+    stage = stage.to(device).eval()
+    downstream = (rank + 1) % world_size
+    with torch.inference_mode():
+        while True:
+            x = recv_tensor(rank - 1)
+            if x is None:
+                if downstream != 0:
+                    send_tensor(None, downstream)
+                return
+            send_tensor(stage(x.to(device)), downstream)
+
+
+class DistributedPipeline:
+    """
+    Driver (rank 0) of a pipeline whose stages live in separate processes.
+
+    Rank 0 runs the first stage and sends micro-batches on without waiting, so the
+    other ranks (running ``serve_stage``) work on earlier micro-batches meanwhile;
+    the last rank sends results back. Tensors travel through ``torch.distributed``
+    point-to-point calls, so the gloo backend runs it on CPU-only hosts.
+    """
+    def __init__(self, first_stage: torch.nn.Module, micro_batches: int = 4):
+        if dist.get_rank() != 0:
+            raise RuntimeError("DistributedPipeline runs on rank 0; other ranks call serve_stage()")
+        self.first_stage = first_stage.eval()
+        self.micro_batches = micro_batches
+        self.world_size = dist.get_world_size()
+
+    @torch.inference_mode()
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        chunks = x.chunk(min(self.micro_batches, x.shape[0]) or 1)
+        if self.world_size == 1:
+            return torch.cat([self.first_stage(chunk) for chunk in chunks])
+
+        pending = []
+        for chunk in chunks:
+            pending += send_tensor(self.first_stage(chunk), 1, blocking=False)
+        outputs = [recv_tensor(self.world_size - 1) for _ in chunks]
+        for work, _ in pending:
+            work.wait()
+        return torch.cat(outputs)
+
+    def close(self):
+        """Stop every stage process."""
+        if self.world_size > 1:
+            send_tensor(None, 1)
@@ -0,0 +1,107 @@
+# src/ml/rag.py
+
+import asyncio
+import logging
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import torch
+
+from src.ml.batching import BatcherPool
+from src.ml.registry import ModelRegistry
+from src.ml.vector_index import VectorIndex
+
+
+class RetrievalService:
+    """
+    Embedding and search front-end for the RAG workload.
+
+    Texts are encoded by an embedding model from the ModelRegistry and queries are
+    scored against the VectorIndex. Both steps go through the shared BatcherPool, so
+    concurrent requests are encoded and searched together just like inference.
+
+    The embedding model is called as ``model(input_ids, attention_mask)`` and may return
+    either pooled ``(batch, dim)`` embeddings or token states ``(batch, seq, dim)``,
+    which are mean-pooled over the attention mask.
+    """
+    def __init__(self, registry: ModelRegistry, index: VectorIndex, batchers: BatcherPool,
+                 model_name: str, max_length: int = 512, log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.registry = registry
+        self.index = index
+        self.batchers = batchers
+        self.model_name = model_name
+        self.max_length = max_length
+        self._tokenizer = None
+
+    @property
+    def tokenizer(self):
+        """Tokenizer loaded from the artifact cache entry ``tokenizer/<model_name>``."""
+        if self._tokenizer is None:
+            tokenizer = self.registry.load_tokenizer(self.model_name)
+            tokenizer.enable_truncation(self.max_length)
+            tokenizer.enable_padding()
+            self._tokenizer = tokenizer
+        return self._tokenizer
+
+    def _encode_batch(self, texts: List[str]) -> List[np.ndarray]:
+        encodings = self.tokenizer.encode_batch(texts)
+        device = self.registry.device
+        input_ids = torch.tensor([e.ids for e in encodings], device=device)
+        attention_mask = torch.tensor([e.attention_mask for e in encodings], device=device)
+
+        model = self.registry.get(self.model_name)
+        with torch.inference_mode():
+            output = model(input_ids, attention_mask)
+            if output.dim() == 3:
+                mask = attention_mask.unsqueeze(-1).to(output.dtype)
+                output = (output * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1)
+        return list(output.float().cpu().numpy())
+
+    def _search_batch(self, queries: List[Tuple[np.ndarray, int, Optional[int]]]) -> List[List]:
+        # One matrix product for every query in the batch, trimmed to each query's k
+        groups: Dict[Optional[int], List[int]] = {}
+        for i, (_, _, nprobe) in enumerate(queries):
+            groups.setdefault(nprobe, []).append(i)
+
+        results: List[Optional[List]] = [None] * len(queries)
+        for nprobe, indices in groups.items():
+            vectors = np.stack([queries[i][0] for i in indices])
+            k = max(queries[i][1] for i in indices)
+            for i, hits in zip(indices, self.index.search(vectors, k=k, nprobe=nprobe)):
+                results[i] = hits[:queries[i][1]]
+        return results
+
+    async def embed(self, texts: List[str]) -> np.ndarray:
+        """Encode texts through the embedding batcher."""
+        batcher = self.batchers.get(f"embed:{self.model_name}", lambda: self._encode_batch)
+        vectors = await asyncio.gather(*(batcher.submit(text) for text in texts))
+        return np.stack(vectors) if vectors else np.empty((0, self.index.dim), dtype=np.float32)
+
+    async def upsert(self, documents: List[Dict]) -> int:
+        """
+        Embed and store documents of the form ``{"id", "text", "metadata"}``.
+
+        Returns:
+            Number of documents written
+        """
+        vectors = await self.embed([doc["text"] for doc in documents])
+        payloads = [{"text": doc["text"], **doc.get("metadata", {})} for doc in documents]
+        keys = [str(doc["id"]) for doc in documents]
+        written = await asyncio.to_thread(self.index.upsert, keys, vectors, payloads)
+        await asyncio.to_thread(self.index.flush)
+        return written
+
+    async def delete(self, ids: List[str]) -> int:
+        removed = await asyncio.to_thread(self.index.delete, [str(i) for i in ids])
+        await asyncio.to_thread(self.index.flush)
+        return removed
+
+    async def search(self, query: str, k: int = 10, nprobe: Optional[int] = None) -> List[Dict]:
+        """Embed a query and return its top-k documents."""
+        vector = (await self.embed([query]))[0]
+        batcher = self.batchers.get("search", lambda: self._search_batch)
+        hits = await batcher.submit((vector, k, nprobe))
+        return [{"id": key, "score": score, "payload": payload} for key, score, payload in hits]
@@ -0,0 +1,242 @@
+# src/ml/registry.py
+
+import asyncio
+import importlib
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence
+
+import torch
+
+from src.ml.artifact_cache import ArtifactCache
+from src.ml.pipeline import PipelineModel
+
+try:
+    from tokenizers import Tokenizer
+except ImportError:
+    Tokenizer = None
+
+ModelBuilder = Callable[[], torch.nn.Module]
+
+
+@contextmanager
+def _meta_parameters():
+    """
+    Build modules with parameters moved to the meta device as they are registered,
+    while buffers are created for real (accelerate's ``include_buffers=False``).
+    """
+    register_parameter = torch.nn.Module.register_parameter
+
+    def register_meta_parameter(module, name, param):
+        register_parameter(module, name, param)
+        if param is not None:
+            param = module._parameters[name]
+            module._parameters[name] = type(param)(param.to("meta"), requires_grad=param.requires_grad)
+
+    torch.nn.Module.register_parameter = register_meta_parameter
+    try:
+        yield
+    finally:
+        torch.nn.Module.register_parameter = register_parameter
+
+
+class ModelRegistry:
+    """
+    Loads and holds the models served by this process.
+
+    Models are registered with a builder that constructs the module skeleton; the
+    weights come from the ArtifactCache and are attached with ``assign=True`` so CPU
+    models keep referencing the memory-mapped file instead of copying it. Models too
+    large for one device can be served pipeline-parallel across several.
+    """
+    def __init__(self, cache: ArtifactCache, device: Optional[torch.device] = None,
+                 log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.cache = cache
+        self.device = device or torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self._builders: Dict[str, ModelBuilder] = {}
+        self._models: Dict[str, torch.nn.Module] = {}
+        self._pipelines: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+
+        # Persist torch.compile/Inductor artifacts next to the weights
+        os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", str(cache.root / "compiled" / "inductor"))
+
+    def register(self, name: str, builder: ModelBuilder):
+        """
+        Register a model builder under a name.
+
+        Args:
+            name: Model name, also the weights artifact name in the cache
+            builder: Callable returning an uninitialized module of the right architecture
+        """
+        self._builders[name] = builder
+
+    def enable_pipeline(self, name: str, devices: Sequence[str], micro_batches: int = 4,
+                        capacities: Optional[Sequence[float]] = None):
+        """
+        Serve a model split into pipeline stages across devices.
+
+        Args:
+            name: Registered model name
+            devices: Devices in stage order, e.g. ``["cuda:0", "cuda:1"]``
+            micro_batches: Chunks each batch is split into so the stages overlap
+            capacities: Bytes available per device; measured free memory when omitted
+        """
+        self._pipelines[name] = (list(devices), micro_batches, capacities)
+
+    def register_entrypoints(self, entrypoints: Dict[str, str]):
+        """
+        Register builders given as ``"package.module:callable"`` strings.
+
+        This lets every process (API workers, the model host) build the same registry
+        from configuration alone.
+        """
+        for name, entrypoint in entrypoints.items():
+            module_name, _, attr = entrypoint.partition(":")
+            self.register(name, getattr(importlib.import_module(module_name), attr))
+
+    def save(self, name: str, model: torch.nn.Module):
+        """Write a model's weights into the artifact cache."""
+        self.cache.put_state_dict(name, model.state_dict())
+
+    def build(self, name: str, artifact: Optional[str] = None) -> torch.nn.Module:
+        """
+        Build a registered model with cached weights, without serving it yet.
+
+        Args:
+            name: Registered model name
+            artifact: Weights artifact to attach; defaults to ``name``
+
+        Raises:
+            KeyError: If the model is not registered or has no cached weights
+        """
+        if name not in self._builders:
+            raise KeyError(f"Model '{name}' is not registered")
+
+        start = time.time()
+        with torch.device("meta"):
+            model = self._builders[name]()
+        state_dict = self.cache.load_state_dict(artifact or name)
+        model.load_state_dict(state_dict, assign=True)
+        self._materialize_buffers(name, model)
+        model.eval()
+
+        if name in self._pipelines:
+            devices, micro_batches, capacities = self._pipelines[name]
+            model = PipelineModel.from_model(model, devices, micro_batches, capacities).eval()
+            placement = ", ".join(devices)
+        else:
+            if self.device.type != "cpu":
+                model = model.to(self.device)
+            placement = str(self.device)
+
+        self.logger.info(f"Built model '{name}' from '{artifact or name}' on {placement} "
+                         f"in {time.time() - start:.2f}s")
+        return model
+
+    def _materialize_buffers(self, name: str, model: torch.nn.Module):
+        """
+        Give non-persistent buffers (rotary frequencies, causal masks, ...) real values.
+
+        They are not in the state dict, so after a meta-device build they are still
+        on meta. Only if the model has any, it is built again with real buffers but
+        meta parameters, and those buffers are copied over.
+        """
+        missing = [buffer_name for buffer_name, buffer in model.named_buffers() if buffer.is_meta]
+        if not missing:
+            return
+
+        with _meta_parameters():
+            reference = self._builders[name]()
+        buffers = dict(reference.named_buffers())
+        for buffer_name in missing:
+            module_name, _, attr = buffer_name.rpartition(".")
+            model.get_submodule(module_name)._buffers[attr] = buffers[buffer_name]
+        self.logger.debug(f"Materialized {len(missing)} non-persistent buffers of '{name}'")
+
+    def activate(self, name: str, model: torch.nn.Module) -> Optional[torch.nn.Module]:
+        """
+        Atomically make ``model`` the served instance of ``name``.
+
+        Returns:
+            The previously served instance, which callers drain before dropping it
+        """
+        with self._lock:
+            previous = self._models.get(name)
+            self._models[name] = model
+        return previous
+
+    def load(self, name: str) -> torch.nn.Module:
+        """
+        Build a registered model, attach its cached weights and serve it.
+
+        Raises:
+            KeyError: If the model is not registered or has no cached weights
+        """
+        model = self.build(name)
+        self.activate(name, model)
+        return model
+
+    def load_tokenizer(self, name: str):
+        """
+        Load a fresh tokenizer from the artifact cache entry ``tokenizer/<name>``.
+
+        Raises:
+            KeyError: If no tokenizer is cached for the model
+        """
+        if Tokenizer is None:
+            raise RuntimeError("The tokenizers package is required to load tokenizers")
+        path = self.cache.get_path(name, "tokenizer")
+        if path is None:
+            raise KeyError(f"No cached tokenizer for model '{name}'")
+        return Tokenizer.from_file(str(path))
+
+    def get(self, name: str) -> torch.nn.Module:
+        """Return a loaded model, loading it on first use (once, however many threads ask)."""
+        model = self._models.get(name)
+        if model is not None:
+            return model
+        with self._lock:
+            load_lock = self._load_locks.setdefault(name, threading.Lock())
+        with load_lock:
+            model = self._models.get(name)
+            if model is None:
+                model = self.load(name)
+        return model
+
+    async def aget(self, name: str) -> torch.nn.Module:
+        """``get`` for the event loop: a first-use load runs in a worker thread."""
+        model = self._models.get(name)
+        if model is None:
+            model = await asyncio.to_thread(self.get, name)
+        return model
+
+    def retire(self, model: Optional[torch.nn.Module]):
+        """Stop a model that is no longer served (e.g. replaced by a swap) and free its memory."""
+        if isinstance(model, PipelineModel):
+            model.close()
+        if model is not None and torch.cuda.is_available():
+            del model
+            torch.cuda.empty_cache()
+
+    def unload(self, name: str):
+        """Drop a loaded model and release its device memory."""
+        with self._lock:
+            model = self._models.pop(name, None)
+        self.retire(model)
+
+    def pipeline_stats(self) -> Dict[str, Dict]:
+        """Stage placement and utilization of the loaded pipeline-parallel models."""
+        return {name: model.stats() for name, model in list(self._models.items())
+                if isinstance(model, PipelineModel)}
+
+    def loaded(self) -> List[str]:
+        """Names of currently loaded models."""
+        return list(self._models)
@@ -0,0 +1,295 @@
+# src/ml/shape_buckets.py
+
+import bisect
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import torch
+import torch.nn.functional as F
+
+from src.ml.batching import BatchFn
+
+EXECUTION_MODES = ("eager", "compile", "cuda_graph")
+
+Shape = Tuple[int, ...]
+
+
+@dataclass
+class BucketStats:
+    """Data class for the usage counters of one bucket"""
+    calls: int = 0
+    real_elements: int = 0  # Elements that carried client data
+    padded_elements: int = 0  # Elements actually computed
+    build_seconds: float = 0.0  # Compile / capture time paid on first use
+
+    @property
+    def waste(self) -> float:
+        return 1 - self.real_elements / self.padded_elements if self.padded_elements else 0.0
+
+
+class ShapeBucketer:
+    """
+    Rounds tensor shapes up to a fixed set of bucket shapes.
+
+    The batch dimension is rounded up to the next entry of ``batch_sizes`` and every
+    dynamic dimension (e.g. sequence length) to the next entry of ``dim_sizes``; all
+    other dimensions (features, channels) keep their exact size. Shapes with a dynamic
+    dimension beyond the largest size have no bucket.
+    """
+    def __init__(self, batch_sizes: Sequence[int] = (1, 2, 4, 8, 16, 32),
+                 dim_sizes: Sequence[int] = (8, 16, 32, 64, 128, 256, 512, 1024, 2048)):
+        self.batch_sizes = sorted(batch_sizes)
+        self.dim_sizes = sorted(dim_sizes)
+
+    @property
+    def max_batch(self) -> int:
+        return self.batch_sizes[-1]
+
+    @staticmethod
+    def _round_up(value: int, sizes: List[int]) -> Optional[int]:
+        index = bisect.bisect_left(sizes, value)
+        return sizes[index] if index < len(sizes) else None
+
+    def trailing_bucket(self, shape: Shape, dynamic_dims: Sequence[int] = ()) -> Optional[Shape]:
+        """
+        Bucket for the per-item shape (everything after the batch dimension).
+
+        Args:
+            shape: Per-item shape
+            dynamic_dims: Dimensions to round up, as indices into the full input
+                shape (1 is the first dimension after the batch)
+        """
+        bucket = tuple(self._round_up(dim, self.dim_sizes) if i + 1 in dynamic_dims else dim
+                       for i, dim in enumerate(shape))
+        return None if None in bucket else bucket
+
+    def bucket(self, shape: Shape, dynamic_dims: Sequence[int] = ()) -> Optional[Shape]:
+        """Bucket for a full ``(batch, ...)`` shape with ``batch <= max_batch``."""
+        trailing = self.trailing_bucket(shape[1:], dynamic_dims)
+        batch = self._round_up(shape[0], self.batch_sizes)
+        if trailing is None or batch is None:
+            return None
+        return (batch,) + trailing
+
+    @staticmethod
+    def pad(tensor: torch.Tensor, shape: Shape) -> Tuple[torch.Tensor, torch.Tensor]:
+        """
+        Zero-pad a tensor at the end of every dimension up to ``shape``.
+
+        Returns:
+            Tuple of (padded tensor, boolean mask that is True on real elements)
+        """
+        padding = []
+        for size, target in zip(reversed(tensor.shape), reversed(shape)):
+            padding.extend([0, target - size])
+        mask = torch.ones(tensor.shape, dtype=torch.bool, device=tensor.device)
+        return F.pad(tensor, padding), F.pad(mask, padding, value=False)
+
+    @staticmethod
+    def unpad(output: torch.Tensor, original: Shape, bucket: Shape) -> torch.Tensor:
+        """
+        Cut padding back out of a model output.
+
+        The batch dimension is always sliced; a later dimension is sliced when the
+        output has the bucket's size there, i.e. the model preserved that dimension.
+        """
+        index = [slice(0, original[0])]
+        for dim in range(1, min(output.dim(), len(bucket))):
+            if output.shape[dim] == bucket[dim] != original[dim]:
+                index.append(slice(0, original[dim]))
+            else:
+                index.append(slice(None))
+        return output[tuple(index)]
+
+
+class BucketedExecutor:
+    """
+    Runs a model on bucketed static shapes, with one executable per bucket.
+
+    Inputs are padded up to their bucket (and split when the batch exceeds the
+    largest batch bucket), so every call hits one of a small, fixed set of shapes:
+
+    - ``compile``: one ``torch.compile(dynamic=False)`` graph per bucket, on any device
+    - ``cuda_graph``: one captured CUDA graph per bucket, replayed with static buffers
+    - ``eager``: plain calls, still useful for cuDNN autotuning and stable allocations
+
+    Only the batch dimension and the dimensions a model lists in ``dynamic_dims``
+    (e.g. ``(1,)`` for ``(batch, sequence, features)`` inputs) are padded. Padding
+    changes the result of anything that reduces over the padded positions (softmax,
+    pooling, attention), so dimensions listed in ``reduction_dims`` are padded only
+    for models that set ``accepts_padding_mask = True``, which receive the mask as a
+    second argument. Shapes without a bucket run eagerly and are counted as overflow.
+    """
+    def __init__(self, model: torch.nn.Module, device: torch.device, bucketer: ShapeBucketer,
+                 mode: str = "compile", name: str = "model", log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        if mode not in EXECUTION_MODES:
+            raise ValueError(f"Unknown execution mode: {mode}")
+        if mode == "cuda_graph" and device.type != "cuda":
+            self.logger.info(f"CUDA graphs need a CUDA device, compiling '{name}' per bucket instead")
+            mode = "compile"
+
+        self.model = model
+        self.device = device
+        self.bucketer = bucketer
+        self.mode = mode
+        self.name = name
+        self.accepts_mask = getattr(model, "accepts_padding_mask", False)
+        self.dynamic_dims = tuple(getattr(model, "dynamic_dims", ()))
+        if any(dim < 1 for dim in self.dynamic_dims):
+            raise ValueError(f"dynamic_dims of '{name}' must be positive input dimensions, "
+                             f"got {self.dynamic_dims}")
+        reduced = set(getattr(model, "reduction_dims", ())) & set(self.dynamic_dims)
+        if reduced and not self.accepts_mask:
+            self.logger.warning(f"'{name}' reduces over dimensions {sorted(reduced)} without taking "
+                                f"a padding mask, keeping them exact")
+            self.dynamic_dims = tuple(dim for dim in self.dynamic_dims if dim not in reduced)
+
+        self._executables: Dict[Tuple[Shape, torch.dtype], Callable] = {}
+        self._stats: Dict[Tuple[Shape, torch.dtype], BucketStats] = {}
+        self._build_lock = threading.Lock()
+        self._run_locks: Dict[Tuple[Shape, torch.dtype], threading.Lock] = {}
+        self.overflow = 0
+
+    def trailing_bucket(self, shape: Shape) -> Optional[Shape]:
+        """Bucket for a per-item shape of this model."""
+        return self.bucketer.trailing_bucket(shape, self.dynamic_dims)
+
+    def _build(self, bucket: Shape, dtype: torch.dtype) -> Callable:
+        if self.mode == "compile":
+            # Graphs of every bucket are guarded on the same forward frame; keep them all
+            dynamo_config = torch._dynamo.config
+            limit_name = "recompile_limit" if hasattr(dynamo_config, "recompile_limit") else "cache_size_limit"
+            setattr(dynamo_config, limit_name, max(getattr(dynamo_config, limit_name), len(self._executables) + 8))
+
+            compiled = torch.compile(self.model, dynamic=False)
+            warmup = [torch.zeros(bucket, dtype=dtype, device=self.device)]
+            if self.accepts_mask:
+                warmup.append(torch.ones(bucket, dtype=torch.bool, device=self.device))
+            compiled(*warmup)  # Compile now so build_seconds reflects it
+            return compiled
+        if self.mode == "cuda_graph":
+            return self._capture(bucket, dtype)
+        return lambda *inputs: self.model(*inputs)
+
+    def _capture(self, bucket: Shape, dtype: torch.dtype) -> Callable:
+        static_inputs = [torch.zeros(bucket, dtype=dtype, device=self.device)]
+        if self.accepts_mask:
+            static_inputs.append(torch.zeros(bucket, dtype=torch.bool, device=self.device))
+
+        # Warm up on a side stream so lazy initialization is not captured
+        stream = torch.cuda.Stream(self.device)
+        stream.wait_stream(torch.cuda.current_stream(self.device))
+        with torch.cuda.stream(stream):
+            for _ in range(3):
+                self.model(*static_inputs)
+        torch.cuda.current_stream(self.device).wait_stream(stream)
+
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph):
+            static_output = self.model(*static_inputs)
+
+        def replay(*inputs):
+            for static, value in zip(static_inputs, inputs):
+                static.copy_(value)
+            graph.replay()
+            return static_output.clone()
+        return replay
+
+    def _executable(self, key: Tuple[Shape, torch.dtype]) -> Callable:
+        executable = self._executables.get(key)
+        if executable is None:
+            with self._build_lock:
+                executable = self._executables.get(key)
+                if executable is None:
+                    start = time.perf_counter()
+                    executable = self._build(*key)
+                    self._stats.setdefault(key, BucketStats()).build_seconds = time.perf_counter() - start
+                    self._run_locks[key] = threading.Lock()
+                    self._executables[key] = executable
+                    self.logger.info(f"Built {self.mode} executable for '{self.name}' bucket {key[0]}")
+        return executable
+
+    def _run_bucketed(self, x: torch.Tensor, bucket: Shape) -> torch.Tensor:
+        key = (bucket, x.dtype)
+        executable = self._executable(key)
+        padded, mask = self.bucketer.pad(x, bucket)
+        inputs = (padded, mask) if self.accepts_mask else (padded,)
+
+        # Static buffers of captured graphs are shared by every call of the bucket
+        with self._run_locks[key]:
+            output = executable(*inputs)
+
+        stats = self._stats[key]
+        stats.calls += 1
+        stats.real_elements += x.numel()
+        stats.padded_elements += padded.numel()
+        return self.bucketer.unpad(output, tuple(x.shape), bucket)
+
+    def __call__(self, x: torch.Tensor) -> torch.Tensor:
+        """Run the model on ``x`` of shape ``(batch, ...)``; the output has padding removed."""
+        x = x.to(self.device, non_blocking=True)
+        with torch.inference_mode():
+            if self.trailing_bucket(tuple(x.shape[1:])) is None:
+                self.overflow += 1
+                return self.model(x)
+
+            outputs = []
+            for chunk in torch.split(x, self.bucketer.max_batch):
+                outputs.append(self._run_bucketed(chunk, self.bucketer.bucket(tuple(chunk.shape), self.dynamic_dims)))
+            return outputs[0] if len(outputs) == 1 else torch.cat(outputs)
+
+    def stats(self) -> Dict:
+        calls = sum(s.calls for s in self._stats.values())
+        real = sum(s.real_elements for s in self._stats.values())
+        padded = sum(s.padded_elements for s in self._stats.values())
+        return {
+            "mode": self.mode,
+            "calls": calls,
+            "overflow": self.overflow,
+            # A call hits when its bucket's executable already existed
+            "hit_rate": (calls - len(self._executables)) / calls if calls else 0.0,
+            "padding_waste": 1 - real / padded if padded else 0.0,
+            "buckets": {
+                f"{'x'.join(map(str, shape))}:{str(dtype).replace('torch.', '')}": {
+                    "calls": s.calls,
+                    "padding_waste": round(s.waste, 4),
+                    "build_seconds": round(s.build_seconds, 3)
+                }
+                for (shape, dtype), s in self._stats.items()
+            }
+        }
+
+
+def bucketed_batch_fn(executor: BucketedExecutor) -> BatchFn:
+    """
+    Batch function that groups requests by bucket instead of exact shape.
+
+    Items whose trailing shapes fall into the same bucket are padded to it and run
+    as one batch, so bucketing also raises the effective batch size.
+    """
+    bucketer = executor.bucketer
+
+    def run(inputs: List[torch.Tensor]) -> List[torch.Tensor]:
+        groups: Dict[Tuple, List[int]] = {}
+        for i, tensor in enumerate(inputs):
+            trailing = executor.trailing_bucket(tuple(tensor.shape[1:])) or tuple(tensor.shape[1:])
+            groups.setdefault((trailing, tensor.dtype), []).append(i)
+
+        outputs: List[Optional[torch.Tensor]] = [None] * len(inputs)
+        for (trailing, _), indices in groups.items():
+            items = [inputs[i] for i in indices]
+            if any(tuple(item.shape[1:]) != trailing for item in items):
+                items = [bucketer.pad(item, (item.shape[0],) + trailing)[0] for item in items]
+            result = executor(torch.cat(items)).cpu()
+            sizes = [inputs[i].shape[0] for i in indices]
+            for i, chunk in zip(indices, torch.split(result, sizes)):
+                original = tuple(inputs[i].shape)
+                outputs[i] = bucketer.unpad(chunk, original, (chunk.shape[0],) + trailing)
+        return outputs
+    return run
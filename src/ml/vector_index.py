@@ -0,0 +1,526 @@
+# src/ml/vector_index.py
+
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows development hosts
+    fcntl = None
+
+# Rows are scanned in blocks so float16 storage is upcast to float32 (BLAS) a block at a time
+SCAN_BLOCK_ROWS = 65536
+
+# The key log is folded into keys.json once it has more entries than this and than the index
+KEY_LOG_COMPACT_MIN = 10000
+
+
+class VectorIndex:
+    """
+    Memory-mapped float16 vector store with exact and IVF search.
+
+    Layout under ``root``:
+
+    - ``vectors.f16``: row-major ``capacity x dim`` float16 matrix (np.memmap)
+    - ``state.json``: dimension, row count, capacity, version and committed key log size
+    - ``keys.json``: snapshot of document key -> row, plus per-row payloads
+    - ``keys.log``: key changes since the snapshot, one JSON line per put or delete
+    - ``centroids.npy`` / ``assignments.npy``: IVF coarse quantizer, if trained
+    - ``index.lock``: file lock serializing writers across worker processes
+
+    Vectors are L2-normalized on insert, so inner product equals cosine similarity.
+    Deletes free their row for reuse; upserts of an existing key overwrite in place.
+    Several worker processes may open the same directory. Each write takes the file
+    lock, catches up with the others' committed changes, then appends its own key
+    changes to the log, so a write costs its own size rather than the index's.
+    Readers replay new log entries when another worker has committed.
+    """
+    def __init__(self, root: Path, dim: int, initial_capacity: int = 65536,
+                 log_level: int = logging.INFO):
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(log_level)
+
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.root / "vectors.f16"
+        self.state_path = self.root / "state.json"
+        self.keys_path = self.root / "keys.json"
+        self.key_log_path = self.root / "keys.log"
+        self.centroids_path = self.root / "centroids.npy"
+        self.assignments_path = self.root / "assignments.npy"
+        self.lock_path = self.root / "index.lock"
+        self._lock = threading.RLock()
+        self._lock_file = None
+        self._lock_depth = 0
+
+        self.dim = dim
+        self.count = 0  # High-water mark of used rows
+        self.capacity = initial_capacity
+        self.key_to_row: Dict[str, int] = {}
+        self.row_keys: Dict[int, str] = {}
+        self.payloads: Dict[int, Dict] = {}
+        self.free_rows: Set[int] = set()
+
+        # IVF state
+        self.centroids: Optional[np.ndarray] = None
+        self.assignments: Optional[np.ndarray] = None  # Cluster per row, -1 for free rows
+        self.lists: List[np.ndarray] = []
+
+        # Position in the shared files: snapshot generation, state version, key log bytes
+        self._generation = 0
+        self._version = 0
+        self._log_offset = 0
+        self._log_entries = 0
+        self._pending: List[Dict] = []  # Key log entries not committed yet
+        self._state_mtime = 0
+
+        with self._file_lock():
+            if self.state_path.exists():
+                self._load(self._read_state())
+            else:
+                self._open_vectors(create=True)
+                self.valid = np.zeros(self.capacity, dtype=bool)
+                self._write_state()
+
+    @contextmanager
+    def _file_lock(self, exclusive: bool = True):
+        """
+        Hold the cross-process index lock: exclusive for writers, shared for readers
+        catching up. Re-entrant within this process.
+        """
+        with self._lock:
+            if self._lock_file is None:
+                self._lock_file = open(self.lock_path, "a+")
+            outermost = self._lock_depth == 0
+            if outermost and fcntl is not None:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if outermost and fcntl is not None:
+                    fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_UN)
+
+    def _open_vectors(self, create: bool = False):
+        mode = "w+" if create else "r+"
+        self.vectors = np.memmap(self.vectors_path, dtype=np.float16, mode=mode,
+                                 shape=(self.capacity, self.dim))
+
+    def _read_state(self) -> Dict:
+        with open(self.state_path, "r") as f:
+            return json.load(f)
+
+    def _write_state(self):
+        self._version += 1
+        state = {"dim": self.dim, "count": self.count, "capacity": self.capacity,
+                 "generation": self._generation, "version": self._version,
+                 "log_size": self._log_offset}
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, self.state_path)
+        self._state_mtime = self.state_path.stat().st_mtime_ns
+
+    def _load(self, state: Dict):
+        """Load the snapshot, then replay the committed key log on top of it."""
+        if state["dim"] != self.dim:
+            raise ValueError(f"Index at {self.root} has dim {state['dim']}, expected {self.dim}")
+
+        self.count = state["count"]
+        self.capacity = state["capacity"]
+        if hasattr(self, "vectors"):
+            del self.vectors
+        self._open_vectors()
+
+        self.key_to_row, self.payloads = {}, {}
+        if self.keys_path.exists():
+            with open(self.keys_path, "r") as f:
+                keys = json.load(f)
+            self.key_to_row = keys["rows"]
+            self.payloads = {int(row): payload for row, payload in keys["payloads"].items()}
+        self.row_keys = {row: key for key, row in self.key_to_row.items()}
+
+        self.valid = np.zeros(self.capacity, dtype=bool)
+        self.valid[list(self.row_keys)] = True
+
+        self.centroids, self.assignments, self.lists = None, None, []
+        if self.centroids_path.exists():
+            self.centroids = np.load(self.centroids_path)
+            assignments = np.full(self.capacity, -1, dtype=np.int32)
+            stored = np.load(self.assignments_path)
+            assignments[:len(stored)] = stored
+            self.assignments = assignments
+            self._rebuild_lists()
+
+        self._generation = state.get("generation", 0)
+        self._log_offset = self._log_entries = 0
+        self._replay(state.get("log_size", 0))
+        self.free_rows = set(np.flatnonzero(~self.valid[:self.count]).tolist())
+        self._version = state.get("version", 0)
+        self._state_mtime = self.state_path.stat().st_mtime_ns
+        self.logger.info(f"Loaded vector index with {len(self.key_to_row)} vectors from {self.root}")
+
+    def _replay(self, log_size: int):
+        """Apply key log entries committed by other workers since our last read."""
+        if log_size <= self._log_offset or not self.key_log_path.exists():
+            return
+        with open(self.key_log_path, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read(log_size - self._log_offset)
+        entries = [json.loads(line) for line in data.splitlines() if line]
+        self._apply(entries)
+        self._log_offset += len(data)
+        self._log_entries += len(entries)
+
+    def _sync(self):
+        """Catch up with state committed by other workers (file lock held)."""
+        state = self._read_state()
+        if state.get("version", 0) == self._version:
+            return
+        if state.get("generation", 0) != self._generation:
+            self._load(state)
+            return
+        if state["capacity"] != self.capacity:
+            self._resize(state["capacity"])
+        self.count = state["count"]
+        self._replay(state.get("log_size", 0))
+        self._version = state.get("version", 0)
+        self._state_mtime = self.state_path.stat().st_mtime_ns
+
+    def reload_if_changed(self):
+        """Pick up writes committed by another worker process sharing this directory."""
+        if self.state_path.stat().st_mtime_ns != self._state_mtime:
+            with self._file_lock(exclusive=False):
+                self._sync()
+
+    def _commit(self):
+        """Append pending key entries to the log and publish the new state (file lock held)."""
+        if not self._pending:
+            return
+        self.vectors.flush()
+        data = "".join(json.dumps(entry) + "\n" for entry in self._pending).encode()
+        with open(self.key_log_path, "ab") as f:
+            # Drop anything a crashed writer appended without committing it
+            f.truncate(self._log_offset)
+            f.write(data)
+        self._log_offset += len(data)
+        self._log_entries += len(self._pending)
+        self._pending = []
+        if self._log_entries > max(KEY_LOG_COMPACT_MIN, len(self.key_to_row)):
+            self._compact()
+        self._write_state()
+
+    def _compact(self):
+        """Fold the key log into a new snapshot, with the IVF state (file lock held)."""
+        keys = {"rows": self.key_to_row,
+                "payloads": {str(row): payload for row, payload in self.payloads.items()}}
+        tmp_path = self.keys_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(keys, f)
+        os.replace(tmp_path, self.keys_path)
+        if self.centroids is not None:
+            for path, array in ((self.centroids_path, self.centroids),
+                                (self.assignments_path, self.assignments[:self.count])):
+                tmp_path = path.with_suffix(".tmp")
+                with open(tmp_path, "wb") as f:
+                    np.save(f, array)
+                os.replace(tmp_path, path)
+        with open(self.key_log_path, "wb"):
+            pass
+        self._generation += 1
+        self._log_offset = self._log_entries = 0
+
+    def flush(self):
+        """Persist vectors and any key changes not committed yet."""
+        with self._file_lock():
+            self.vectors.flush()
+            self._commit()
+
+    def _resize(self, capacity: int):
+        """Remap the vectors file at ``capacity`` rows and grow the per-row arrays."""
+        if hasattr(self, "vectors"):
+            self.vectors.flush()
+            del self.vectors
+        self.capacity = capacity
+        self._open_vectors()
+
+        valid = np.zeros(capacity, dtype=bool)
+        valid[:len(self.valid)] = self.valid
+        self.valid = valid
+        if self.assignments is not None:
+            assignments = np.full(capacity, -1, dtype=np.int32)
+            assignments[:len(self.assignments)] = self.assignments
+            self.assignments = assignments
+
+    def _grow(self, required: int):
+        """Double capacity until ``required`` rows fit, extending the file."""
+        capacity = self.capacity
+        while capacity < required:
+            capacity *= 2
+        if capacity == self.capacity:
+            return
+
+        self.vectors.flush()
+        with open(self.vectors_path, "r+b") as f:
+            f.truncate(capacity * self.dim * 2)
+        self._resize(capacity)
+
+    def _apply(self, entries: List[Dict]):
+        """
+        Apply key log entries: ``{"k", "r", "c"[, "p"]}`` puts key ``k`` in row ``r``
+        (IVF list ``c``, payload ``p`` if given); ``{"k"}`` deletes it.
+        """
+        moves: Dict[int, List[int]] = {}  # Row -> [list before, list after]
+        for entry in entries:
+            key = entry["k"]
+            if "r" in entry:
+                row, cluster = entry["r"], entry.get("c", -1)
+                self.key_to_row[key] = row
+                self.row_keys[row] = key
+                self.valid[row] = True
+                self.free_rows.discard(row)
+                if "p" in entry:
+                    self.payloads[row] = entry["p"]
+            else:
+                row = self.key_to_row.pop(key, None)
+                if row is None:
+                    continue
+                del self.row_keys[row]
+                self.payloads.pop(row, None)
+                self.valid[row] = False
+                self.free_rows.add(row)
+                cluster = -1
+            if self.assignments is not None:
+                moves.setdefault(row, [int(self.assignments[row]), cluster])[1] = cluster
+                self.assignments[row] = cluster
+        if moves:
+            self._move_rows(moves)
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def upsert(self, keys: List[str], vectors: np.ndarray, payloads: Optional[List[Dict]] = None) -> int:
+        """
+        Insert or overwrite vectors by document key.
+
+        Returns:
+            Number of vectors written
+        """
+        vectors = self._normalize(vectors)
+        if vectors.shape != (len(keys), self.dim):
+            raise ValueError(f"Expected vectors of shape ({len(keys)}, {self.dim}), got {vectors.shape}")
+
+        with self._file_lock():
+            self._sync()
+            rows = np.empty(len(keys), dtype=np.int64)
+            allocated: Dict[str, int] = {}
+            for i, key in enumerate(keys):
+                row = self.key_to_row.get(key, allocated.get(key))
+                if row is None:
+                    if self.free_rows:
+                        row = self.free_rows.pop()
+                    else:
+                        row = self.count
+                        self.count += 1
+                    allocated[key] = row
+                rows[i] = row
+
+            self._grow(self.count)
+            self.vectors[rows] = vectors.astype(np.float16)
+            clusters = self._assign(vectors) if self.centroids is not None else np.full(len(keys), -1)
+
+            entries = []
+            for i, (key, row, cluster) in enumerate(zip(keys, rows.tolist(), clusters.tolist())):
+                entry = {"k": key, "r": row, "c": cluster}
+                if payloads is not None:
+                    entry["p"] = payloads[i]
+                entries.append(entry)
+            self._apply(entries)
+            self._pending.extend(entries)
+            self._commit()
+
+        return len(keys)
+
+    def delete(self, keys: List[str]) -> int:
+        """
+        Remove vectors by document key.
+
+        Returns:
+            Number of vectors removed
+        """
+        with self._file_lock():
+            self._sync()
+            entries = [{"k": key} for key in dict.fromkeys(keys) if key in self.key_to_row]
+            self._apply(entries)
+            self._pending.extend(entries)
+            self._commit()
+        return len(entries)
+
+    def __len__(self) -> int:
+        return len(self.key_to_row)
+
+    # IVF ---------------------------------------------------------------
+
+    def train_ivf(self, nlist: int, sample_size: int = 100000, iterations: int = 10, seed: int = 0):
+        """
+        Train a k-means coarse quantizer and assign every stored vector to a list.
+
+        Args:
+            nlist: Number of inverted lists (a good default is ~sqrt(N))
+            sample_size: Vectors sampled for k-means
+            iterations: Lloyd iterations
+        """
+        with self._file_lock():
+            self._sync()
+            rows = np.flatnonzero(self.valid[:self.count])
+            if len(rows) < nlist:
+                raise ValueError(f"Need at least {nlist} vectors to train {nlist} lists")
+
+            rng = np.random.default_rng(seed)
+            sample = np.sort(rng.choice(rows, size=min(sample_size, len(rows)), replace=False))
+            data = self.vectors[sample].astype(np.float32)
+            centroids = data[rng.choice(len(data), size=nlist, replace=False)]
+
+            for _ in range(iterations):
+                labels = np.argmax(data @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, data)
+                counts = np.bincount(labels, minlength=nlist)[:, None]
+                # Empty lists keep their previous centroid
+                centroids = np.where(counts > 0, sums / np.maximum(counts, 1), centroids)
+                centroids = self._normalize(centroids)
+
+            self.centroids = centroids.astype(np.float32)
+            self.assignments = np.full(self.capacity, -1, dtype=np.int32)
+            for start in range(0, len(rows), SCAN_BLOCK_ROWS):
+                block = rows[start:start + SCAN_BLOCK_ROWS]
+                self.assignments[block] = self._assign(self.vectors[block].astype(np.float32))
+            self._rebuild_lists()
+            # The new quantizer and assignments go out with a fresh snapshot
+            self.vectors.flush()
+            self._compact()
+            self._write_state()
+            self.logger.info(f"Trained IVF index with {nlist} lists over {len(rows)} vectors")
+
+    def _assign(self, vectors: np.ndarray) -> np.ndarray:
+        return np.argmax(vectors @ self.centroids.T, axis=1).astype(np.int32)
+
+    def _rebuild_lists(self):
+        """
+        Group rows by list, sorted so each probe reads the memmap in file order.
+
+        Only used when the whole assignment changes (training, loading a snapshot);
+        writes update the affected lists through ``_move_rows``.
+        """
+        assigned = self.assignments[:self.count]
+        order = np.argsort(assigned, kind="stable")
+        boundaries = np.searchsorted(assigned[order], np.arange(len(self.centroids) + 1))
+        self.lists = [order[boundaries[i]:boundaries[i + 1]] for i in range(len(self.centroids))]
+
+    def _move_rows(self, moves: Dict[int, List[int]]):
+        """Move rows between IVF lists (-1 for none), keeping every touched list sorted."""
+        removed: Dict[int, List[int]] = {}
+        added: Dict[int, List[int]] = {}
+        for row, (before, after) in moves.items():
+            if before == after:
+                continue
+            if before >= 0:
+                removed.setdefault(before, []).append(row)
+            if after >= 0:
+                added.setdefault(after, []).append(row)
+        for cluster, rows in removed.items():
+            self.lists[cluster] = np.setdiff1d(self.lists[cluster], rows, assume_unique=True)
+        for cluster, rows in added.items():
+            self.lists[cluster] = np.union1d(self.lists[cluster], rows)
+
+    # Search ------------------------------------------------------------
+
+    def search(self, queries: np.ndarray, k: int = 10, nprobe: Optional[int] = None
+               ) -> List[List[Tuple[str, float, Optional[Dict]]]]:
+        """
+        Top-k search for a batch of query vectors.
+
+        Uses the IVF lists when trained and ``nprobe`` is not 0, otherwise an exact scan.
+
+        Returns:
+            For each query, a list of (key, score, payload) sorted by descending score
+        """
+        queries = self._normalize(np.atleast_2d(queries))
+        self.reload_if_changed()
+        with self._lock:
+            if self.centroids is not None and nprobe != 0:
+                scores, rows = self._search_ivf(queries, k, nprobe or 8)
+            else:
+                scores, rows = self._search_exact(queries, k)
+
+            results = []
+            for q_scores, q_rows in zip(scores, rows):
+                hits = []
+                for score, row in zip(q_scores.tolist(), q_rows.tolist()):
+                    if row < 0:
+                        continue
+                    hits.append((self.row_keys[row], score, self.payloads.get(row)))
+                results.append(hits)
+            return results
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, rows: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Select the k best columns per query row without a full sort."""
+        k = min(k, scores.shape[1])
+        if k == 0:
+            empty = np.empty((scores.shape[0], 0))
+            return empty, empty.astype(np.int64)
+        idx = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(scores, idx, axis=1)
+        order = np.argsort(-top_scores, axis=1)
+        idx = np.take_along_axis(idx, order, axis=1)
+        top_rows = rows[idx] if rows.ndim == 1 else np.take_along_axis(rows, idx, axis=1)
+        return np.take_along_axis(top_scores, order, axis=1), top_rows
+
+    def _search_exact(self, queries: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+
+        for start in range(0, self.count, SCAN_BLOCK_ROWS):
+            stop = min(start + SCAN_BLOCK_ROWS, self.count)
+            block = np.asarray(self.vectors[start:stop], dtype=np.float32)
+            scores = queries @ block.T
+            scores[:, ~self.valid[start:stop]] = -np.inf
+            block_scores, block_rows = self._top_k(scores, np.arange(start, stop), k)
+            best_scores = np.concatenate([best_scores, block_scores], axis=1)
+            best_rows = np.concatenate([best_rows, block_rows], axis=1)
+            best_scores, best_rows = self._top_k(best_scores, best_rows, k)
+
+        best_rows = np.where(np.isfinite(best_scores), best_rows, -1)
+        return best_scores, best_rows
+
+    def _search_ivf(self, queries: np.ndarray, k: int, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+
+        all_scores, all_rows = [], []
+        for query, query_probes in zip(queries, probes):
+            rows = np.concatenate([self.lists[p] for p in query_probes])
+            if len(rows) == 0:
+                all_scores.append(np.full(k, -np.inf, dtype=np.float32))
+                all_rows.append(np.full(k, -1, dtype=np.int64))
+                continue
+            rows.sort()
+            scores = np.asarray(self.vectors[rows], dtype=np.float32) @ query
+            top_scores, top_rows = self._top_k(scores[None, :], rows, k)
+            pad = k - top_scores.shape[1]
+            all_scores.append(np.pad(top_scores[0], (0, pad), constant_values=-np.inf))
+            all_rows.append(np.pad(top_rows[0], (0, pad), constant_values=-1))
+
+        return np.stack(all_scores), np.stack(all_rows)
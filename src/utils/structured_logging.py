@@ -0,0 +1,217 @@
+# src/utils/structured_logging.py
+
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+import traceback
+import uuid
+import zlib
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+
+ACCESS_LOGGER = "src.api.access"
+
+# Per-request fields shared by everything logged while handling the request
+_request_context: ContextVar[Optional[Dict]] = ContextVar("request_context", default=None)
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+def current_request() -> Optional[Dict]:
+    """Fields of the request being handled, or None outside a request."""
+    return _request_context.get()
+
+
+def set_request_field(key: str, value):
+    """Attach a field (e.g. the device) to the current request's log records."""
+    context = _request_context.get()
+    if context is not None:
+        context[key] = value
+
+
+@contextmanager
+def log_phase(name: str):
+    """Time a phase of the current request; the access record reports all phases."""
+    context = _request_context.get()
+    if context is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        phases = context.setdefault("phases_ms", {})
+        phases[name] = round(phases.get(name, 0.0) + (time.perf_counter() - start) * 1000, 3)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message and all extras."""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = "".join(traceback.format_exception(*record.exc_info))
+        return json.dumps(entry, default=str)
+
+
+class RequestContextFilter(logging.Filter):
+    """
+    Stamp records with the current request's fields and sample them.
+
+    Runs in the logging thread (the event loop), so it only copies references.
+    Records at WARNING and above, and access records of failed requests, are always
+    kept; everything else belonging to a request is kept for a deterministic
+    ``sample_rate`` fraction of request IDs, so a kept request is logged completely.
+    """
+    def __init__(self, sample_rate: float = 1.0):
+        super().__init__()
+        self.sample_rate = sample_rate
+        self.sampled_out = 0
+
+    def _keep(self, request_id: str) -> bool:
+        if self.sample_rate >= 1.0:
+            return True
+        return zlib.crc32(request_id.encode()) % 10000 < self.sample_rate * 10000
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _request_context.get()
+        if context is not None:
+            for key, value in context.items():
+                if not hasattr(record, key):
+                    # Snapshot mutable fields (phase timings) as of this record
+                    setattr(record, key, dict(value) if isinstance(value, dict) else value)
+
+        if record.levelno >= logging.WARNING or getattr(record, "status", 0) >= 500:
+            return True
+        request_id = getattr(record, "request_id", None)
+        if request_id is None or self._keep(request_id):
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks or formats in the calling thread.
+
+    Records are handed to the listener as-is (the queue is in-process, so nothing
+    needs pickling) and dropped with a count when the queue is full.
+    """
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(level: str = "INFO", json_format: bool = True, sample_rate: float = 1.0,
+                  queue_size: int = 10000) -> logging.handlers.QueueListener:
+    """
+    Route all logging through a bounded queue to a background writer thread.
+
+    Args:
+        level: Root log level
+        json_format: Emit JSON lines instead of plain text
+        sample_rate: Fraction of successful requests whose records are kept
+        queue_size: Records buffered before new ones are dropped
+
+    Returns:
+        The started listener (stopped automatically at exit)
+    """
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(RequestContextFilter(sample_rate))
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter() if json_format else
+                                logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+
+def logging_stats() -> Dict[str, int]:
+    """Dropped and sampled-out record counts of the installed queue handler."""
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, NonBlockingQueueHandler):
+            sampled_out = sum(getattr(f, "sampled_out", 0) for f in handler.filters)
+            return {"queued": handler.queue.qsize(), "dropped": handler.dropped, "sampled_out": sampled_out}
+    return {}
+
+
+class RequestLoggingMiddleware:
+    """
+    ASGI middleware that gives every request an ID and logs one access record.
+
+    The ID comes from ``X-Request-ID`` or is generated, and is echoed in the
+    response. The access record carries method, path, status, total duration, the
+    phases timed with ``log_phase`` and any fields set with ``set_request_field``.
+    """
+    def __init__(self, app):
+        self.app = app
+        self.logger = logging.getLogger(ACCESS_LOGGER)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for key, value in scope["headers"]:
+            if key == b"x-request-id":
+                request_id = value.decode(errors="replace")[:64]
+                break
+        context = {"request_id": request_id or uuid.uuid4().hex}
+        token = _request_context.set(context)
+        status = {"code": 500}
+        start = time.perf_counter()
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-request-id", context["request_id"].encode())
+                ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            self.logger.info(
+                f"{scope['method']} {scope['path']} {status['code']}",
+                extra={
+                    "method": scope["method"],
+                    "path": scope["path"],
+                    "status": status["code"],
+                    "duration_ms": round((time.perf_counter() - start) * 1000, 3)
+                }
+            )
+            _request_context.reset(token)
@@ -0,0 +1,123 @@
+# tests/test_audio.py
+
+import asyncio
+from types import SimpleNamespace
+
+import numpy as np
+import torch
+
+from src.ml import audio
+from src.ml.audio import AudioPipeline, AudioWindow, AudioWindower
+from src.ml.batching import BatcherPool
+
+RATE = 100  # 1s windows are 100 samples
+
+
+def make_windower() -> AudioWindower:
+    return AudioWindower(sample_rate=RATE, window_s=1.0, overlap_s=0.2, search_s=0.3)
+
+
+def push_all(windower: AudioWindower, signal: np.ndarray, chunk: int = 30):
+    windows = []
+    for i in range(0, len(signal), chunk):
+        windows.extend(windower.push(signal[i:i + chunk]))
+    return windows + windower.flush()
+
+
+def test_windows_overlap_and_cover_the_stream():
+    signal = np.linspace(0.5, 1.0, 250, dtype=np.float32)  # Never silent
+    windows = push_all(make_windower(), signal)
+
+    assert [w.start for w in windows] == [0, 80, 160]
+    assert [w.overlap_before for w in windows] == [0, 20, 20]
+    assert [w.last for w in windows] == [False, False, True]
+    for window in windows:
+        np.testing.assert_array_equal(window.samples, signal[window.start:window.start + len(window.samples)])
+    assert windows[-1].start + len(windows[-1].samples) == len(signal)
+
+
+def test_windows_are_cut_at_silence():
+    signal = np.ones(250, dtype=np.float32)
+    signal[80:90] = 0.0
+    first = push_all(make_windower(), signal)[0]
+
+    assert 80 < len(first.samples) <= 90
+    assert first.samples[-1] == 0.0
+
+
+def test_empty_input_yields_no_windows():
+    windower = make_windower()
+    assert windower.push(np.empty(0, dtype=np.float32)) == []
+    assert windower.flush() == []
+
+
+def test_overlap_segments_are_reported_once():
+    pipeline = AudioPipeline(None, None, "asr", sample_rate=RATE, window_s=1.0, overlap_s=0.2)
+    first = AudioWindow(0, 0, np.zeros(100, dtype=np.float32), 0)
+    second = AudioWindow(1, 80, np.zeros(60, dtype=np.float32), 20, last=True)
+
+    # Two segments inside the 0.8-1.0s overlap, as each window sees them
+    kept = pipeline._stitch(first, [{"start": 0.1, "end": 0.3},
+                                    {"start": 0.82, "end": 0.86},
+                                    {"start": 0.92, "end": 0.98}])
+    kept += pipeline._stitch(second, [{"start": 0.02, "end": 0.06},
+                                      {"start": 0.12, "end": 0.18},
+                                      {"start": 0.3, "end": 0.5}])
+
+    assert [(s["start"], s["end"]) for s in kept] == [(0.1, 0.3), (0.82, 0.86), (0.92, 0.98), (1.1, 1.3)]
+
+
+def fake_pcm(chunks, closed):
+    async def extract_pcm(path, sample_rate=16000):
+        try:
+            for chunk in chunks:
+                yield chunk
+        finally:
+            closed.append(path)
+    return extract_pcm
+
+
+def make_pipeline() -> AudioPipeline:
+    def model(samples, lengths):
+        return [[{"start": 0.0, "end": 0.1}] for _ in lengths]
+    registry = SimpleNamespace(device=torch.device("cpu"), get=lambda name: model)
+    return AudioPipeline(registry, BatcherPool(max_wait_ms=1.0), "asr", sample_rate=RATE,
+                         window_s=1.0, overlap_s=0.2, max_in_flight=2)
+
+
+def collect(pipeline: AudioPipeline, path: str):
+    async def run():
+        return [result async for result in pipeline.process(path)]
+    return asyncio.run(run())
+
+
+def test_process_streams_windows_in_order(monkeypatch):
+    signal = np.full(250, 0.5, dtype=np.float32)
+    closed = []
+    monkeypatch.setattr(audio, "extract_pcm", fake_pcm([signal[:120], signal[120:]], closed))
+
+    results = collect(make_pipeline(), "talk.wav")
+
+    assert [r["window"] for r in results] == [0, 1, 2]
+    assert [(r["start"], r["end"]) for r in results] == [(0.0, 1.0), (0.8, 1.8), (1.6, 2.5)]
+    assert closed == ["talk.wav"]
+
+
+def test_process_empty_input(monkeypatch):
+    monkeypatch.setattr(audio, "extract_pcm", fake_pcm([], []))
+    assert collect(make_pipeline(), "silence.wav") == []
+
+
+def test_process_closes_decoder_when_client_disconnects(monkeypatch):
+    closed = []
+    chunks = [np.full(150, 0.5, dtype=np.float32)] * 10
+    monkeypatch.setattr(audio, "extract_pcm", fake_pcm(chunks, closed))
+
+    async def run():
+        stream = make_pipeline().process("long.wav")
+        first = await stream.__anext__()
+        await stream.aclose()
+        assert closed == ["long.wav"]  # Before the loop would finalize it
+        return first
+
+    assert asyncio.run(run())["window"] == 0
@@ -0,0 +1,97 @@
+# tests/test_downloads.py
+
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI, Request
+
+from src.api.downloads import file_response, parse_range
+
+CONTENT = bytes(range(256)) * 4  # 1024 bytes
+ETAG = '"abc123"'
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=1000-", (1000, 1023)),  # Open-ended
+    ("bytes=-24", (1000, 1023)),  # Suffix
+    ("bytes=-5000", (0, 1023)),  # Suffix longer than the file
+    ("bytes=1000-5000", (1000, 1023)),  # End clamped to the file
+    ("bytes=0-1,5-6", None),  # Several ranges: whole file
+    ("items=0-1", None),  # Unknown unit: whole file
+    ("bytes=-", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, len(CONTENT)) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=1024-", "bytes=2000-3000", "bytes=10-5", "bytes=-0"])
+def test_unsatisfiable_ranges(header):
+    with pytest.raises(ValueError):
+        parse_range(header, len(CONTENT))
+
+
+@pytest.fixture
+def client_for(tmp_path):
+    path = tmp_path / "result.bin"
+    path.write_bytes(CONTENT)
+    app = FastAPI()
+
+    @app.api_route("/download", methods=["GET", "HEAD"])
+    async def download(request: Request):
+        return file_response(request, path, "application/octet-stream", ETAG, filename="result.bin")
+
+    def request(method: str, headers: dict) -> httpx.Response:
+        async def send():
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                return await client.request(method, "/download", headers=headers)
+        return asyncio.run(send())
+    return request
+
+
+def test_range_request_gets_partial_content(client_for):
+    response = client_for("GET", {"range": "bytes=100-199"})
+
+    assert response.status_code == 206
+    assert response.headers["content-range"] == "bytes 100-199/1024"
+    assert response.headers["content-length"] == "100"
+    assert response.headers["etag"] == ETAG
+    assert response.content == CONTENT[100:200]
+
+
+def test_suffix_range_resumes_at_the_end(client_for):
+    response = client_for("GET", {"range": "bytes=-24", "if-range": ETAG})
+
+    assert response.status_code == 206
+    assert response.content == CONTENT[-24:]
+
+
+def test_head_range_has_no_body(client_for):
+    response = client_for("HEAD", {"range": "bytes=0-9"})
+
+    assert response.status_code == 206
+    assert response.headers["content-length"] == "10"
+    assert response.content == b""
+
+
+@pytest.mark.parametrize("headers", [
+    {},
+    {"range": "bytes=0-1,5-6"},
+    {"range": "bytes=0-9", "if-range": '"stale"'},  # Content changed: send all of it
+])
+def test_whole_file_is_sent(client_for, headers):
+    response = client_for("GET", headers)
+
+    assert response.status_code == 200
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.content == CONTENT
+
+
+def test_unsatisfiable_range_gets_416(client_for):
+    response = client_for("GET", {"range": "bytes=5000-"})
+
+    assert response.status_code == 416
+    assert response.headers["content-range"] == "bytes */1024"
@@ -0,0 +1,49 @@
+# tests/test_generation.py
+
+import asyncio
+
+import pytest
+import torch
+
+from src.ml.generation import GenerationEngine
+from src.ml.kv_cache import PagedKVCache
+from src.ml.models.tiny_decoder import TinyDecoder
+
+
+def make_engine(max_positions: int = 32) -> GenerationEngine:
+    torch.manual_seed(0)
+    model = TinyDecoder(vocab_size=16, dim=16, num_layers=1, num_heads=2, max_positions=max_positions).eval()
+    cache = PagedKVCache(model.num_layers, model.num_heads, model.head_dim,
+                         memory_budget_bytes=1 << 20, block_size=4, dtype=torch.float32)
+    return GenerationEngine(model, cache)
+
+
+@pytest.mark.parametrize("prompt, max_new_tokens", [
+    ([1] * 30, 8),  # Past max_positions
+    ([1, 99], 4),  # Token id outside the vocabulary
+    ([], 4),
+    ([1], 0),
+])
+def test_invalid_requests_are_rejected_before_streaming(prompt, max_new_tokens):
+    engine = make_engine()
+    with pytest.raises(ValueError):
+        engine.generate(prompt, max_new_tokens=max_new_tokens)
+    assert not engine.waiting
+
+
+def test_long_request_does_not_fail_batched_sequences():
+    engine = make_engine()
+
+    async def run():
+        with pytest.raises(ValueError):
+            engine.generate([1] * 30, max_new_tokens=8)
+        outputs = await asyncio.gather(*(collect(engine.generate([1, 2, 3], max_new_tokens=5))
+                                         for _ in range(3)))
+        return outputs
+
+    async def collect(tokens):
+        return [token async for token in tokens]
+
+    outputs = asyncio.run(run())
+    assert [len(out) for out in outputs] == [5, 5, 5]
+    assert outputs[0] == outputs[1] == outputs[2]
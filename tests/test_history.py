@@ -0,0 +1,72 @@
+# tests/test_history.py
+
+import pytest
+
+from src.core.monitoring.history import MetricsHistory
+
+
+def make_history(tmp_path) -> MetricsHistory:
+    # 4 s of 1 s buckets and 30 s of 10 s buckets
+    return MetricsHistory(tmp_path, max_series=4, resolutions=((1, 4), (10, 3)))
+
+
+def test_samples_in_one_bucket_are_aggregated(tmp_path):
+    history = make_history(tmp_path)
+    history.record({"gpu_utilization{gpu=0}": 1.0}, timestamp=100.2)
+    history.record({"gpu_utilization{gpu=0}": 3.0}, timestamp=100.7)
+
+    stats = history.query(1, now=100.9, points=True)["series"]["gpu_utilization{gpu=0}"]
+
+    assert (stats["min"], stats["max"], stats["avg"], stats["samples"]) == (1.0, 3.0, 2.0, 2)
+    assert stats["points"] == [[100, 1.0, 2.0, 3.0]]
+
+
+def test_reused_slot_drops_the_old_bucket(tmp_path):
+    history = make_history(tmp_path)
+    history.record({"load": 1.0}, timestamp=100.5)
+    history.record({"load": 5.0}, timestamp=104.5)  # Same 1 s slot as 100, four buckets later
+
+    fine = history.query(10, resolution=1, now=104.9)["series"]["load"]
+    coarse = history.query(10, resolution=10, now=104.9)["series"]["load"]
+
+    assert (fine["samples"], fine["avg"]) == (1, 5.0)
+    assert (coarse["samples"], coarse["avg"]) == (2, 3.0)
+
+
+def test_window_outside_the_ring_is_empty(tmp_path):
+    history = make_history(tmp_path)
+    history.record({"load": 1.0}, timestamp=100.5)
+
+    assert history.query(2, now=110.0)["series"] == {}
+
+
+@pytest.mark.parametrize("window_s, resolution", [
+    (3, 1),  # Fits in the 1 s ring
+    (4, 1),
+    (5, 10),  # Longer than the 1 s ring
+    (30, 10),
+    (3600, 10),  # Longer than every ring: the coarsest
+])
+def test_finest_resolution_covering_the_window_is_used(tmp_path, window_s, resolution):
+    history = make_history(tmp_path)
+    assert history.query(window_s, now=100.0)["resolution_s"] == resolution
+
+
+def test_series_pattern_filters(tmp_path):
+    history = make_history(tmp_path)
+    history.record({"gpu_utilization{gpu=0}": 1.0, "gpu_utilization{gpu=1}": 2.0, "cpu": 3.0},
+                   timestamp=100.5)
+
+    series = history.query(2, pattern=r"gpu=1", now=100.9)["series"]
+    assert list(series) == ["gpu_utilization{gpu=1}"]
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"pattern": "gpu_utilization{gpu=("},
+    {"resolution": 5},
+    {"window_s": 0},
+])
+def test_invalid_queries_raise_value_error(tmp_path, kwargs):
+    history = make_history(tmp_path)
+    with pytest.raises(ValueError):
+        history.query(**{"window_s": 60, **kwargs})
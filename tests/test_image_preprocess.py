@@ -0,0 +1,72 @@
+# tests/test_image_preprocess.py
+
+import struct
+
+import numpy as np
+import pytest
+import torch
+
+cv2 = pytest.importorskip("cv2")
+
+from src.ml.image_preprocess import ImageBatchPreprocessor, image_size  # noqa: E402
+
+MEAN = (123.675, 116.28, 103.53)
+STD = (58.395, 57.12, 57.375)
+
+
+def encode(width: int, height: int, ext: str = ".png", bgr=(0, 0, 255)) -> bytes:
+    image = np.empty((height, width, 3), dtype=np.uint8)
+    image[...] = bgr
+    ok, data = cv2.imencode(ext, image)
+    assert ok
+    return data.tobytes()
+
+
+def with_exif_orientation(jpeg: bytes, orientation: int) -> bytes:
+    """Insert an APP1 segment whose only EXIF tag is the orientation."""
+    tiff = b"MM\x00\x2a" + struct.pack(">I", 8)
+    tiff += struct.pack(">H", 1) + struct.pack(">HHIHH", 0x0112, 3, 1, orientation, 0) + struct.pack(">I", 0)
+    payload = b"Exif\x00\x00" + tiff
+    return jpeg[:2] + b"\xff\xe1" + struct.pack(">H", len(payload) + 2) + payload + jpeg[2:]
+
+
+@pytest.fixture
+def preprocessor():
+    return ImageBatchPreprocessor(64, 64, dtype=torch.float32, mean=MEAN, std=STD, max_batch_size=4)
+
+
+def test_letterbox_geometry(preprocessor):
+    output, infos = preprocessor([encode(200, 100), encode(50, 100)])
+
+    assert output.shape == (2, 3, 64, 64)
+    wide, tall = infos
+    assert (wide.width, wide.height, wide.pad_x, wide.pad_y) == (200, 100, 0, 16)
+    assert wide.scale == pytest.approx(64 / 200)
+    assert (tall.width, tall.height, tall.pad_x, tall.pad_y) == (50, 100, 16, 0)
+    assert tall.scale == pytest.approx(64 / 100)
+
+
+def test_normalization_and_fill(preprocessor):
+    output, _ = preprocessor([encode(200, 100, bgr=(10, 20, 30))])
+
+    mean, std = torch.tensor(MEAN), torch.tensor(STD)
+    image_pixel = output[0, :, 32, 32]
+    fill_pixel = output[0, :, 0, 32]
+    torch.testing.assert_close(image_pixel, (torch.tensor([30.0, 20.0, 10.0]) - mean) / std)  # RGB order
+    torch.testing.assert_close(fill_pixel, (torch.full((3,), 114.0) - mean) / std)
+
+
+def test_reduced_jpeg_decode_keeps_original_geometry(preprocessor):
+    data = encode(1024, 512, ".jpg")
+    assert image_size(data) == ("jpeg", 1024, 512)
+
+    _, (info,) = preprocessor([data])
+    assert (info.width, info.height, info.pad_x, info.pad_y) == (1024, 512, 0, 16)
+    assert info.scale == pytest.approx(64 / 1024)
+
+
+def test_exif_orientation_does_not_change_geometry(preprocessor):
+    data = with_exif_orientation(encode(1024, 512, ".jpg"), orientation=6)  # Rotated 90 degrees
+
+    _, (info,) = preprocessor([data])
+    assert (info.width, info.height, info.pad_x, info.pad_y) == (1024, 512, 0, 16)
@@ -0,0 +1,40 @@
+# tests/test_metrics.py
+
+import prometheus_client as prom
+from prometheus_client.openmetrics.exposition import generate_latest
+
+from src.core.monitoring.metrics import AIServerMetrics
+from src.utils.structured_logging import _request_context
+
+
+def scrape(registry: prom.CollectorRegistry) -> str:
+    return generate_latest(registry).decode()
+
+
+def test_samples_carry_the_current_request_id_as_exemplar():
+    registry = prom.CollectorRegistry()
+    metrics = AIServerMetrics(registry=registry)
+
+    token = _request_context.set({"request_id": "req-123"})
+    try:
+        metrics.observe_inference("resnet", "cpu", 0.02)
+        metrics.observe_batch("model:resnet", 0.04)
+    finally:
+        _request_context.reset(token)
+
+    lines = scrape(registry).splitlines()
+    inference = [l for l in lines if l.startswith("ai_inference_seconds_bucket") and "# {" in l]
+    batch = [l for l in lines if l.startswith("ai_batch_processing_seconds_bucket") and "# {" in l]
+    assert inference and all('request_id="req-123"' in l for l in inference)
+    assert batch and all('request_id="req-123"' in l for l in batch)
+
+
+def test_explicit_request_id_and_no_request():
+    registry = prom.CollectorRegistry()
+    metrics = AIServerMetrics(registry=registry)
+
+    metrics.observe_inference("resnet", "cpu", 0.02)  # Outside a request: no exemplar
+    assert "# {" not in scrape(registry)
+
+    metrics.observe_batch("model:resnet", 0.04, request_id="explicit")
+    assert 'request_id="explicit"' in scrape(registry)
@@ -0,0 +1,138 @@
+# tests/test_model_host.py
+
+import asyncio
+import threading
+import uuid
+from types import SimpleNamespace
+
+import pytest
+import torch
+
+from src.ml.model_host import (
+    SLOT_ABANDONED, SLOT_FREE, SLOT_RUNNING, ModelHost, ModelHostClient, TensorRing
+)
+
+
+@pytest.fixture
+def ring():
+    ring = TensorRing(f"test_ring_{uuid.uuid4().hex[:12]}", num_slots=4, slot_bytes=4096, create=True)
+    yield ring
+    ring.close(unlink=True)
+
+
+def make_host(ring: TensorRing, model) -> ModelHost:
+    registry = SimpleNamespace(device=torch.device("cpu"), get=lambda name: model)
+    return ModelHost(ring, registry, idle_timeout=0.01)
+
+
+@pytest.mark.parametrize("tensor", [
+    torch.randn(2, 3),
+    torch.arange(12, dtype=torch.int64).view(3, 2, 2),
+    torch.randn(4, 5).to(torch.bfloat16),
+    torch.tensor([[True, False]]),
+    torch.empty(0, 7),
+])
+def test_tensors_round_trip_through_a_slot(ring, tensor):
+    slot = ring.claim()
+    ring.write(slot, tensor, "encoder")
+
+    model_name, read = ring.read(slot)
+    assert model_name == "encoder"
+    assert read.dtype == tensor.dtype
+    assert torch.equal(read, tensor)
+
+
+def test_oversized_tensor_is_rejected(ring):
+    with pytest.raises(ValueError):
+        ring.write(ring.claim(), torch.zeros(2048), "encoder")
+
+
+def test_client_requests_are_batched_by_the_host(ring):
+    batch_sizes = []
+
+    def model(batch):
+        batch_sizes.append(batch.shape[0])
+        return batch * 2
+
+    host = make_host(ring, model)
+    thread = threading.Thread(target=host.serve_forever, daemon=True)
+    client = ModelHostClient(ring, timeout=5.0)
+
+    async def run():
+        inputs = [torch.full((1, 3), float(i)) for i in range(4)]
+        return inputs, await asyncio.gather(*(client.infer("double", x) for x in inputs))
+
+    thread.start()
+    try:
+        inputs, outputs = asyncio.run(run())
+    finally:
+        host.stop()
+        thread.join(timeout=5)
+
+    for x, y in zip(inputs, outputs):
+        assert torch.equal(y, x * 2)
+    assert sum(batch_sizes) == 4
+    assert all(ring.state(slot) == SLOT_FREE for slot in range(ring.num_slots))
+
+
+def test_host_errors_reach_the_client(ring):
+    def model(batch):
+        raise RuntimeError("bad input")
+
+    host = make_host(ring, model)
+    thread = threading.Thread(target=host.serve_forever, daemon=True)
+    thread.start()
+    try:
+        with pytest.raises(RuntimeError, match="bad input"):
+            asyncio.run(ModelHostClient(ring, timeout=5.0).infer("broken", torch.zeros(1, 2)))
+    finally:
+        host.stop()
+        thread.join(timeout=5)
+    assert ring.state(0) == SLOT_FREE
+
+
+def test_queued_request_abandoned_by_its_client_is_freed_at_once(ring):
+    host = make_host(ring, lambda batch: batch)
+    client = ModelHostClient(ring, timeout=0.01)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(client.infer("idle", torch.zeros(1, 2)))
+
+    assert ring.state(0) == SLOT_FREE
+    assert host.process_once() == 0
+
+
+def test_running_request_abandoned_by_its_client_is_freed_by_the_host(ring):
+    started, release = threading.Event(), threading.Event()
+
+    def model(batch):
+        started.set()
+        release.wait(5)
+        return batch
+
+    host = make_host(ring, model)
+    client = ModelHostClient(ring, timeout=5.0)
+
+    async def run():
+        request = asyncio.ensure_future(client.infer("slow", torch.ones(1, 2)))
+        worker = asyncio.ensure_future(asyncio.to_thread(host.process_once))
+        await asyncio.to_thread(started.wait, 5)
+        request.cancel()  # Client went away mid-run
+        with pytest.raises(asyncio.CancelledError):
+            await request
+        assert ring.state(0) == SLOT_ABANDONED
+        release.set()
+        return await worker
+
+    assert asyncio.run(run()) == 1
+    # The host wrote its answer into nobody's slot and freed it
+    assert ring.state(0) == SLOT_FREE
+    assert ring.claim() == 0
+
+
+def test_slot_is_running_while_the_host_owns_it(ring):
+    slot = ring.claim()
+    ring.write(slot, torch.zeros(1), "encoder")
+    assert ring.take([slot]) == [slot]
+    assert ring.state(slot) == SLOT_RUNNING
+    assert ring.take([slot]) == []
@@ -0,0 +1,92 @@
+# tests/test_pipeline.py
+
+import threading
+
+import pytest
+import torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+
+from src.ml.pipeline import DistributedPipeline, PipelineModel, partition, serve_stage, split_stages
+
+
+def make_model() -> torch.nn.Sequential:
+    torch.manual_seed(0)
+    layers = []
+    for _ in range(6):
+        layers += [torch.nn.Linear(16, 16), torch.nn.ReLU()]
+    return torch.nn.Sequential(*layers).eval()
+
+
+def test_partition_balances_by_capacity():
+    assert partition([1] * 6, [3, 3]) == [3]
+    assert partition([1] * 6, [4, 2]) == [4]
+    assert partition([1] * 6, [1, 2, 3]) == [1, 3]
+    assert partition([4, 1, 1], [6, 6, 6]) == [1, 3]  # The big layer alone bounds the ratio
+
+
+def test_partition_allows_empty_stages_and_rejects_overflow():
+    assert partition([2, 2], [10, 0.5, 10]) == [1, 1]  # Nothing fits the middle device
+    with pytest.raises(ValueError):
+        partition([5, 5], [4, 4])
+
+
+def test_pipeline_model_matches_unsplit_model():
+    model = make_model()
+    x = torch.randn(10, 16)
+    with torch.inference_mode():
+        expected = model(x)
+
+    pipeline = PipelineModel.from_model(make_model(), ["cpu", "cpu", "cpu"], micro_batches=4,
+                                        capacities=[2**20] * 3)
+    try:
+        assert [len(stage) for stage in pipeline.stages] == [4, 4, 4]
+        torch.testing.assert_close(pipeline(x), expected)
+
+        # Concurrent calls share the stage threads without mixing their micro-batches
+        inputs = [torch.randn(7, 16) for _ in range(4)]
+        outputs = [None] * len(inputs)
+
+        def call(i):
+            outputs[i] = pipeline(inputs[i])
+
+        threads = [threading.Thread(target=call, args=(i,)) for i in range(len(inputs))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with torch.inference_mode():
+            for x_i, out in zip(inputs, outputs):
+                torch.testing.assert_close(out, model(x_i))
+        assert all(stage["chunks"] > 0 for stage in pipeline.stats()["stages"])
+    finally:
+        pipeline.close()
+
+
+def _run_rank(rank: int, world_size: int, init_file: str, result_file: str):
+    dist.init_process_group("gloo", init_method=f"file://{init_file}", rank=rank, world_size=world_size)
+    try:
+        stages = split_stages(make_model(), [torch.device("cpu")] * world_size, capacities=[2**20] * world_size)
+        if rank != 0:
+            serve_stage(stages[rank])
+            return
+        pipeline = DistributedPipeline(stages[0], micro_batches=3)
+        x = torch.randn(9, 16, generator=torch.Generator().manual_seed(1))
+        output = pipeline(x)
+        pipeline.close()
+        torch.save(output, result_file)
+    finally:
+        dist.destroy_process_group()
+
+
+@pytest.mark.skipif(not dist.is_available() or not dist.is_gloo_available(), reason="gloo backend unavailable")
+def test_distributed_pipeline_matches_unsplit_model(tmp_path):
+    world_size = 3
+    result_file = tmp_path / "output.pt"
+    mp.spawn(_run_rank, args=(world_size, str(tmp_path / "init"), str(result_file)),
+             nprocs=world_size, join=True)
+
+    x = torch.randn(9, 16, generator=torch.Generator().manual_seed(1))
+    with torch.inference_mode():
+        expected = make_model()(x)
+    torch.testing.assert_close(torch.load(result_file), expected)
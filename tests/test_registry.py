@@ -0,0 +1,62 @@
+# tests/test_registry.py
+
+import threading
+import time
+
+import torch
+
+from src.ml.artifact_cache import ArtifactCache
+from src.ml.registry import ModelRegistry
+
+
+class RotaryLinear(torch.nn.Module):
+    """Linear layer with a non-persistent buffer computed in __init__."""
+    def __init__(self):
+        super().__init__()
+        self.proj = torch.nn.Linear(4, 4)
+        self.register_buffer("inv_freq", 1.0 / (10000 ** (torch.arange(0, 4).float() / 4)), persistent=False)
+        self.register_buffer("scale", torch.ones(4))
+
+    def forward(self, x):
+        return self.proj(x) * self.inv_freq * self.scale
+
+
+def make_registry(tmp_path) -> ModelRegistry:
+    registry = ModelRegistry(ArtifactCache(tmp_path), device=torch.device("cpu"))
+    registry.register("rotary", RotaryLinear)
+    registry.save("rotary", RotaryLinear())
+    return registry
+
+
+def test_build_materializes_non_persistent_buffers(tmp_path):
+    registry = make_registry(tmp_path)
+    model = registry.build("rotary")
+
+    assert not any(t.is_meta for t in list(model.parameters()) + list(model.buffers()))
+    reference = RotaryLinear()
+    assert torch.equal(model.inv_freq, reference.inv_freq)
+    x = torch.randn(2, 4)
+    expected = torch.nn.functional.linear(x, model.proj.weight, model.proj.bias) * reference.inv_freq
+    assert torch.allclose(model(x), expected)
+
+
+def test_concurrent_get_loads_once(tmp_path):
+    registry = make_registry(tmp_path)
+    loads = []
+    load = registry.load
+
+    def slow_load(name):
+        loads.append(name)
+        time.sleep(0.05)
+        return load(name)
+
+    registry.load = slow_load
+    models = []
+    threads = [threading.Thread(target=lambda: models.append(registry.get("rotary"))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert loads == ["rotary"]
+    assert all(model is models[0] for model in models)
@@ -0,0 +1,57 @@
+# tests/test_result_store.py
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+from src.core.result_store import ResultStore, ResultTooLarge
+
+
+def test_put_array_round_trips_through_npy(tmp_path):
+    store = ResultStore(tmp_path)
+    array = np.arange(24, dtype=np.float16).reshape(2, 3, 4)
+
+    result = store.put_array(array)
+    _, path = store.get(result.result_id)
+
+    np.testing.assert_array_equal(np.load(path), array)
+    assert result.size == os.path.getsize(path)
+    assert not list(tmp_path.glob("*/*.tmp"))
+
+
+def test_quota_is_shared_between_workers(tmp_path):
+    # Two stores on one directory stand in for two worker processes
+    first, second = ResultStore(tmp_path, quota_bytes=2500), ResultStore(tmp_path, quota_bytes=2500)
+
+    old = first.put_bytes(b"a" * 1000, "application/octet-stream")
+    time.sleep(0.01)
+    second.put_bytes(b"b" * 1000, "application/octet-stream")
+    time.sleep(0.01)
+    first.put_bytes(b"c" * 1000, "application/octet-stream")  # Over the shared quota
+
+    assert first.get(old.result_id) is None  # Least recently used, evicted
+    assert first.stats()["bytes_used"] == 2000
+    assert second.evict()["bytes_used"] == 2000
+
+
+def test_delete_releases_quota(tmp_path):
+    store = ResultStore(tmp_path, quota_bytes=1500)
+    first = store.put_bytes(b"a" * 1000, "application/octet-stream")
+    assert store.delete(first.result_id)
+
+    second = store.put_bytes(b"b" * 1000, "application/octet-stream")
+    assert store.get(second.result_id) is not None
+    assert store.evicted == 0
+
+
+def test_result_larger_than_quota_is_rejected_without_evicting(tmp_path):
+    store = ResultStore(tmp_path, quota_bytes=1500)
+    kept = store.put_bytes(b"a" * 1000, "application/octet-stream")
+
+    with pytest.raises(ResultTooLarge):
+        store.put_bytes(b"b" * 2000, "application/octet-stream")
+
+    assert store.get(kept.result_id) is not None
+    assert store.stats()["bytes_used"] == 1000
@@ -0,0 +1,167 @@
+# tests/test_router.py
+
+import asyncio
+import json
+
+import fakeredis
+import httpx
+
+from src.api.router import RequestRouter
+from src.core.cluster import HeartbeatPublisher, NodeDirectory
+
+
+def make_publisher(redis, node_id, free_memory_mb=8192, queue_depth=0, models=()):
+    async def collect():
+        return {"free_memory_mb": free_memory_mb, "queue_depth": queue_depth,
+                "resident_models": list(models)}
+    return HeartbeatPublisher(redis, node_id, f"http://{node_id}", collect)
+
+
+class FakeNodes:
+    """httpx transport standing in for the AI server nodes, keyed by host name."""
+    def __init__(self):
+        self.requests = []
+        self.unreachable = set()
+        self.slow_stream_closed = asyncio.Event()
+
+    async def handler(self, request: httpx.Request) -> httpx.Response:
+        node = request.url.host
+        if node in self.unreachable:
+            raise httpx.ConnectError("connection refused", request=request)
+        body = await request.aread()
+        self.requests.append((node, request.url.path, body))
+        if request.url.path == "/slow":
+            return httpx.Response(200, content=self._slow_stream())
+        return httpx.Response(200, content=self._once(json.dumps({"node": node, "bytes": len(body)}).encode()))
+
+    @staticmethod
+    async def _once(data: bytes):
+        # Streamed like a real upstream response
+        yield data
+
+    async def _slow_stream(self):
+        try:
+            for _ in range(100):
+                yield b"x"
+                await asyncio.sleep(0.05)
+        finally:
+            self.slow_stream_closed.set()
+
+
+async def call(router, path, chunks, headers=(), disconnect: asyncio.Event = None):
+    """Drive the router like an ASGI server; returns (status, headers, body)."""
+    messages = [{"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+    disconnect = disconnect or asyncio.Event()
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await disconnect.wait()
+        return {"type": "http.disconnect"}
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {"type": "http", "method": "POST", "path": path, "query_string": b"",
+             "headers": [(k.encode(), v.encode()) for k, v in headers], "client": ("10.0.0.1", 5000)}
+    await router(scope, receive, send)
+    start = next((m for m in sent if m["type"] == "http.response.start"), None)
+    body = b"".join(m.get("body", b"") for m in sent if m["type"] == "http.response.body")
+    return (start["status"] if start else None), dict(start["headers"]) if start else {}, body
+
+
+def setup(publishers_spec):
+    redis = fakeredis.FakeAsyncRedis()
+    nodes = FakeNodes()
+    router = RequestRouter(NodeDirectory(redis),
+                           client=httpx.AsyncClient(transport=httpx.MockTransport(nodes.handler)),
+                           refresh_interval_s=0.0)
+    publishers = {spec["node_id"]: make_publisher(redis, **spec) for spec in publishers_spec}
+    return router, nodes, publishers
+
+
+def test_routes_by_model_affinity_and_load():
+    async def run():
+        router, _, publishers = setup([
+            {"node_id": "a", "free_memory_mb": 8192, "models": ["m"]},
+            {"node_id": "b", "free_memory_mb": 12288}
+        ])
+        for publisher in publishers.values():
+            await publisher.publish()
+
+        _, headers, _ = await call(router, "/run-model", [json.dumps({"model": "m"}).encode()],
+                                   [("content-type", "application/json")])
+        assert headers[b"x-routed-node"] == b"a"
+        _, headers, _ = await call(router, "/run-model", [b"{}"], [("x-model", "other")])
+        assert headers[b"x-routed-node"] == b"b"
+    asyncio.run(run())
+
+
+def test_draining_nodes_only_take_work_nobody_else_can():
+    async def run():
+        router, _, publishers = setup([
+            {"node_id": "a", "models": ["m"]},
+            {"node_id": "b"}
+        ])
+        await publishers["b"].publish()
+        await publishers["a"].set_draining("swap:m")
+
+        _, headers, _ = await call(router, "/run-model", [b"{}"], [("x-model", "m")])
+        assert headers[b"x-routed-node"] == b"b"
+
+        await publishers["b"].stop()  # Removes b's heartbeat
+        _, headers, _ = await call(router, "/run-model", [b"{}"], [("x-model", "m")])
+        assert headers[b"x-routed-node"] == b"a"
+
+        await publishers["a"].set_draining("swap:m", False)
+        beats = await router.directory.nodes()
+        assert [n.draining for n in beats] == [False]
+    asyncio.run(run())
+
+
+def test_large_body_is_streamed_not_buffered():
+    async def run():
+        router, nodes, publishers = setup([{"node_id": "a"}])
+        await publishers["a"].publish()
+
+        chunks = [bytes([i]) * 65536 for i in range(32)]  # 2 MB upload
+        status, _, body = await call(router, "/process-audio", chunks)
+        assert status == 200
+        assert json.loads(body)["bytes"] == 32 * 65536
+        assert nodes.requests[0][2] == b"".join(chunks)
+    asyncio.run(run())
+
+
+def test_connection_failures_are_retried_on_the_next_node():
+    async def run():
+        router, nodes, publishers = setup([
+            {"node_id": "a", "free_memory_mb": 16384},
+            {"node_id": "b", "free_memory_mb": 4096}
+        ])
+        for publisher in publishers.values():
+            await publisher.publish()
+        nodes.unreachable.add("a")
+
+        status, headers, _ = await call(router, "/run-model", [b"{}"])
+        assert status == 200
+        assert headers[b"x-routed-node"] == b"b"
+    asyncio.run(run())
+
+
+def test_client_disconnect_closes_the_upstream_request():
+    async def run():
+        router, nodes, publishers = setup([{"node_id": "a"}])
+        await publishers["a"].publish()
+
+        disconnect = asyncio.Event()
+        request = asyncio.ensure_future(call(router, "/slow", [b"{}"], disconnect=disconnect))
+        await asyncio.sleep(0.2)
+        disconnect.set()
+        await asyncio.wait_for(request, 2)
+        await asyncio.wait_for(nodes.slow_stream_closed.wait(), 2)
+        assert router.disconnected == 1
+        assert router.in_flight["a"] == 0
+    asyncio.run(run())
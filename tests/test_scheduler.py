@@ -0,0 +1,136 @@
+# tests/test_scheduler.py
+
+import asyncio
+
+import pytest
+from starlette.requests import Request
+
+from src.core.scheduler import (
+    ClientDisconnected, DeadlineExceeded, DeadlineScheduler, Priority, cancel_on_disconnect
+)
+
+
+def make_request(disconnected: asyncio.Event) -> Request:
+    async def receive():
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+    return Request({"type": "http", "method": "POST", "path": "/", "headers": []}, receive)
+
+
+async def hold_slot(scheduler: DeadlineScheduler, release: asyncio.Event) -> asyncio.Task:
+    """Occupy one slot until ``release`` is set."""
+    deadline = asyncio.get_running_loop().time() + 10
+    task = asyncio.ensure_future(scheduler.run(release.wait, key="blocker", deadline=deadline))
+    await asyncio.sleep(0)
+    return task
+
+
+def test_queued_jobs_run_earliest_deadline_first():
+    scheduler = DeadlineScheduler(max_concurrent=1)
+    order = []
+
+    async def run():
+        release = asyncio.Event()
+        blocker = await hold_slot(scheduler, release)
+        now = asyncio.get_running_loop().time()
+
+        async def job(name):
+            order.append(name)
+
+        jobs = [
+            ("bulk-late", Priority.BULK, now + 10),
+            ("interactive-mid", Priority.INTERACTIVE, now + 5),
+            ("bulk-early", Priority.BULK, now + 3),
+            ("interactive-early", Priority.INTERACTIVE, now + 3),
+        ]
+        tasks = [asyncio.ensure_future(scheduler.run(lambda name=name: job(name), key=name,
+                                                     priority=priority, deadline=deadline))
+                 for name, priority, deadline in jobs]
+        await asyncio.sleep(0)
+        assert scheduler.stats()["queued"] == 4
+
+        release.set()
+        await asyncio.gather(blocker, *tasks)
+
+    asyncio.run(run())
+    # Equal deadlines are broken by priority class
+    assert order == ["interactive-early", "bulk-early", "interactive-mid", "bulk-late"]
+
+
+def test_job_that_cannot_meet_its_deadline_is_dropped():
+    scheduler = DeadlineScheduler(max_concurrent=1)
+    calls = []
+
+    async def slow():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+
+    async def run():
+        await scheduler.run(slow, key="slow")
+        loop = asyncio.get_running_loop()
+        with pytest.raises(DeadlineExceeded):
+            await scheduler.run(slow, key="slow", deadline=loop.time() + 0.01)
+        # Other kinds of work are not affected by the estimate
+        await scheduler.run(lambda: asyncio.sleep(0), key="fast", deadline=loop.time() + 0.01)
+
+    asyncio.run(run())
+    assert calls == [1]
+    assert scheduler.estimate("slow") >= 0.05
+    assert scheduler.dropped["infeasible"] == 1
+
+
+def test_disconnect_removes_a_queued_job():
+    scheduler = DeadlineScheduler(max_concurrent=1)
+    calls = []
+
+    async def job():
+        calls.append(1)
+
+    async def run():
+        release, disconnected = asyncio.Event(), asyncio.Event()
+        blocker = await hold_slot(scheduler, release)
+        queued = asyncio.ensure_future(cancel_on_disconnect(make_request(disconnected), scheduler.run(job)))
+        await asyncio.sleep(0.01)
+        assert scheduler.stats()["queued"] == 1
+
+        disconnected.set()
+        with pytest.raises(ClientDisconnected):
+            await queued
+        release.set()
+        await blocker
+
+    asyncio.run(run())
+    stats = scheduler.stats()
+    assert calls == []
+    assert stats["dropped"]["cancelled"] == 1
+    assert (stats["active"], stats["running"], stats["queued"]) == (0, 0, 0)
+
+
+def test_disconnect_cancels_a_running_job():
+    scheduler = DeadlineScheduler(max_concurrent=1)
+    cancelled = []
+
+    async def job():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.append(1)
+            raise
+
+    async def run():
+        disconnected = asyncio.Event()
+        running = asyncio.ensure_future(cancel_on_disconnect(make_request(disconnected), scheduler.run(job)))
+        await asyncio.sleep(0.01)
+        assert scheduler.stats()["running"] == 1
+
+        disconnected.set()
+        with pytest.raises(ClientDisconnected):
+            await running
+        # The freed slot is usable straight away
+        return await scheduler.run(lambda: asyncio.sleep(0, result="next"))
+
+    assert asyncio.run(run()) == "next"
+    stats = scheduler.stats()
+    assert cancelled == [1]
+    assert stats["dropped"]["cancelled"] == 1
+    assert (stats["active"], stats["running"], stats["queued"]) == (0, 0, 0)
@@ -0,0 +1,88 @@
+# tests/test_shape_buckets.py
+
+import pytest
+import torch
+
+from src.ml.shape_buckets import BucketedExecutor, ShapeBucketer, bucketed_batch_fn
+
+
+class SequenceClassifier(torch.nn.Module):
+    """Per-position projection followed by a softmax over the sequence."""
+    dynamic_dims = (1,)
+    reduction_dims = (1,)
+
+    def __init__(self, accepts_padding_mask: bool = False):
+        super().__init__()
+        self.accepts_padding_mask = accepts_padding_mask
+        self.proj = torch.nn.Linear(10, 1)
+
+    def forward(self, x, mask=None):
+        scores = self.proj(x).squeeze(-1)
+        if mask is not None:
+            scores = scores.masked_fill(~mask.all(-1), float("-inf"))
+        return torch.softmax(scores, dim=-1)
+
+
+class PerPosition(torch.nn.Module):
+    """Independent per-position model, safe to pad along the sequence."""
+    dynamic_dims = (1,)
+
+    def __init__(self):
+        super().__init__()
+        self.proj = torch.nn.Linear(10, 3)
+
+    def forward(self, x):
+        return self.proj(x)
+
+
+@pytest.fixture
+def bucketer():
+    return ShapeBucketer(batch_sizes=(1, 2, 4, 8), dim_sizes=(8, 16, 32))
+
+
+def run_both(model, x, bucketer):
+    executor = BucketedExecutor(model, torch.device("cpu"), bucketer, mode="eager")
+    with torch.inference_mode():
+        expected = model(x)
+    return executor, executor(x), expected
+
+
+def test_fixed_dims_are_not_padded(bucketer):
+    torch.manual_seed(0)
+    executor, output, expected = run_both(torch.nn.Linear(10, 3), torch.randn(3, 10), bucketer)
+    assert executor.trailing_bucket((10,)) == (10,)
+    assert output.shape == expected.shape
+    torch.testing.assert_close(output, expected)
+
+
+def test_dynamic_dim_is_padded(bucketer):
+    torch.manual_seed(0)
+    executor, output, expected = run_both(PerPosition(), torch.randn(3, 5, 10), bucketer)
+    assert executor.trailing_bucket((5, 10)) == (8, 10)
+    torch.testing.assert_close(output, expected)
+
+
+def test_reduction_dim_without_mask_stays_exact(bucketer):
+    torch.manual_seed(0)
+    executor, output, expected = run_both(SequenceClassifier(), torch.randn(3, 5, 10), bucketer)
+    assert executor.dynamic_dims == ()
+    torch.testing.assert_close(output, expected)
+
+
+def test_reduction_dim_with_mask_is_padded(bucketer):
+    torch.manual_seed(0)
+    executor, output, expected = run_both(SequenceClassifier(accepts_padding_mask=True),
+                                          torch.randn(3, 5, 10), bucketer)
+    assert executor.trailing_bucket((5, 10)) == (8, 10)
+    torch.testing.assert_close(output, expected)
+
+
+def test_batch_fn_matches_unbucketed(bucketer):
+    torch.manual_seed(0)
+    model = PerPosition()
+    executor = BucketedExecutor(model, torch.device("cpu"), bucketer, mode="eager")
+    inputs = [torch.randn(1, 5, 10), torch.randn(2, 7, 10), torch.randn(1, 12, 10)]
+    outputs = bucketed_batch_fn(executor)(inputs)
+    with torch.inference_mode():
+        for x, output in zip(inputs, outputs):
+            torch.testing.assert_close(output, model(x))
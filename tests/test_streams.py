@@ -0,0 +1,107 @@
+# tests/test_streams.py
+
+import asyncio
+import threading
+
+import pytest
+
+from src.core.gpu.streams import StreamExecutor
+
+
+def lane_stats(executor: StreamExecutor, index: int) -> dict:
+    return executor.stats()["streams"][index]
+
+
+def test_keys_stick_to_their_lane_and_spread_over_lanes():
+    executor = StreamExecutor("cpu", num_streams=2)
+
+    async def run():
+        first = [await executor.run(lambda lane: lane.index, key="a") for _ in range(3)]
+        second = await executor.run(lambda lane: lane.index, key="b")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first == [first[0]] * 3
+    assert second != first[0]
+    assert executor.lane_for("a").keys == ["a"]
+
+
+def test_keyless_jobs_take_the_least_busy_lane():
+    executor = StreamExecutor("cpu", num_streams=2)
+    release = threading.Event()
+
+    async def run():
+        blocked = asyncio.ensure_future(executor.run(lambda lane: release.wait(5) and lane.index))
+        await asyncio.sleep(0.05)
+        try:
+            free = await asyncio.wait_for(executor.run(lambda lane: lane.index), timeout=5)
+        finally:
+            release.set()
+        return await blocked, free
+
+    busy, free = asyncio.run(run())
+    assert busy != free
+
+
+def test_jobs_and_inflight_are_accounted():
+    executor = StreamExecutor("cpu", num_streams=1)
+
+    async def run():
+        return await asyncio.gather(*(executor.run(lambda lane, i=i: i) for i in range(5)))
+
+    assert asyncio.run(run()) == list(range(5))
+    stats = lane_stats(executor, 0)
+    assert stats["jobs"] == 5
+    assert stats["inflight"] == 0
+
+
+def test_failed_job_is_still_accounted():
+    executor = StreamExecutor("cpu", num_streams=1)
+
+    def fail(lane):
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(executor.run(fail))
+    assert lane_stats(executor, 0)["jobs"] == 1
+    assert lane_stats(executor, 0)["inflight"] == 0
+
+
+def test_job_cancelled_while_queued_never_runs():
+    executor = StreamExecutor("cpu", num_streams=1)
+    release = threading.Event()
+    ran = []
+
+    async def run():
+        blocker = asyncio.ensure_future(executor.run(lambda lane: release.wait(5)))
+        queued = asyncio.ensure_future(executor.run(lambda lane: ran.append(lane.index)))
+        await asyncio.sleep(0.05)
+        assert lane_stats(executor, 0)["inflight"] == 2
+
+        queued.cancel()
+        await asyncio.sleep(0.05)  # Let the cancellation reach the lane's queue
+        release.set()
+        await blocker
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+
+    asyncio.run(run())
+    executor.lanes[0].executor.shutdown(wait=True)
+    stats = lane_stats(executor, 0)
+    assert ran == []
+    assert stats["jobs"] == 1
+    assert stats["inflight"] == 0
+
+
+def test_wrap_runs_on_the_keys_lane():
+    executor = StreamExecutor("cpu", num_streams=2)
+    executor.lane_for("other")
+    lane = executor.lane_for("model")
+    wrapped = executor.wrap("model", lambda items, scale: [x * scale for x in items])
+
+    assert wrapped([1, 2], 3) == [3, 6]
+    assert wrapped([4], 2) == [8]
+    stats = lane_stats(executor, lane.index)
+    assert stats["jobs"] == 2
+    assert stats["inflight"] == 0
+    assert lane_stats(executor, 1 - lane.index)["jobs"] == 0
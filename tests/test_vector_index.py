@@ -0,0 +1,63 @@
+# tests/test_vector_index.py
+
+import numpy as np
+
+from src.ml import vector_index
+from src.ml.vector_index import VectorIndex
+
+
+def random_vectors(n: int, dim: int = 8, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).standard_normal((n, dim)).astype(np.float32)
+
+
+def test_workers_sharing_a_directory_see_each_others_writes(tmp_path):
+    a = VectorIndex(tmp_path, dim=8, initial_capacity=4)
+    b = VectorIndex(tmp_path, dim=8, initial_capacity=4)
+    vectors = random_vectors(10)
+
+    a.upsert([f"a{i}" for i in range(5)], vectors[:5], [{"n": i} for i in range(5)])
+    b.upsert([f"b{i}" for i in range(5)], vectors[5:])  # Must not reuse a's rows
+    a.delete(["a0"])
+
+    rows = [a.key_to_row[key] for key in a.key_to_row]
+    assert len(a) == 9 and len(set(rows)) == 9
+    assert a.search(vectors[7], k=1)[0][0][0] == "b2"
+    assert b.search(vectors[3], k=1)[0][0][:1] == ("a3",)
+    assert b.search(vectors[3], k=1)[0][0][2] == {"n": 3}
+    b.reload_if_changed()
+    assert "a0" not in b.key_to_row
+
+    reopened = VectorIndex(tmp_path, dim=8)
+    assert reopened.key_to_row == a.key_to_row
+    assert reopened.payloads == a.payloads
+
+
+def test_ivf_lists_follow_writes(tmp_path):
+    index = VectorIndex(tmp_path, dim=8, initial_capacity=16)
+    vectors = random_vectors(64)
+    index.upsert([str(i) for i in range(64)], vectors)
+    index.train_ivf(nlist=4)
+
+    index.upsert([str(i) for i in range(60, 70)], random_vectors(10, seed=1))
+    index.delete([str(i) for i in range(10)])
+    incremental = [lst.copy() for lst in index.lists]
+    index._rebuild_lists()
+    for got, expected in zip(incremental, index.lists):
+        np.testing.assert_array_equal(got, expected)
+
+    other = VectorIndex(tmp_path, dim=8)
+    for got, expected in zip(other.lists, index.lists):
+        np.testing.assert_array_equal(got, expected)
+    assert other.search(vectors[20], k=1, nprobe=4)[0][0][0] == "20"
+
+
+def test_key_log_is_compacted(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_index, "KEY_LOG_COMPACT_MIN", 4)
+    index = VectorIndex(tmp_path, dim=8)
+    for i in range(10):
+        index.upsert([str(i % 3)], random_vectors(1, seed=i))  # Rewrites of the same 3 keys
+
+    assert index._log_entries <= 4
+    assert (tmp_path / "keys.json").exists()
+    reopened = VectorIndex(tmp_path, dim=8)
+    assert reopened.key_to_row == index.key_to_row